@@ -0,0 +1,223 @@
+import gzip
+import io
+import os
+import struct
+import sys
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+GZIP_MAGIC = b'\x1f\x8b'
+# gzip header of a BGZF block: deflate, FEXTRA set, then a 'BC' extra subfield
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+BGZF_HEADER_SIZE = 18
+# Uncompressed bytes per block written by compress_bgzf, as bgzip does
+BGZF_BLOCK_DATA = 0xff00
+# Empty block that marks the end of a BGZF file
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+# Compressed bytes decompressed by one worker task
+DEFAULT_SPAN_BYTES = 4 * 1024 * 1024
+
+def is_gzip(path):
+    """True if the file starts with the gzip magic bytes, whatever its extension"""
+    with open(path, 'rb') as infile:
+        return infile.read(2) == GZIP_MAGIC
+
+def is_bgzf(path):
+    """True if the file is block gzip (BGZF), as written by bgzip"""
+    with open(path, 'rb') as infile:
+        header = infile.read(BGZF_HEADER_SIZE)
+    return len(header) == BGZF_HEADER_SIZE and header[:4] == BGZF_MAGIC and header[12:14] == b'BC'
+
+def block_spans(path):
+    """
+    Yield (offset, size) of every BGZF block in the file.
+    
+    Only the block headers are read: the BSIZE field of each header gives the
+    offset of the next block, so nothing is decompressed.
+    """
+    offset = 0
+    with open(path, 'rb') as infile:
+        while True:
+            header = infile.read(BGZF_HEADER_SIZE)
+            if not header:
+                return
+            if len(header) < BGZF_HEADER_SIZE or header[:4] != BGZF_MAGIC or header[12:14] != b'BC':
+                raise ValueError(f"'{path}' is not a BGZF file (bad block header at byte {offset})")
+            size = struct.unpack('<H', header[16:18])[0] + 1
+            yield offset, size
+            offset += size
+            infile.seek(offset)
+
+def group_spans(path, span_bytes=DEFAULT_SPAN_BYTES):
+    """Merge consecutive BGZF blocks into (offset, length) spans of about span_bytes"""
+    spans = []
+    start = end = 0
+    for offset, size in block_spans(path):
+        if end - start >= span_bytes:
+            spans.append((start, end - start))
+            start = offset
+        end = offset + size
+    if end > start:
+        spans.append((start, end - start))
+    return spans
+
+def block_table(path):
+    """
+    Return (coffsets, ustarts): the compressed offset and the uncompressed start
+    of every BGZF block, each with one extra entry for the end of the file.
+    
+    Block sizes come from the ISIZE field at the end of each block, so nothing
+    is decompressed.
+    """
+    coffsets = [0]
+    ustarts = [0]
+    with open(path, 'rb') as infile:
+        for offset, size in block_spans(path):
+            infile.seek(offset + size - 4)
+            coffsets.append(offset + size)
+            ustarts.append(ustarts[-1] + struct.unpack('<I', infile.read(4))[0])
+    return np.array(coffsets, dtype=np.int64), np.array(ustarts, dtype=np.int64)
+
+def block_range(coffsets, ustarts, start, end):
+    """
+    Locate uncompressed bytes [start, end) of a BGZF file.
+    
+    Returns (offset, length, skip): the run of whole blocks to read and
+    decompress, and where the wanted bytes begin in the decompressed run.
+    """
+    first = int(np.searchsorted(ustarts, start, side='right')) - 1
+    last = int(np.searchsorted(ustarts, end, side='left'))
+    return int(coffsets[first]), int(coffsets[last] - coffsets[first]), int(start - ustarts[first])
+
+def read_span(path, offset, length):
+    """Decompress the whole BGZF blocks stored in bytes [offset, offset + length)"""
+    with open(path, 'rb') as infile:
+        infile.seek(offset)
+        data = infile.read(length)
+    # Each block is a complete gzip member, so a run of blocks is valid gzip
+    return gzip.decompress(data)
+
+def default_processes():
+    return os.cpu_count() or 1
+
+def imap_ordered(function, arg_tuples, processes=None):
+    """
+    Yield function(*args) for each args tuple, in input order.
+    
+    With more than one process the calls run in a process pool, with at most
+    two tasks per process in flight so finished results never pile up in memory.
+    """
+    if processes is None:
+        processes = default_processes()
+    if processes <= 1:
+        for args in arg_tuples:
+            yield function(*args)
+        return
+    
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = deque()
+        for args in arg_tuples:
+            pending.append(executor.submit(function, *args))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def decompressed_chunks(path, processes=None, span_bytes=DEFAULT_SPAN_BYTES):
+    """Yield the decompressed contents of a BGZF file in order, decompressing spans in parallel"""
+    spans = group_spans(path, span_bytes)
+    yield from imap_ordered(read_span, [(path, offset, length) for offset, length in spans], processes)
+
+class ChunkReader(io.RawIOBase):
+    """Read-only binary stream over an iterator of bytes chunks"""
+    
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+        self.position = 0
+    
+    def readable(self):
+        return True
+    
+    def close(self):
+        # Stop the decompressing workers when the stream is abandoned early
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+        super().close()
+    
+    def readinto(self, target):
+        while self.position >= len(self.buffer):
+            self.buffer = next(self.chunks, None)
+            self.position = 0
+            if self.buffer is None:
+                self.buffer = b''
+                return 0
+        size = min(len(target), len(self.buffer) - self.position)
+        target[:size] = self.buffer[self.position:self.position + size]
+        self.position += size
+        return size
+
+def open_binary(path, processes=None):
+    """Open a plain, gzip or BGZF file as a stream of its uncompressed bytes"""
+    if is_bgzf(path):
+        return io.BufferedReader(ChunkReader(decompressed_chunks(path, processes)))
+    if is_gzip(path):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def open_text(path, encoding=None, processes=None):
+    """
+    Open a plain, gzip or BGZF file as text, with newline='' for csv.reader.
+    
+    BGZF files are decompressed in parallel worker processes; plain gzip
+    files can only be decompressed serially.
+    """
+    if is_bgzf(path):
+        return io.TextIOWrapper(open_binary(path, processes), encoding=encoding, newline='')
+    if is_gzip(path):
+        return gzip.open(path, 'rt', newline='', encoding=encoding)
+    return open(path, 'r', newline='', encoding=encoding)
+
+def bgzf_block(data, level=6):
+    """Compress up to BGZF_BLOCK_DATA bytes into one BGZF block"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    payload = compressor.compress(data) + compressor.flush()
+    header = BGZF_MAGIC + struct.pack('<IBBH2sHH', 0, 0, 0xff, 6, b'BC', 2,
+                                      BGZF_HEADER_SIZE + len(payload) + 8 - 1)
+    return header + payload + struct.pack('<II', zlib.crc32(data), len(data))
+
+def compress_bgzf(input_file, output_file=None, level=6):
+    """
+    Compress a plain or gzip file to BGZF, for machines without bgzip.
+    
+    Args:
+        input_file (str): File to compress
+        output_file (str): Output path (default: <input_file>.gz)
+        level (int): zlib compression level
+    """
+    if output_file is None:
+        output_file = f"{input_file}.gz"
+    opener = gzip.open if is_gzip(input_file) else open
+    with opener(input_file, 'rb') as infile, open(output_file, 'wb') as outfile:
+        while True:
+            data = infile.read(BGZF_BLOCK_DATA)
+            if not data:
+                break
+            outfile.write(bgzf_block(data, level))
+        outfile.write(BGZF_EOF)
+    print(f"Compressed {input_file} to {output_file}")
+    return output_file
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python bgzf.py <input_file> [output_file]")
+        print("Example: python bgzf.py met75trimfix.csv met75trimfix.csv.gz")
+        return
+    
+    compress_bgzf(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
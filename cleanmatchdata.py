@@ -1,5 +1,7 @@
-import csv
+import itertools
+import operator
 import os
+from tableio import read_rows, write_rows
 
 def remove_columns(input_file, columns_to_remove, output_file=None):
     """
@@ -17,58 +19,77 @@ def remove_columns(input_file, columns_to_remove, output_file=None):
         ext = os.path.splitext(input_file)[1]
         output_file = f"{base_name}_filtered{ext}"
     
-    # Convert to 0-based indexing and sort in descending order
-    # This ensures we remove columns from right to left to avoid index shifting
-    columns_to_remove_indexed = sorted([col - 1 for col in columns_to_remove], reverse=True)
-    
     try:
-        with open(input_file, 'r', newline='', encoding='utf-8') as infile:
-            reader = csv.reader(infile)
-            
-            # Read all rows
-            rows = list(reader)
-            
-            if not rows:
-                print("Warning: Input file is empty.")
-                return
-            
-            # Check if we have enough columns
-            max_cols = max(len(row) for row in rows)
-            invalid_columns = [col for col in columns_to_remove if col > max_cols]
-            
-            if invalid_columns:
-                print(f"Warning: The following column numbers don't exist in the CSV: {invalid_columns}")
-                print(f"CSV has {max_cols} columns maximum.")
-            
-            # Remove specified columns from each row
-            filtered_rows = []
-            for row in rows:
-                # Create a copy of the row to modify
-                filtered_row = row[:]
-                
-                # Remove columns (from right to left to avoid index issues)
-                for col_idx in columns_to_remove_indexed:
-                    if col_idx < len(filtered_row):
-                        filtered_row.pop(col_idx)
-                
-                filtered_rows.append(filtered_row)
-            
-            # Write the filtered data
-            with open(output_file, 'w', newline='', encoding='utf-8') as outfile:
-                writer = csv.writer(outfile)
-                writer.writerows(filtered_rows)
-            
-            print(f"Successfully removed columns {columns_to_remove} from CSV:")
-            print(f"  - Input file: {input_file}")
-            print(f"  - Output file: {output_file}")
-            print(f"  - Columns before: {max_cols}")
-            print(f"  - Columns after: {len(filtered_rows[0]) if filtered_rows else 0}")
-            
+        reader = read_rows(input_file, encoding='utf-8')
+        
+        # Look at the first row before creating the output file
+        first_row = next(reader, None)
+        
+        if first_row is None:
+            print("Warning: Input file is empty.")
+            return
+        
+        # Stream every row through the projection straight into the writer.
+        # row_widths collects each row length seen, so the maximum column
+        # count is known after the single pass.
+        row_widths = {}
+        write_rows(output_file,
+                   project_rows(itertools.chain([first_row], reader), columns_to_remove, row_widths),
+                   encoding='utf-8')
+        
+        # Check if we had enough columns
+        max_cols = max(row_widths)
+        invalid_columns = [col for col in columns_to_remove if col > max_cols]
+        
+        if invalid_columns:
+            print(f"Warning: The following column numbers don't exist in the CSV: {invalid_columns}")
+            print(f"CSV has {max_cols} columns maximum.")
+        
+        print(f"Successfully removed columns {columns_to_remove} from CSV:")
+        print(f"  - Input file: {input_file}")
+        print(f"  - Output file: {output_file}")
+        print(f"  - Columns before: {max_cols}")
+        print(f"  - Columns after: {len(row_widths[len(first_row)])}")
+        
     except FileNotFoundError:
         print(f"Error: File '{input_file}' not found.")
     except Exception as e:
         print(f"Error processing file: {e}")
 
+def make_projection(keep):
+    """Return a function that picks the `keep` indices from a row as a tuple"""
+    if len(keep) > 1:
+        return operator.itemgetter(*keep)
+    if len(keep) == 1:
+        index = keep[0]
+        return lambda row: (row[index],)
+    return lambda row: ()
+
+def project_rows(rows, columns_to_remove, row_widths=None):
+    """
+    Yield each row without the given columns (1-based indexing).
+    
+    The indices to keep are computed once per row length, so rows are built
+    by a single projection instead of repeated pops.
+    
+    Args:
+        rows: Iterable of CSV rows
+        columns_to_remove (list): List of column numbers to remove (1-based indexing)
+        row_widths (dict): Optional dict that receives row length -> kept
+            indices for every row length seen
+    """
+    drop = {col - 1 for col in columns_to_remove}
+    if row_widths is None:
+        row_widths = {}
+    projections = {}
+    for row in rows:
+        project = projections.get(len(row))
+        if project is None:
+            keep = [i for i in range(len(row)) if i not in drop]
+            row_widths[len(row)] = keep
+            project = projections[len(row)] = make_projection(keep)
+        yield project(row)
+
 # Example usage
 if __name__ == "__main__":
     # Replace 'input.csv' with your actual file path
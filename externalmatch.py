@@ -0,0 +1,464 @@
+import argparse
+import os
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from metstatusv8 import (infer_categories, match_group_strings, met_value_dtype, new_result_buffers,
+                         peak_rss_mb, prepare_gRNA_df, whole_positions, write_result_chunks)
+from tableio import csv_column_dtypes, read_table, read_table_chunks, table_format, widen_dtype
+
+DEFAULT_MAX_MEMORY_MB = 1024
+# Approximate bytes held per met75 row while a chunk is parsed and sorted
+MET_ROW_BYTES = 200
+# Bytes per buffered row of the arrays that take part in a k-way merge
+MERGE_ROW_BYTES = 48
+# Fewest rows worth handling at once, whatever the budget
+MIN_ROWS = 1000
+# gRNA strands are stored as 0 (none), 1 ('+') or 2 ('-')
+STRAND_VALUES = np.array([None, '+', '-'], dtype=object)
+
+class RunArray:
+    """A 1-d .npy array on disk that is read slice by slice, never as a whole"""
+    
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as infile:
+            version = np.lib.format.read_magic(infile)
+            if version == (1, 0):
+                shape, _, self.dtype = np.lib.format.read_array_header_1_0(infile)
+            else:
+                shape, _, self.dtype = np.lib.format.read_array_header_2_0(infile)
+            self.offset = infile.tell()
+        self.length = shape[0]
+    
+    def __len__(self):
+        return self.length
+    
+    def read(self, start, stop):
+        with open(self.path, 'rb') as infile:
+            infile.seek(self.offset + start * self.dtype.itemsize)
+            return np.fromfile(infile, dtype=self.dtype, count=stop - start)
+
+def save_run(work_dir, name, groups, arrays):
+    """
+    Write one sorted run as <name>_<field>.npy files.
+    
+    groups holds the (sorted) group of every row. Only the table of where each
+    group starts and stops is kept in memory; the row arrays are returned as
+    RunArrays.
+    """
+    group_ids, starts = np.unique(groups, return_index=True)
+    run = {'group_ids': group_ids, 'starts': starts, 'stops': np.append(starts[1:], len(groups)),
+           'arrays': {}}
+    for field, values in arrays.items():
+        path = os.path.join(work_dir, f"{name}_{field}.npy")
+        np.save(path, values)
+        run['arrays'][field] = RunArray(path)
+    return run
+
+def group_segment(run, group):
+    """(arrays, start, stop) of one group inside a run, or None if the run has no rows of it"""
+    found = np.flatnonzero(run['group_ids'] == group)
+    if not len(found):
+        return None
+    return run['arrays'], int(run['starts'][found[0]]), int(run['stops'][found[0]])
+
+def merge_runs(segments, key, batch_rows):
+    """
+    K-way merge of run segments that are each sorted by key.
+    
+    Yields dicts of arrays sorted by key. Equal keys keep the order of the
+    segments and then their order inside a segment, so merging the runs of
+    consecutive chunks of a file gives a stable sort of the whole file. At
+    most about batch_rows rows of every segment are held at a time.
+    """
+    sources = [{'arrays': arrays, 'next': start, 'stop': stop, 'buffer': None}
+               for arrays, start, stop in segments if stop > start]
+    while sources:
+        for source in sources:
+            held = 0 if source['buffer'] is None else len(source['buffer'][key])
+            count = min(batch_rows - held, source['stop'] - source['next'])
+            if count > 0:
+                fresh = {field: array.read(source['next'], source['next'] + count)
+                         for field, array in source['arrays'].items()}
+                if source['buffer'] is not None:
+                    fresh = {field: np.concatenate((source['buffer'][field], fresh[field])) for field in fresh}
+                source['buffer'] = fresh
+                source['next'] += count
+        
+        # A row may go out once no unread row can sort before it: rows of a
+        # later segment must stay below an earlier segment's last buffered key
+        limits = [source['buffer'][key][-1] if source['next'] < source['stop'] else np.inf
+                  for source in sources]
+        pieces = []
+        for i, source in enumerate(sources):
+            keys = source['buffer'][key]
+            take = np.searchsorted(keys, min(limits[i:]), side='right')
+            if i:
+                take = min(take, np.searchsorted(keys, min(limits[:i]), side='left'))
+            if take:
+                pieces.append({field: values[:take] for field, values in source['buffer'].items()})
+                source['buffer'] = {field: values[take:] for field, values in source['buffer'].items()}
+        sources = [source for source in sources
+                   if len(source['buffer'][key]) or source['next'] < source['stop']]
+        
+        merged = {field: np.concatenate([piece[field] for piece in pieces]) for field in pieces[0]}
+        order = np.argsort(merged[key], kind='stable')
+        yield {field: values[order] for field, values in merged.items()}
+
+def sort_by_group(groups, keys):
+    """Stable order of rows by group and then by key"""
+    order = np.argsort(keys, kind='stable')
+    return order[np.argsort(groups[order], kind='stable')]
+
+def spill_met_runs(met75_file, work_dir, chunk_rows, value_dtype=None):
+    """
+    Read the met75 file in chunks and write each chunk sorted by (match_val, position).
+    
+    Returns (names, runs): the match_val texts in order of first appearance,
+    whose index is the group number used in the runs, and the runs. With
+    value_dtype None, values keep the type read_csv gives the whole file
+    (text is stored as fixed-width strings); otherwise they are stored as
+    value_dtype numbers and cells that do not parse as one become NaN.
+    """
+    read_dtypes = {3: 'category'}
+    if value_dtype is None:
+        read_dtypes[2] = met_value_dtype(met75_file, chunk_rows)
+    group_of_name = {}
+    runs = []
+    rows_read = 0
+    non_numeric = 0
+    for chunk in read_table_chunks(met75_file, chunk_rows, usecols=[0, 2, 3], dtype=read_dtypes):
+        positions = pd.to_numeric(chunk.iloc[:, 0], errors='coerce').to_numpy(dtype=np.float64)
+        if value_dtype is None:
+            values = chunk.iloc[:, 1].to_numpy()
+            if values.dtype.kind == 'O':
+                values = values.astype(str)
+        else:
+            values = pd.to_numeric(chunk.iloc[:, 1], errors='coerce').to_numpy(dtype=value_dtype)
+            non_numeric += int((np.isnan(values) & chunk.iloc[:, 1].notna().to_numpy()).sum())
+        match_vals = chunk.iloc[:, 2].astype('category')
+        names = [str(name) for name in match_vals.cat.categories]
+        group_numbers = np.array([group_of_name.setdefault(name, len(group_of_name)) for name in names],
+                                 dtype=np.int32)
+        codes = match_vals.cat.codes.to_numpy()
+        
+        # File order of every row, for ordering repeated positions like the other engines
+        file_rows = np.arange(rows_read, rows_read + len(chunk), dtype=np.int64)
+        rows_read += len(chunk)
+        
+        keep = ~np.isnan(positions) & (codes >= 0)
+        if keep.any():
+            groups = group_numbers[codes[keep]]
+            positions = whole_positions(positions[keep])
+            order = sort_by_group(groups, positions)
+            runs.append(save_run(work_dir, f"met_{len(runs):05d}", groups[order], {
+                'position': positions[order],
+                'value': values[keep][order],
+                'row': file_rows[keep][order]
+            }))
+        print(f"Sorted {rows_read} met75 rows into {len(runs)} runs...")
+    
+    if non_numeric:
+        print(f"Warning: {non_numeric} non-numeric methylation values were read as NaN")
+    return list(group_of_name), runs
+
+def spill_gRNA_runs(gRNA_file, work_dir, chunk_rows, dtypes):
+    """
+    Read the gRNA file in chunks and write its valid ranges sorted by
+    (match_val, range_start).
+    
+    Returns (keys, runs, range_dtypes, total_rows): keys maps each match_val to
+    the group number used in the runs, and range_dtypes holds the dtypes that
+    range_start and range_end get when the whole file is read at once.
+    """
+    keys = {}
+    runs = []
+    range_dtypes = {'range_start': None, 'range_end': None}
+    rows_read = 0
+    for chunk in read_table_chunks(gRNA_file, chunk_rows, dtype=dtypes):
+        valid_mask = prepare_gRNA_df(chunk)
+        for col in range_dtypes:
+            range_dtypes[col] = widen_dtype(range_dtypes[col], chunk[col].dtype)
+        
+        rows = np.flatnonzero(valid_mask)
+        match_vals = chunk['match_val'].iloc[rows]
+        key_numbers = np.array([keys.setdefault(match_val, len(keys)) for match_val in match_vals.cat.categories],
+                               dtype=np.int32)
+        groups = key_numbers[match_vals.cat.codes.to_numpy()]
+        starts = chunk['range_start'].to_numpy(dtype=np.float64)[rows]
+        strands = chunk['strand'].to_numpy()[rows]
+        
+        if len(rows):
+            order = sort_by_group(groups, starts)
+            runs.append(save_run(work_dir, f"gRNA_{len(runs):05d}", groups[order], {
+                'start': starts[order],
+                'end': chunk['range_end'].to_numpy(dtype=np.float64)[rows][order],
+                'strand': np.where(strands == '+', 1, np.where(strands == '-', 2, 0)).astype(np.int8)[order],
+                'row': (rows + rows_read)[order]
+            }))
+        rows_read += len(chunk)
+        print(f"Sorted {rows_read} gRNA rows into {len(runs)} runs...")
+    
+    return keys, runs, range_dtypes, rows_read
+
+def window_entry(window):
+    """Lookup entry for a window of merged met75 rows, which are already in position order"""
+    positions = window['position']
+    ties = positions[1:] == positions[:-1]
+    entry = {'positions': positions, 'values': window['value'], 'file_order': None, 'tie_counts': None}
+    if ties.any():
+        # Original row numbers order repeated positions just like file order does
+        entry['file_order'] = window['row']
+        entry['tie_counts'] = np.concatenate(([0], np.cumsum(ties)))
+    return entry
+
+def sweep_join(met_batches, gRNA_batches):
+    """
+    Streaming range join of one group.
+    
+    Both inputs arrive in sorted batches: met75 rows by position and gRNA
+    ranges by range_start. A window of met75 rows is kept from the smallest
+    start of the current gRNA batch up to its largest end, and each batch is
+    resolved with join_group_ranges against that window. Yields
+    (gRNA rows, pos_strings, val_strings) for the ranges with hits.
+    """
+    window = None
+    exhausted = False
+    for ranges in gRNA_batches:
+        lowest, highest = ranges['start'][0], ranges['end'].max()
+        if window is not None:
+            keep_from = np.searchsorted(window['position'], lowest, side='left')
+            window = {field: values[keep_from:] for field, values in window.items()}
+        while not exhausted and (window is None or not len(window['position'])
+                                 or window['position'][-1] <= highest):
+            batch = next(met_batches, None)
+            if batch is None:
+                exhausted = True
+            elif window is None:
+                window = batch
+            else:
+                window = {field: np.concatenate((window[field], batch[field])) for field in window}
+        if window is None or not len(window['position']):
+            continue
+        
+        matched, pos_strings, val_strings = match_group_strings(
+            window_entry(window), ranges['start'], ranges['end'], STRAND_VALUES[ranges['strand']])
+        if len(matched):
+            yield ranges['row'][matched], pos_strings, val_strings
+
+def save_result_run(work_dir, name, rows, pos_strings, val_strings):
+    """Write matched rows sorted by gRNA row, with their strings as one byte blob plus offsets"""
+    order = np.argsort(rows, kind='stable')
+    arrays = {}
+    for field, strings in (('positions', pos_strings), ('values', val_strings)):
+        encoded = [strings[i].encode() for i in order]
+        arrays[f'{field}_offsets'] = np.concatenate(([0], np.cumsum([len(text) for text in encoded]))).astype(np.int64)
+        arrays[f'{field}_text'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    arrays['row'] = rows[order]
+    
+    run = {}
+    for field, values in arrays.items():
+        path = os.path.join(work_dir, f"{name}_{field}.npy")
+        np.save(path, values)
+        run[field] = RunArray(path)
+    return run
+
+def join_runs(met_names, met_runs, gRNA_keys, gRNA_runs, work_dir, batch_budget, result_budget):
+    """
+    Merge and join the runs group by group, spilling the results in runs
+    sorted by gRNA row.
+    """
+    # A gRNA match_val hits a met75 group when it equals the group's key as a
+    # whole-file read_csv would type it
+    met_keys = infer_categories(pd.Index(met_names))
+    group_of_key = {key: number for number, key in enumerate(met_keys)}
+    gRNA_groups = defaultdict(list)
+    for match_val, number in gRNA_keys.items():
+        if match_val in group_of_key:
+            gRNA_groups[group_of_key[match_val]].append(number)
+    
+    result_runs = []
+    pending = []
+    pending_bytes = 0
+    
+    def spill():
+        rows = np.concatenate([rows for rows, _, _ in pending])
+        pos_strings = [text for _, texts, _ in pending for text in texts]
+        val_strings = [text for _, _, texts in pending for text in texts]
+        result_runs.append(save_result_run(work_dir, f"result_{len(result_runs):05d}", rows,
+                                           pos_strings, val_strings))
+        pending.clear()
+    
+    for group, key_numbers in gRNA_groups.items():
+        met_segments = [segment for segment in (group_segment(run, group) for run in met_runs) if segment]
+        gRNA_segments = [segment for segment in (group_segment(run, number)
+                                                 for run in gRNA_runs for number in key_numbers) if segment]
+        if not met_segments or not gRNA_segments:
+            continue
+        
+        batch_rows = max(MIN_ROWS, batch_budget // (MERGE_ROW_BYTES * (len(met_segments) + len(gRNA_segments))))
+        matched_rows = 0
+        for rows, pos_strings, val_strings in sweep_join(merge_runs(met_segments, 'position', batch_rows),
+                                                         merge_runs(gRNA_segments, 'start', batch_rows)):
+            pending.append((rows, pos_strings, val_strings))
+            pending_bytes += sum(map(len, pos_strings)) + sum(map(len, val_strings)) + 100 * len(rows)
+            matched_rows += len(rows)
+            if pending_bytes > result_budget:
+                spill()
+                pending_bytes = 0
+        print(f"Matched {matched_rows} ranges for {met_keys[group]}")
+    
+    if pending:
+        spill()
+    return result_runs
+
+class ResultCursor:
+    """Walks a result run in gRNA row order, one output chunk after another"""
+    
+    def __init__(self, run):
+        self.run = run
+        self.next = 0
+    
+    def take(self, stop_row):
+        """Return the (start, stop) indices of the run's rows below stop_row not taken yet"""
+        rows = self.run['row']
+        start = stop = self.next
+        while stop < len(rows):
+            block = rows.read(stop, min(stop + MIN_ROWS, len(rows)))
+            below = int(np.searchsorted(block, stop_row, side='left'))
+            stop += below
+            if below < len(block):
+                break
+        self.next = stop
+        return start, stop
+
+def fill_results(cursors, first_row, gRNA_chunk):
+    """Attach the results of gRNA rows [first_row, first_row + len(gRNA_chunk)) from the result runs"""
+    matched_positions, matched_values, has_matches = new_result_buffers(len(gRNA_chunk))
+    for cursor in cursors:
+        start, stop = cursor.take(first_row + len(gRNA_chunk))
+        if start == stop:
+            continue
+        run = cursor.run
+        local = run['row'].read(start, stop) - first_row
+        for field, buffer in (('positions', matched_positions), ('values', matched_values)):
+            offsets = run[f'{field}_offsets'].read(start, stop + 1)
+            text = run[f'{field}_text'].read(int(offsets[0]), int(offsets[-1])).tobytes()
+            offsets = (offsets - offsets[0]).tolist()
+            buffer[local] = [text[a:b].decode() for a, b in zip(offsets[:-1], offsets[1:])]
+        has_matches[local] = True
+    
+    gRNA_chunk['matched_positions'] = matched_positions
+    gRNA_chunk['matched_third_col_values'] = matched_values
+    gRNA_chunk['has_matches'] = has_matches
+    return gRNA_chunk
+
+def gRNA_row_bytes(gRNA_file, sample_rows=1000):
+    """Rough memory per gRNA row while a chunk is parsed, prepared and written"""
+    sample = read_table(gRNA_file, nrows=sample_rows)
+    if not len(sample):
+        return 1000
+    # The working columns, result strings and CSV text add a few times the parsed size
+    return 4 * int(sample.memory_usage(deep=True).sum() / len(sample)) + 200
+
+def output_chunks(gRNA_file, chunk_rows, dtypes, range_dtypes, result_runs):
+    """Yield the result frame in gRNA file order, one chunk at a time"""
+    cursors = [ResultCursor(run) for run in result_runs]
+    first_row = 0
+    for chunk in read_table_chunks(gRNA_file, chunk_rows, dtype=dtypes):
+        prepare_gRNA_df(chunk)
+        for col, dtype in range_dtypes.items():
+            if dtype is not None:
+                chunk[col] = chunk[col].astype(dtype)
+        yield fill_results(cursors, first_row, chunk)
+        first_row += len(chunk)
+
+def match_csvs_external(met75_file, gRNA_file, output_file, max_memory_mb=DEFAULT_MAX_MEMORY_MB,
+                        temp_dir=None, value_dtype=None):
+    """
+    Out-of-core sort-merge join for inputs that do not fit in memory.
+    
+    1. The met75 and gRNA files are read in chunks sized to the memory budget
+       and every chunk is spilled as a run sorted by (match_val, position)
+       or (match_val, range_start).
+    2. Per match_val, the runs are k-way merged in bounded batches.
+    3. The merged streams are joined by a sweep that keeps only a window of
+       met75 rows around the current gRNA ranges; matched rows are spilled as
+       runs sorted by gRNA row.
+    4. A final pass reads the gRNA file again in order and writes each chunk
+       with its results taken from the result runs.
+    
+    With the default value_dtype the values keep the type read_csv gives the
+    whole met75 file, found in an extra pass, and the output is identical to
+    match_csvs_sorted. Memory stays near
+    max_memory_mb on top of the interpreter and libraries, unless single gRNA
+    ranges cover more met75 rows than fit in it. Temporary files take about as
+    much space as the inputs and are removed at the end.
+    
+    Args:
+        met75_file (str): Path to the met75 CSV file
+        gRNA_file (str): Path to the gRNA ranges CSV file
+        output_file (str): Path for the output CSV file
+        max_memory_mb (float): Working memory budget in MB
+        temp_dir (str): Directory for the spilled runs (default: system temp dir)
+        value_dtype: dtype for methylation values, or None to keep them as a
+            whole-file read parses them; with a numeric dtype, values that are
+            not numbers are written as NaN
+    """
+    if table_format(output_file) != 'csv':
+        raise ValueError("The out-of-core engine writes CSV output only")
+    
+    budget = int(max_memory_mb * 1024 * 1024)
+    met_chunk_rows = max(MIN_ROWS, budget // MET_ROW_BYTES)
+    gRNA_chunk_rows = max(MIN_ROWS, budget // gRNA_row_bytes(gRNA_file))
+    print(f"Using out-of-core approach with a {max_memory_mb} MB budget...")
+    
+    with tempfile.TemporaryDirectory(prefix='metmatch-', dir=temp_dir) as work_dir:
+        print("Spilling sorted met75 runs...")
+        met_names, met_runs = spill_met_runs(met75_file, work_dir, met_chunk_rows, value_dtype)
+        
+        print("Spilling sorted gRNA runs...")
+        # Every chunk must parse, and print, like the whole file would
+        dtypes = csv_column_dtypes(gRNA_file, gRNA_chunk_rows) if table_format(gRNA_file) == 'csv' else None
+        gRNA_keys, gRNA_runs, range_dtypes, total_rows = spill_gRNA_runs(gRNA_file, work_dir, gRNA_chunk_rows, dtypes)
+        print(f"Peak memory after spilling runs: {peak_rss_mb():.1f} MB")
+        
+        print("Merging and joining runs...")
+        result_runs = join_runs(met_names, met_runs, gRNA_keys, gRNA_runs, work_dir,
+                                budget // 2, budget // 4)
+        print(f"Peak memory after joining: {peak_rss_mb():.1f} MB")
+        
+        print("Restoring gRNA order and saving results...")
+        matches_found = 0
+        def counted(chunks):
+            nonlocal matches_found
+            for chunk in chunks:
+                matches_found += int(chunk['has_matches'].sum())
+                yield chunk
+        write_result_chunks(counted(output_chunks(gRNA_file, gRNA_chunk_rows, dtypes, range_dtypes, result_runs)),
+                            output_file)
+    
+    print(f"Peak memory: {peak_rss_mb():.1f} MB")
+    print(f"Results saved to {output_file}")
+    print(f"Total matches found: {matches_found} of {total_rows} gRNA rows")
+    return matches_found
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Match gRNA ranges against a met75 file larger than memory")
+    parser.add_argument('met_file', help="met75 CSV file")
+    parser.add_argument('gRNA_file', help="gRNA ranges CSV file")
+    parser.add_argument('output_file', help="Output CSV file")
+    parser.add_argument('--max-memory', type=float, default=DEFAULT_MAX_MEMORY_MB,
+                        help=f"Working memory budget in MB (default: {DEFAULT_MAX_MEMORY_MB})")
+    parser.add_argument('--temp-dir', help="Directory for temporary sorted runs (default: system temp dir)")
+    args = parser.parse_args()
+    
+    match_csvs_external(args.met_file, args.gRNA_file, args.output_file, args.max_memory, args.temp_dir)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
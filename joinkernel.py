@@ -0,0 +1,113 @@
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    njit = None
+    HAVE_NUMBA = False
+
+# Values accepted by the engine= parameter of the sorted matchers
+ENGINES = ('auto', 'numba', 'numpy')
+
+def resolve_engine(engine):
+    """Turn an engine= argument into 'numba' or 'numpy'; 'auto' picks numba when it is installed"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Choose 'auto', 'numba' or 'numpy'")
+    if engine == 'auto':
+        return 'numba' if HAVE_NUMBA else 'numpy'
+    if engine == 'numba' and not HAVE_NUMBA:
+        raise ImportError("engine='numba' needs numba. Install numba or use engine='numpy' instead.")
+    return engine
+
+def compiled(function):
+    """Compile a kernel with Numba when it is installed; otherwise keep the plain Python function"""
+    if HAVE_NUMBA:
+        return njit(cache=True, nogil=True)(function)
+    return function
+
+@compiled
+def _range_bounds(positions, range_starts, range_ends, lo, hi, counts):
+    """Fill the [lo, hi) slice of sorted positions covered by each range, and its hit count"""
+    n_positions = len(positions)
+    for j in range(len(range_starts)):
+        # Leftmost position >= start
+        left, right = 0, n_positions
+        while left < right:
+            middle = (left + right) // 2
+            if positions[middle] < range_starts[j]:
+                left = middle + 1
+            else:
+                right = middle
+        lo[j] = left
+        # Leftmost position > end, searching from lo
+        right = n_positions
+        while left < right:
+            middle = (left + right) // 2
+            if positions[middle] <= range_ends[j]:
+                left = middle + 1
+            else:
+                right = middle
+        hi[j] = left
+        counts[j] = hi[j] - lo[j]
+
+@compiled
+def _fill_hits(positions, tie_counts, range_starts, strand_codes, lo, hi, seg_starts, hit_index, final_positions,
+               has_tie):
+    """
+    Write every range's hits into the preallocated flat arrays, strand-adjusted
+    and in output order, and flag ranges that cover repeated positions.
+    """
+    check_ties = len(tie_counts) > 0
+    for j in range(len(range_starts)):
+        count = hi[j] - lo[j]
+        start = seg_starts[j]
+        code = strand_codes[j]
+        for k in range(count):
+            # '-' strand hits come out in descending position order
+            i = hi[j] - 1 - k if code < 0 else lo[j] + k
+            hit_index[start + k] = i
+            adjusted = positions[i] - range_starts[j]
+            if code > 0:
+                final_positions[start + k] = adjusted + 2
+            elif code < 0:
+                final_positions[start + k] = 28 - adjusted
+            else:
+                final_positions[start + k] = adjusted
+        has_tie[j] = check_ties and count > 1 and tie_counts[hi[j] - 1] - tie_counts[lo[j]] > 0
+
+def strand_codes(strands):
+    """1 for '+', -1 for '-' and 0 for any other strand"""
+    return np.where(strands == '+', 1, np.where(strands == '-', -1, 0)).astype(np.int8)
+
+def join_ranges(positions, tie_counts, range_starts, range_ends, strands):
+    """
+    Join a batch of ranges against one sorted group with the compiled kernels.
+    
+    Returns (lo, hi, counts, hit_index, final_positions, has_tie): each
+    range's slice of the group, the group index and strand-adjusted position of
+    every hit, range after range in output order, and which ranges cover
+    repeated positions. Those are walked in position order like the rest, so
+    callers that need the per-row engines' tie order must redo them.
+    """
+    # Memory-mapped arrays are passed as plain ndarrays
+    positions = np.asarray(positions)
+    tie_counts = np.zeros(0, dtype=np.int32) if tie_counts is None else np.asarray(tie_counts)
+    range_starts = np.asarray(range_starts)
+    range_ends = np.asarray(range_ends)
+    
+    n_ranges = len(range_starts)
+    lo = np.empty(n_ranges, dtype=np.int64)
+    hi = np.empty(n_ranges, dtype=np.int64)
+    counts = np.empty(n_ranges, dtype=np.int64)
+    _range_bounds(positions, range_starts, range_ends, lo, hi, counts)
+    
+    seg_starts = np.cumsum(counts) - counts
+    total = int(counts.sum())
+    hit_index = np.empty(total, dtype=np.int64)
+    # Same dtype as the NumPy path's positions[idx] - range_starts
+    final_positions = np.empty(total, dtype=np.result_type(positions.dtype, range_starts.dtype))
+    has_tie = np.zeros(n_ranges, dtype=np.bool_)
+    _fill_hits(positions, tie_counts, range_starts, strand_codes(strands), lo, hi, seg_starts, hit_index,
+               final_positions, has_tie)
+    return lo, hi, counts, hit_index, final_positions, has_tie
\ No newline at end of file
@@ -0,0 +1,503 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from joinkernel import HAVE_NUMBA
+
+# Rows generated and written per block, so generation memory stays bounded
+WRITE_BLOCK = 1000000
+
+# gRNA rows per slice for the overlapped engine
+OVERLAP_ROWS = 1000
+
+# Memory budget for the out-of-core engine, small enough that the default
+# dataset is spilled as several sorted runs
+EXTERNAL_MEMORY_MB = 4
+
+# Matching engines whose wide output must be byte-identical
+WIDE_ENGINES = ['sorted', 'sorted_numpy', 'sorted_numba', 'sorted_chunked', 'indexed', 'parallel', 'cached',
+                'multisample', 'overlapped', 'external', 'ultra_fast', 'optimized']
+
+# Per-row engines the newer ones replaced; every differential check includes one
+LEGACY_ENGINES = ['ultra_fast', 'optimized']
+
+# Engines that need the met75 file sorted by match_val and position and read a
+# sorted copy of it. Sorting changes the order repeated positions come out in,
+# so they are compared with ultra_fast run on the same copy instead
+SORTED_ENGINES = ['regions', 'ultra_fast_sorted']
+SORTED_REFERENCE = 'ultra_fast_sorted'
+
+# Methylation value types of the met75 file. The timed stages use 'float'; the
+# matching engines are also run on each other variant and compared again, as
+# integer and text values must print exactly as a whole-file read parses them
+VALUE_VARIANTS = ['float', 'integer', 'text']
+DEFAULT_VALUE_VARIANTS = ['integer', 'text']
+
+# Every stage the runner knows about, in the order they are run
+ALL_STAGES = ['index_build'] + WIDE_ENGINES + SORTED_ENGINES + ['long', 'summary', 'outputrangev3', 'metpositions']
+
+DEFAULT_STAGES = ['index_build', 'sorted', 'sorted_numpy', 'sorted_chunked', 'indexed', 'parallel', 'cached',
+                  'multisample', 'overlapped', 'external', 'ultra_fast', 'optimized', 'regions',
+                  'ultra_fast_sorted', 'long', 'summary', 'outputrangev3', 'metpositions']
+# The compiled join kernel is only compared when numba is installed
+if HAVE_NUMBA:
+    DEFAULT_STAGES.insert(DEFAULT_STAGES.index('sorted_numpy') + 1, 'sorted_numba')
+
+# Stages that are run again on the met75 files of the other value variants
+VARIANT_STAGES = ['index_build'] + WIDE_ENGINES + SORTED_ENGINES
+
+def group_names(n_groups):
+    """match_val names for synthetic chromosomes"""
+    return np.array([f"chr{i + 1}" for i in range(n_groups)])
+
+def write_blocks(path, n_rows, make_block, header=True):
+    """Write a CSV in blocks of WRITE_BLOCK rows produced by make_block(start, size)"""
+    with open(path, 'w', newline='') as outfile:
+        for start in range(0, n_rows, WRITE_BLOCK):
+            block = make_block(start, min(WRITE_BLOCK, n_rows - start))
+            block.to_csv(outfile, index=False, header=header and start == 0)
+
+def generate_met_file(path, n_rows, n_groups=24, span=None, seed=0, values='float'):
+    """
+    Write a synthetic met75-style file: pos, coverage, value, match_val.
+    
+    Positions are spread over `span` bases per group (default: dense enough
+    that every gRNA range sees a few sites) and about 0.1% of positions
+    repeat. Values are methylation fractions with three decimals, whole
+    percentages with values='integer', or with values='text' fractions written
+    with their trailing zeros and about 0.1% '.' cells for missing calls.
+    """
+    rng = np.random.default_rng(seed)
+    names = group_names(n_groups)
+    if span is None:
+        span = max(1000, n_rows // n_groups * 10)
+    
+    def make_block(start, size):
+        positions = rng.integers(0, span, size)
+        repeats = rng.random(size) < 0.001
+        positions[repeats] = positions[0]
+        block = pd.DataFrame({
+            'pos': positions,
+            'coverage': rng.integers(1, 200, size),
+            'value': np.round(rng.random(size), 3),
+            'match_val': names[rng.integers(0, n_groups, size)]
+        })
+        if values == 'integer':
+            block['value'] = np.round(block['value'] * 100).astype(np.int64)
+        elif values == 'text':
+            text = np.char.mod('%.3f', block['value'].to_numpy()).astype(object)
+            text[rng.random(size) < 0.001] = '.'
+            block['value'] = text
+        return block
+    
+    write_blocks(path, n_rows, make_block)
+    return span
+
+def generate_gRNA_file(path, n_rows, span, n_groups=24, max_width=40, seed=1):
+    """
+    Write a synthetic gRNAranges-style file. Columns 5 and 6 hold the range,
+    column 8 the match_val and the Strand column '+', '-' or '.'.
+    A group that is not in the met file is included so unmatched rows occur.
+    """
+    rng = np.random.default_rng(seed)
+    names = group_names(n_groups + 1)
+    
+    def make_block(start, size):
+        range_starts = rng.integers(0, span, size)
+        return pd.DataFrame({
+            'gRNA_id': np.arange(start, start + size),
+            'sequence': 'ACGTACGTACGTACGTACGT',
+            'name': [f"g{i}" for i in range(start, start + size)],
+            'score': rng.integers(0, 100, size),
+            'start': range_starts,
+            'end': range_starts + rng.integers(0, max_width, size),
+            'gc': np.round(rng.random(size), 2),
+            'match_val': names[rng.integers(0, n_groups + 1, size)],
+            'Strand': np.array(['+', '-', '.'])[rng.integers(0, 3, size)]
+        })
+    
+    write_blocks(path, n_rows, make_block)
+
+def generate_sites_file(path, n_rows, seed=2):
+    """
+    Write a synthetic output100/metbases-style file (no header): sites in
+    columns 2 and 3, mostly equal, and a strand character in column 6.
+    """
+    rng = np.random.default_rng(seed)
+    span = n_rows * 2
+    
+    def make_block(start, size):
+        col2 = rng.integers(0, span, size)
+        col3 = np.where(rng.random(size) < 0.7, col2, rng.integers(0, span, size))
+        return pd.DataFrame({
+            'id': np.arange(start, start + size),
+            'col2': col2,
+            'col3': col3,
+            'col4': 'x',
+            'col5': 'y',
+            'col6': np.array(['+', '-'])[rng.integers(0, 2, size)]
+        })
+    
+    write_blocks(path, n_rows, make_block, header=False)
+    return span
+
+def generate_addrange_file(path, n_rows, span, seed=3):
+    """Write a synthetic addrangev2-style file with a site + 3 in column 6"""
+    rng = np.random.default_rng(seed)
+    
+    def make_block(start, size):
+        return pd.DataFrame({
+            'id': np.arange(start, start + size),
+            'a': 'a', 'b': 'b', 'c': 'c', 'd': 'd',
+            'site': rng.integers(0, span, size) + 3
+        })
+    
+    write_blocks(path, n_rows, make_block, header=False)
+
+def write_sorted_met_file(path, sorted_path):
+    """
+    Copy a met75-style file sorted by match_val and position, for engines that
+    need sorted input. The sort is stable and the cells are copied as text, so
+    repeated positions keep their order and every engine sees the same values.
+    
+    Rows are first split by match_val into temporary files, WRITE_BLOCK rows
+    at a time, and each match_val is then sorted on its own, so only one
+    group is held in memory.
+    """
+    bucket_dir = tempfile.mkdtemp(prefix='metsort-', dir=os.path.dirname(os.path.abspath(sorted_path)))
+    try:
+        columns = pd.read_csv(path, nrows=0).columns
+        buckets = {}
+        for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=WRITE_BLOCK):
+            for match_val, rows in chunk.groupby('match_val', sort=False):
+                bucket = buckets.setdefault(match_val, os.path.join(bucket_dir, f"{len(buckets)}.csv"))
+                rows.to_csv(bucket, mode='a', index=False, header=False)
+        
+        with open(sorted_path, 'w', newline='') as outfile:
+            pd.DataFrame(columns=columns).to_csv(outfile, index=False)
+            for match_val in sorted(buckets):
+                group = pd.read_csv(buckets[match_val], header=None, names=columns, dtype=str,
+                                    keep_default_na=False)
+                order = np.argsort(group['pos'].astype(np.int64).to_numpy(), kind='stable')
+                group.iloc[order].to_csv(outfile, index=False, header=False)
+    finally:
+        shutil.rmtree(bucket_dir, ignore_errors=True)
+
+def generate_dataset(workdir, met_rows, gRNA_rows, seed=0, sorted_met=False, value_variants=()):
+    """
+    Generate every input file for the benchmark in workdir and return their
+    paths. With sorted_met, a sorted copy of the met75 file is written as well.
+    For each of value_variants a met75 file with that type of values (see
+    generate_met_file) is written too; paths['variants'] maps the variant to
+    the paths that replace the float ones.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    paths = {
+        'met': os.path.join(workdir, 'met75_synthetic.csv'),
+        'met_sorted': os.path.join(workdir, 'met75_synthetic_sorted.csv'),
+        'gRNA': os.path.join(workdir, 'gRNAranges_synthetic.csv'),
+        'sites': os.path.join(workdir, 'output_synthetic.csv'),
+        'addrange': os.path.join(workdir, 'addrange_synthetic.csv'),
+        'index': os.path.join(workdir, 'met75_synthetic.idx')
+    }
+    span = generate_met_file(paths['met'], met_rows, seed=seed)
+    if sorted_met:
+        write_sorted_met_file(paths['met'], paths['met_sorted'])
+    paths['variants'] = {}
+    for variant in value_variants:
+        variant_paths = {
+            'met': os.path.join(workdir, f'met75_synthetic_{variant}.csv'),
+            'met_sorted': os.path.join(workdir, f'met75_synthetic_{variant}_sorted.csv'),
+            'index': os.path.join(workdir, f'met75_synthetic_{variant}.idx')
+        }
+        generate_met_file(variant_paths['met'], met_rows, seed=seed, values=variant)
+        if sorted_met:
+            write_sorted_met_file(variant_paths['met'], variant_paths['met_sorted'])
+        paths['variants'][variant] = variant_paths
+    generate_gRNA_file(paths['gRNA'], gRNA_rows, span, seed=seed + 1)
+    sites_span = generate_sites_file(paths['sites'], met_rows, seed=seed + 2)
+    generate_addrange_file(paths['addrange'], gRNA_rows, sites_span, seed=seed + 3)
+    return paths
+
+def run_stage_body(stage, paths, output_file):
+    """Run one stage in the current process"""
+    import metstatusv8
+    
+    if stage == 'index_build':
+        import metindex
+        metindex.build_met_index(paths['met'], paths['index'])
+    elif stage == 'sorted':
+        metstatusv8.match_csvs_sorted(paths['met'], paths['gRNA'], output_file)
+    elif stage in ('sorted_numpy', 'sorted_numba'):
+        metstatusv8.match_csvs_sorted(paths['met'], paths['gRNA'], output_file, engine=stage.split('_')[1])
+    elif stage == 'sorted_chunked':
+        metstatusv8.match_csvs_sorted(paths['met'], paths['gRNA'], output_file,
+                                      chunksize=WRITE_BLOCK, value_dtype=None)
+    elif stage == 'indexed':
+        import metindex
+        metindex.match_csvs_indexed(paths['met'], paths['gRNA'], output_file, paths['index'])
+    elif stage == 'parallel':
+        import parallelmatch
+        parallelmatch.match_csvs_parallel(paths['met'], paths['gRNA'], output_file, paths['index'])
+    elif stage == 'cached':
+        import matchcache
+        # A cold run fills the result cache and the rerun takes every row from it
+        for _ in range(2):
+            matchcache.match_csvs_cached(paths['met'], paths['gRNA'], output_file, paths['index'])
+    elif stage == 'multisample':
+        import multisample
+        # The met file is matched as two samples so the worker pool runs;
+        # the first sample's file is the one compared
+        template = os.path.join(os.path.dirname(output_file), 'multisample_{sample}.csv')
+        multisample.match_csvs_multi([paths['met'], paths['met']], paths['gRNA'], template,
+                                     per_sample_files=True, processes=2)
+        os.replace(template.format(sample=os.path.splitext(os.path.basename(paths['met']))[0]), output_file)
+    elif stage == 'overlapped':
+        # Slices well below the default so even small gRNA files pass through the queues in pieces
+        metstatusv8.match_csvs_overlapped(paths['met'], paths['gRNA'], output_file, chunk_rows=OVERLAP_ROWS)
+    elif stage == 'external':
+        import externalmatch
+        externalmatch.match_csvs_external(paths['met'], paths['gRNA'], output_file, EXTERNAL_MEMORY_MB,
+                                          temp_dir=os.path.dirname(output_file))
+    elif stage == 'regions':
+        import regionindex
+        # Building the region index is part of the stage
+        regionindex.match_csvs_regions(paths['met_sorted'], paths['gRNA'], output_file)
+    elif stage == 'ultra_fast_sorted':
+        metstatusv8.match_csvs_ultra_fast(paths['met_sorted'], paths['gRNA'], output_file)
+    elif stage == 'ultra_fast':
+        metstatusv8.match_csvs_ultra_fast(paths['met'], paths['gRNA'], output_file)
+    elif stage == 'optimized':
+        metstatusv8.match_csvs_optimized(paths['met'], paths['gRNA'], output_file)
+    elif stage == 'long':
+        metstatusv8.match_csvs_sorted(paths['met'], paths['gRNA'], output_file, layout='long')
+    elif stage == 'summary':
+        metstatusv8.match_csvs_sorted(paths['met'], paths['gRNA'], output_file, layout='summary')
+    elif stage == 'outputrangev3':
+        import outputrangev3
+        outputrangev3.process_csvs(paths['sites'], paths['addrange'], output_file)
+    elif stage == 'metpositions':
+        import metpositions
+        metpositions.process_csvs(paths['sites'], paths['gRNA'], output_file)
+    else:
+        raise ValueError(f"Unknown stage '{stage}'. Choose from {ALL_STAGES}")
+
+def stage_worker(stage, paths, output_file, queue):
+    """Child-process entry point: run a stage quietly and report time and peak RSS"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # Pool workers print to the inherited descriptor rather than sys.stdout
+        os.dup2(devnull.fileno(), 1)
+        start = time.perf_counter()
+        run_stage_body(stage, paths, output_file)
+        seconds = time.perf_counter() - start
+    # Worker pools (the parallel engine) count towards the stage's peak as well
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    queue.put({'seconds': seconds, 'peak_rss_mb': peak_kb / 1024})
+
+def file_sha256(path):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 24), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def run_stage(stage, paths, workdir, rows, values='float'):
+    """
+    Run one stage in a fresh interpreter so its peak RSS is its own, on the
+    met75 file of the given value variant.
+    
+    Returns a result record with wall time, peak RSS, rows/sec and the
+    SHA-256 of the output file.
+    """
+    if values == 'float':
+        output_file = os.path.join(workdir, f"out_{stage}.csv")
+    else:
+        output_file = os.path.join(workdir, f"out_{stage}_{values}.csv")
+        paths = dict(paths, **paths['variants'][values])
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=stage_worker, args=(stage, paths, output_file, queue))
+    process.start()
+    process.join()
+    
+    if process.exitcode != 0:
+        return {'stage': stage, 'values': values, 'error': f"exit code {process.exitcode}"}
+    
+    result = queue.get()
+    result.update({
+        'stage': stage,
+        'values': values,
+        'rows': rows,
+        'rows_per_sec': rows / result['seconds'] if result['seconds'] else None,
+        'output_sha256': None if stage == 'index_build' else file_sha256(output_file)
+    })
+    return result
+
+def compare_hashes(hashes, references):
+    """Compare output hashes with each other and with the first of references that ran"""
+    reference = next((stage for stage in references if stage in hashes), None)
+    return {
+        'engines': sorted(hashes),
+        'reference': reference,
+        'differ_from_reference': sorted(stage for stage, digest in hashes.items()
+                                        if reference is not None and digest != hashes[reference]),
+        'identical': len(set(hashes.values())) <= 1 and None not in hashes.values(),
+        'hashes': hashes
+    }
+
+def differential_check(results, values='float'):
+    """
+    Compare the outputs of every wide matching engine that ran with each
+    other and with the first legacy engine that ran, the reference. Engines
+    on the sorted met75 copy are checked the same way under 'sorted_input',
+    and the runs on the other value variants under 'value_variants'.
+    """
+    hashes = {r['stage']: r.get('output_sha256') for r in results if r.get('values', 'float') == values}
+    check = compare_hashes({stage: hashes[stage] for stage in hashes if stage in WIDE_ENGINES}, LEGACY_ENGINES)
+    sorted_hashes = {stage: hashes[stage] for stage in hashes if stage in SORTED_ENGINES}
+    if sorted_hashes:
+        check['sorted_input'] = compare_hashes(sorted_hashes, [SORTED_REFERENCE])
+    if values == 'float':
+        variants = [variant for variant in VALUE_VARIANTS[1:] if any(r.get('values') == variant for r in results)]
+        if variants:
+            check['value_variants'] = {variant: differential_check(results, variant) for variant in variants}
+    return check
+
+def run_benchmark(workdir, met_rows, gRNA_rows, stages=None, seed=0, keep_files=False,
+                  value_variants=None):
+    """
+    Generate a seeded synthetic dataset, run the selected stages and return a
+    JSON-serialisable report.
+    
+    Args:
+        workdir (str): Directory for generated inputs and stage outputs
+        met_rows (int): Rows in the met75 and output-style files
+        gRNA_rows (int): Rows in the gRNA and addrange-style files
+        stages (list): Stages to run (default: DEFAULT_STAGES). Whenever a
+            wide engine runs, ultra_fast is added as the reference unless a
+            legacy engine is already selected. The legacy engines are
+            O(gRNAs x sites), so at large scales select just one of them.
+            Selecting a sorted-input engine adds ultra_fast_sorted likewise
+        seed (int): Seed for the data generator
+        keep_files (bool): Keep the generated files after the run
+        value_variants (list): Value variants besides 'float' whose met75
+            files the selected VARIANT_STAGES are run on again (default:
+            DEFAULT_VALUE_VARIANTS)
+    """
+    stages = DEFAULT_STAGES if stages is None else stages
+    value_variants = DEFAULT_VALUE_VARIANTS if value_variants is None else value_variants
+    unknown = [stage for stage in stages if stage not in ALL_STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stages {unknown}. Choose from {ALL_STAGES}")
+    unknown = [variant for variant in value_variants if variant not in VALUE_VARIANTS[1:]]
+    if unknown:
+        raise ValueError(f"Unknown value variants {unknown}. Choose from {VALUE_VARIANTS[1:]}")
+    if any(stage in ('indexed', 'parallel', 'cached') for stage in stages) and 'index_build' not in stages:
+        stages = ['index_build'] + list(stages)
+    if any(stage in WIDE_ENGINES for stage in stages) and not any(stage in LEGACY_ENGINES for stage in stages):
+        stages = list(stages) + [LEGACY_ENGINES[0]]
+    if any(stage in SORTED_ENGINES for stage in stages) and SORTED_REFERENCE not in stages:
+        stages = list(stages) + [SORTED_REFERENCE]
+    
+    print(f"Generating {met_rows} met rows and {gRNA_rows} gRNA rows in {workdir}...")
+    start = time.perf_counter()
+    sorted_met = any(stage in SORTED_ENGINES for stage in stages)
+    variant_stages = [stage for stage in ALL_STAGES if stage in stages and stage in VARIANT_STAGES]
+    if not variant_stages:
+        value_variants = []
+    paths = generate_dataset(workdir, met_rows, gRNA_rows, seed, sorted_met, value_variants)
+    generate_seconds = time.perf_counter() - start
+    
+    stage_rows = {
+        'index_build': met_rows,
+        'outputrangev3': met_rows + gRNA_rows,
+        'metpositions': met_rows + gRNA_rows
+    }
+    runs = [(stage, 'float') for stage in ALL_STAGES if stage in stages]
+    runs += [(stage, variant) for variant in value_variants for stage in variant_stages]
+    results = []
+    for stage, values in runs:
+        print(f"Running {stage}..." if values == 'float' else f"Running {stage} on {values} values...")
+        result = run_stage(stage, paths, workdir, stage_rows.get(stage, met_rows + gRNA_rows), values)
+        results.append(result)
+        if 'error' in result:
+            print(f"  {stage} failed: {result['error']}")
+        else:
+            print(f"  {result['seconds']:.2f} s, {result['peak_rss_mb']:.1f} MB peak, "
+                  f"{result['rows_per_sec']:.0f} rows/s")
+    
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'met_rows': met_rows,
+        'gRNA_rows': gRNA_rows,
+        'generate_seconds': generate_seconds,
+        'stages': results,
+        'differential': differential_check(results)
+    }
+    
+    if not keep_files:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the matching engines on synthetic data")
+    parser.add_argument('--met-rows', type=int, default=100000,
+                        help="Rows in the synthetic met75 file (default: 100000)")
+    parser.add_argument('--gRNA-rows', type=int, default=None,
+                        help="Rows in the synthetic gRNA file (default: met rows / 10)")
+    parser.add_argument('--stages', default=','.join(DEFAULT_STAGES),
+                        help=f"Comma-separated stages to run, from: {','.join(ALL_STAGES)}")
+    parser.add_argument('--seed', type=int, default=0, help="Generator seed (default: 0)")
+    parser.add_argument('--workdir', default='bench_data', help="Directory for generated files")
+    parser.add_argument('--keep-files', action='store_true', help="Keep generated files")
+    parser.add_argument('--value-variants', default=','.join(DEFAULT_VALUE_VARIANTS),
+                        help=f"Comma-separated met75 value types to compare the engines on as well, "
+                             f"from: {','.join(VALUE_VARIANTS[1:])} (default: %(default)s)")
+    parser.add_argument('--output', default='bench_results.json', help="JSON report path")
+    args = parser.parse_args()
+    
+    gRNA_rows = args.gRNA_rows if args.gRNA_rows is not None else max(1, args.met_rows // 10)
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    value_variants = [variant.strip() for variant in args.value_variants.split(',') if variant.strip()]
+    report = run_benchmark(args.workdir, args.met_rows, gRNA_rows, stages, args.seed, args.keep_files,
+                           value_variants)
+    
+    with open(args.output, 'w') as outfile:
+        json.dump(report, outfile, indent=2)
+    
+    differential = report['differential']
+    checks = []
+    for values, variant_check in [('float', differential)] + list(differential.get('value_variants', {}).items()):
+        for check in (variant_check, variant_check.get('sorted_input')):
+            if check and check['engines']:
+                checks.append(check)
+                print(f"Engines compared on {values} values: {', '.join(check['engines'])} "
+                      f"(reference: {check['reference']})")
+                print(f"Outputs identical: {check['identical']}")
+    print(f"Report saved to {args.output}")
+    if not all(check['identical'] for check in checks):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
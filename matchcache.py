@@ -0,0 +1,183 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from metindex import (HEADER_FILE, INDEX_VERSION, default_index_dir, load_met_index, read_header,
+                      source_fingerprint, write_header)
+from metstatusv8 import attach_results, match_sorted_lookup, new_result_buffers, prepare_gRNA_df, write_results
+from tableio import read_table
+
+CACHE_VERSION = 1
+KEYS_FILE = 'keys.npy'
+RESULT_COLUMNS = ['matched_positions', 'matched_third_col_values', 'has_matches']
+
+def default_cache_dir(output_file):
+    """Cache directory used when none is given: <output file>.cache next to the file"""
+    return f"{output_file}.cache"
+
+def row_keys(gRNA_df):
+    """
+    Hash each prepared gRNA row's (range_start, range_end, match_val, strand).
+    
+    These are the only inputs the match result of a row depends on, so two rows
+    with the same key get the same result against the same met75 file. Values
+    are normalised (float bounds, text match_val, strand reduced to '+', '-'
+    or '') so that the key does not depend on how pandas typed the columns.
+    """
+    strands = gRNA_df['strand'].to_numpy()
+    keys = pd.DataFrame({
+        'range_start': gRNA_df['range_start'].to_numpy(dtype=np.float64),
+        'range_end': gRNA_df['range_end'].to_numpy(dtype=np.float64),
+        'match_val': gRNA_df['match_val'].astype(str).to_numpy(),
+        'strand': np.where(strands == '+', '+', np.where(strands == '-', '-', ''))
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+def index_state(index_header):
+    """What the match results depend on: met75 content, value dtype and merged updates"""
+    return {
+        'met_sha256': index_header['source']['sha256'],
+        'value_dtype': index_header['value_dtype'],
+        'generation': index_header.get('generation', 0)
+    }
+
+def read_cache_header(cache_dir):
+    """Return the cache header, or None if cache_dir holds no result cache"""
+    try:
+        header = read_header(cache_dir)
+    except NotADirectoryError:
+        return None
+    if header is None or header.get('cache_version') != CACHE_VERSION:
+        return None
+    return header
+
+def load_cached_results(cache_dir, output_file, index_header):
+    """
+    Return (keys, matched_positions, matched_values, has_matches) from the
+    previous run, or None if there is no usable cache.
+    
+    The cache is only used when it was written against the same index (same
+    met75 content, value dtype and merged updates) and the previous output
+    file has not been changed since.
+    """
+    header = read_cache_header(cache_dir)
+    if header is None:
+        return None
+    if header['index'] != index_state(index_header):
+        print("Met75 data changed since the last run, ignoring result cache")
+        return None
+    if not os.path.exists(output_file) or source_fingerprint(output_file, with_hash=False) != header['output']:
+        print(f"{output_file} changed since the last run, ignoring result cache")
+        return None
+    
+    keys = np.load(os.path.join(cache_dir, KEYS_FILE))
+    names = list(read_table(output_file, nrows=0).columns)
+    if len(keys) != header['rows'] or any(col not in names for col in RESULT_COLUMNS):
+        return None
+    
+    # Read the result columns back as the exact strings that were written
+    previous = read_table(output_file, usecols=[names.index(col) for col in RESULT_COLUMNS],
+                          dtype=str, keep_default_na=False)
+    if len(previous) != len(keys):
+        return None
+    return (keys,
+            previous['matched_positions'].to_numpy(dtype=object),
+            previous['matched_third_col_values'].to_numpy(dtype=object),
+            previous['has_matches'].to_numpy() == 'y')
+
+def save_cache(cache_dir, output_file, keys, index_header):
+    """Store the row keys of output_file and what they were matched against"""
+    os.makedirs(cache_dir, exist_ok=True)
+    # Drop the old header first so a failed save never pairs it with new keys
+    header_path = os.path.join(cache_dir, HEADER_FILE)
+    if os.path.exists(header_path):
+        os.remove(header_path)
+    
+    np.save(os.path.join(cache_dir, KEYS_FILE), keys)
+    write_header(cache_dir, {
+        'version': INDEX_VERSION,
+        'cache_version': CACHE_VERSION,
+        'index': index_state(index_header),
+        'rows': int(len(keys)),
+        'output': source_fingerprint(output_file, with_hash=False)
+    })
+
+def match_csvs_cached(met75_file, gRNA_file, output_file, index_dir=None, cache_dir=None):
+    """
+    Incremental matching: only gRNA rows that are new or changed since the last
+    run are matched, the rest are spliced in from the previous output.
+    
+    Rows are keyed by a hash of (range_start, range_end, match_val, strand).
+    The met75 lookup comes from the persistent index, so a rerun with a few
+    changed rows does not parse the met75 CSV at all; when the met75 file
+    changes or an update is merged into the index, every row is matched again.
+    
+    Args:
+        met75_file (str): Path to the met75 CSV file
+        gRNA_file (str): Path to the gRNA ranges CSV file
+        output_file (str): Path for the output CSV file
+        index_dir (str): Met75 index directory (default: <met75_file>.idx)
+        cache_dir (str): Result cache directory (default: <output_file>.cache)
+    """
+    if index_dir is None:
+        index_dir = default_index_dir(met75_file)
+    if cache_dir is None:
+        cache_dir = default_cache_dir(output_file)
+    
+    print("Using cached incremental approach...")
+    lookup_dict = load_met_index(met75_file, index_dir)
+    index_header = read_header(index_dir)
+    
+    print("Processing gRNA data...")
+    gRNA_df = read_table(gRNA_file)
+    prepare_gRNA_df(gRNA_df)
+    keys = row_keys(gRNA_df)
+    
+    matched_positions, matched_values, has_matches = new_result_buffers(len(gRNA_df))
+    to_match = np.arange(len(gRNA_df))
+    
+    cached = load_cached_results(cache_dir, output_file, index_header)
+    if cached is not None:
+        cached_keys, cached_positions, cached_values, cached_flags = cached
+        unique_keys, first_rows = np.unique(cached_keys, return_index=True)
+        found = pd.Index(unique_keys).get_indexer(keys)
+        hits = found >= 0
+        source_rows = first_rows[found[hits]]
+        matched_positions[hits] = cached_positions[source_rows]
+        matched_values[hits] = cached_values[source_rows]
+        has_matches[hits] = cached_flags[source_rows]
+        to_match = np.flatnonzero(~hits)
+        print(f"Reusing {int(hits.sum())} cached rows")
+    
+    print(f"Matching {len(to_match)} new or changed rows...")
+    if len(to_match):
+        changed_df = gRNA_df.iloc[to_match].reset_index(drop=True)
+        match_sorted_lookup(changed_df, lookup_dict)
+        for buffer, col in zip((matched_positions, matched_values, has_matches), RESULT_COLUMNS):
+            buffer[to_match] = changed_df[col].to_numpy()
+    
+    attach_results(gRNA_df, matched_positions, matched_values, has_matches)
+    matches_found = int(has_matches.sum())
+    
+    print("Saving results...")
+    write_results(gRNA_df, output_file)
+    save_cache(cache_dir, output_file, keys, index_header)
+    print(f"Results saved to {output_file}")
+    print(f"Total matches found: {matches_found}")
+    
+    return gRNA_df
+
+def main():
+    if len(sys.argv) < 4:
+        print("Usage: python matchcache.py <met_csv_file> <gRNA_csv_file> <output_csv_file> [index_dir] [cache_dir]")
+        print("Example: python matchcache.py met75trimfix.csv gRNAranges.csv matched_results75_v8.csv")
+        return
+    
+    index_dir = sys.argv[4] if len(sys.argv) > 4 else None
+    cache_dir = sys.argv[5] if len(sys.argv) > 5 else None
+    match_csvs_cached(sys.argv[1], sys.argv[2], sys.argv[3], index_dir, cache_dir)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
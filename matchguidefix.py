@@ -1,28 +1,27 @@
-import csv
 import os
+from tableio import read_rows, write_rows
 
 def process_csv(input_file, output_file):
-    # Read the CSV file
-    with open(input_file, 'r', newline='') as infile:
-        reader = csv.reader(infile)
-        rows = list(reader)
+    rows_processed = 0
     
-    # Process each row
-    new_rows = []
-    for row in rows:
-        # Check if there's a value in the 4th column (index 3)
-        has_value = 'y' if (len(row) > 3 and row[3].strip() != '') else 'n'
-        
-        # Create new row with the new column added at the beginning
-        new_row = [has_value] + row
-        new_rows.append(new_row)
+    def counted(rows):
+        nonlocal rows_processed
+        for row in rows:
+            rows_processed += 1
+            yield row
     
-    # Write the modified data to a new CSV file
-    with open(output_file, 'w', newline='') as outfile:
-        writer = csv.writer(outfile)
-        writer.writerows(new_rows)
+    # Stream rows from the reader through the flag stage into the writer
+    reader = read_rows(input_file)
+    write_rows(output_file, flag_rows(counted(reader)))
     
-    print(f"Processed {len(rows)} rows and saved to {output_file}")
+    print(f"Processed {rows_processed} rows and saved to {output_file}")
+
+def flag_rows(rows, column=4):
+    """Yield each row with a leading 'y'/'n' flag for a value in the given column (1-based)"""
+    index = column - 1
+    for row in rows:
+        has_value = 'y' if (len(row) > index and row[index].strip() != '') else 'n'
+        yield [has_value, *row]
 
 if __name__ == "__main__":
     input_file = "range_matches.csv"
@@ -0,0 +1,233 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from metindex import load_met_index
+from metstatusv8 import join_group_ranges
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+def load_into_memory(lookup_dict):
+    """Copy every memory-mapped index array into RAM so queries never wait on disk"""
+    return {match_val: {field: None if array is None else np.array(array)
+                        for field, array in entry.items()}
+            for match_val, entry in lookup_dict.items()}
+
+def answer_queries(lookup_dict, queries, keys_by_text=None):
+    """
+    Resolve a batch of range queries against a sorted lookup.
+    
+    Each query is [match_val, start, end, strand] (strand may be left out).
+    Queries are grouped by match_val and each group is joined in one
+    join_group_ranges call, so hits are strand-adjusted and ordered exactly as
+    in matched_positions of match_csvs_ultra_fast.
+    
+    Args:
+        lookup_dict (dict): Sorted lookup, e.g. from load_met_index
+        queries (list): List of [match_val, start, end, strand] lists
+        keys_by_text (dict): Optional map from str(match_val) to lookup key, so
+            clients can send 1 or "1" for a numeric match_val
+    
+    Returns a list with one {'positions': [...], 'values': [...]} per query.
+    """
+    groups = defaultdict(list)
+    for i, query in enumerate(queries):
+        if not isinstance(query, (list, tuple)) or len(query) not in (3, 4):
+            raise ValueError(f"Query {i} must be [match_val, start, end, strand]")
+        match_val = query[0]
+        if keys_by_text is not None and match_val not in lookup_dict:
+            match_val = keys_by_text.get(str(match_val), match_val)
+        groups[match_val].append(i)
+    
+    results = [{'positions': [], 'values': []} for _ in queries]
+    for match_val, rows in groups.items():
+        if match_val not in lookup_dict:
+            continue
+        
+        try:
+            range_starts = np.array([queries[i][1] for i in rows], dtype=np.float64)
+            range_ends = np.array([queries[i][2] for i in rows], dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError(f"Range bounds for {match_val} must be numbers")
+        strands = np.array([queries[i][3] if len(queries[i]) > 3 else None for i in rows], dtype=object)
+        
+        counts, final_pos, hit_vals = join_group_ranges(lookup_dict[match_val], range_starts, range_ends, strands)
+        
+        # Values go out as the same text the CSV output would show
+        positions = final_pos.astype(np.int64).tolist()
+        values = [float(str(v)) for v in hit_vals]
+        ends = np.cumsum(counts).tolist()
+        for i, count, end in zip(rows, counts.tolist(), ends):
+            results[i] = {'positions': positions[end - count:end], 'values': values[end - count:end]}
+    
+    return results
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """POST /query with {"queries": [...]} answers ranges; GET /health reports status"""
+    
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, {'error': f"Unknown path '{self.path}'"})
+            return
+        self.send_json(200, {'status': 'ok', 'match_values': len(self.server.lookup_dict)})
+    
+    def do_POST(self):
+        if self.path != '/query':
+            self.send_json(404, {'error': f"Unknown path '{self.path}'"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            results = answer_queries(self.server.lookup_dict, request['queries'], self.server.keys_by_text)
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(200, {'results': results})
+    
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class QueryServer(ThreadingHTTPServer):
+    """Threaded HTTP server that shares one read-only lookup between all clients"""
+    
+    daemon_threads = True
+    # Unix sockets refuse connections outright once the backlog is full
+    request_queue_size = 128
+    
+    def __init__(self, server_address, lookup_dict, verbose=False):
+        self.lookup_dict = lookup_dict
+        self.keys_by_text = {str(match_val): match_val for match_val in lookup_dict}
+        self.verbose = verbose
+        super().__init__(server_address, QueryHandler)
+
+class UnixQueryServer(QueryServer):
+    """The same HTTP protocol served on a Unix domain socket"""
+    
+    address_family = socket.AF_UNIX
+    
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        self.socket.bind(self.server_address)
+        self.server_name = 'localhost'
+        self.server_port = 0
+    
+    def get_request(self):
+        # Unix sockets have no peer address; the handler expects a (host, port) pair
+        request, _ = self.socket.accept()
+        return request, ('local', 0)
+
+def serve(met75_file, index_dir=None, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None,
+          preload=True, verbose=False):
+    """
+    Load the met75 index once and answer range queries until interrupted.
+    
+    Args:
+        met75_file (str): Path to the met75 CSV file (index built if missing or stale)
+        index_dir (str): Index directory (default: <met75_file>.idx)
+        host (str): Address to listen on for HTTP; keep this on localhost
+        port (int): TCP port for HTTP
+        socket_path (str): If given, listen on this Unix socket instead of TCP
+        preload (bool): Copy the index into RAM instead of serving it memory-mapped
+        verbose (bool): Log every request
+    """
+    lookup_dict = load_met_index(met75_file, index_dir)
+    if preload:
+        print("Loading index into memory...")
+        lookup_dict = load_into_memory(lookup_dict)
+    
+    if socket_path:
+        server = UnixQueryServer(socket_path, lookup_dict, verbose)
+        print(f"Serving {len(lookup_dict)} match values on unix socket {socket_path}")
+    else:
+        server = QueryServer((host, port), lookup_dict, verbose)
+        print(f"Serving {len(lookup_dict)} match values on http://{host}:{server.server_port}")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down...")
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that talks to a Unix domain socket"""
+    
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+    
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def connect(address=f"{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=60):
+    """Open a connection to a query server at host:port or at a Unix socket path"""
+    if os.sep in address or address.endswith('.sock'):
+        return UnixHTTPConnection(address, timeout=timeout)
+    host, _, port = address.rpartition(':')
+    return http.client.HTTPConnection(host or DEFAULT_HOST, int(port), timeout=timeout)
+
+def query_ranges(queries, address=f"{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=60):
+    """
+    Send a batch of range queries to a running query server.
+    
+    Usage:
+        results = query_ranges([('chr1', 1000, 1040, '+'), ('chr2', 500, 530, '-')])
+        results[0]['positions'], results[0]['values']
+    
+    Args:
+        queries (list): (match_val, start, end, strand) tuples
+        address (str): host:port of an HTTP server or path of its Unix socket
+        timeout (float): Seconds to wait for the answer
+    """
+    body = json.dumps({'queries': [list(query) for query in queries]})
+    conn = connect(address, timeout)
+    try:
+        conn.request('POST', '/query', body=body, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        payload = json.loads(response.read())
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise RuntimeError(f"Query failed ({response.status}): {payload.get('error')}")
+    return payload['results']
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve range queries against a met75 index held in memory")
+    parser.add_argument('met_file', help="met75 CSV file (indexed on first use)")
+    parser.add_argument('--index-dir', help="Index directory (default: <met_file>.idx)")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"HTTP listen address (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"HTTP port (default: {DEFAULT_PORT})")
+    parser.add_argument('--socket', help="Listen on this Unix socket instead of HTTP over TCP")
+    parser.add_argument('--mmap', action='store_true',
+                        help="Serve the index memory-mapped instead of copying it into RAM")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args()
+    
+    serve(args.met_file, args.index_dir, args.host, args.port, args.socket,
+          preload=not args.mmap, verbose=args.verbose)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,466 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+from metstatusv8 import (build_lookup_chunked, match_sorted_lookup, peak_rss_mb, smallest_int, whole_positions,
+                         write_results)
+from tableio import read_table, widen_dtype
+
+INDEX_VERSION = 1
+HEADER_FILE = 'index.json'
+
+# By default values keep the type read_csv gives them in the whole met75 file,
+# so they print exactly as in match_csvs_sorted
+DEFAULT_VALUE_DTYPE = None
+# Header label of an index built with value_dtype=None
+PARSED_VALUES = 'parsed'
+
+def default_index_dir(met75_file):
+    """Index directory used when none is given: <met file>.idx next to the file"""
+    return f"{met75_file}.idx"
+
+def value_dtype_label(value_dtype):
+    """How the header records a value_dtype: its name, or PARSED_VALUES for None"""
+    return PARSED_VALUES if value_dtype is None else np.dtype(value_dtype).name
+
+def storable_values(values):
+    """Values as an array np.load can memory-map: text values become fixed-width strings"""
+    values = np.asarray(values)
+    return values.astype(str) if values.dtype.kind == 'O' else values
+
+def file_sha256(filename, block_size=16 * 1024 * 1024):
+    """SHA-256 of a file, read in large blocks"""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as infile:
+        for block in iter(lambda: infile.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def source_fingerprint(met75_file, with_hash=True):
+    """Size, mtime and (optionally) content hash of the source CSV"""
+    stat = os.stat(met75_file)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        fingerprint['sha256'] = file_sha256(met75_file)
+    return fingerprint
+
+def read_header(index_dir):
+    """Return the parsed index header, or None if there is no readable index"""
+    try:
+        with open(os.path.join(index_dir, HEADER_FILE), 'r') as header_file:
+            header = json.load(header_file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if header.get('version') != INDEX_VERSION:
+        return None
+    return header
+
+def write_header(index_dir, header):
+    """Write the header through a temporary file so readers never see a partial one"""
+    tmp_path = os.path.join(index_dir, HEADER_FILE + '.tmp')
+    with open(tmp_path, 'w') as header_file:
+        json.dump(header, header_file, indent=1)
+    os.replace(tmp_path, os.path.join(index_dir, HEADER_FILE))
+
+def index_is_current(index_dir, met75_file, verify_hash=False, value_label=None):
+    """
+    Check whether the index in index_dir was built from the current met75 file.
+    
+    Size and mtime are compared first. When the size matches but the mtime has
+    changed (or verify_hash is set), the content hash decides, so touching the
+    file without changing it does not force a rebuild. If value_label (see
+    value_dtype_label) is given, an index built for another value_dtype is out
+    of date too.
+    """
+    header = read_header(index_dir)
+    if header is None:
+        return False
+    if value_label is not None and header['value_dtype'] != value_label:
+        return False
+    
+    current = source_fingerprint(met75_file, with_hash=False)
+    if current['size'] != header['source']['size']:
+        return False
+    if current['mtime_ns'] == header['source']['mtime_ns'] and not verify_hash:
+        return True
+    
+    if file_sha256(met75_file) != header['source']['sha256']:
+        return False
+    
+    # Same content with a new mtime: remember it so the next check is cheap
+    header['source']['mtime_ns'] = current['mtime_ns']
+    write_header(index_dir, header)
+    return True
+
+def json_key(match_val):
+    """Convert a lookup key to a plain JSON value"""
+    return match_val.item() if isinstance(match_val, np.generic) else match_val
+
+def save_group(index_dir, name, match_val, entry):
+    """Write one lookup entry as <name>_<field>.npy files and return its header record"""
+    for field in ('positions', 'values', 'file_order', 'tie_counts'):
+        if entry[field] is not None:
+            np.save(os.path.join(index_dir, f"{name}_{field}.npy"), storable_values(entry[field]))
+    return {
+        'match_val': json_key(match_val),
+        'name': name,
+        'rows': int(len(entry['positions'])),
+        'has_ties': entry['tie_counts'] is not None
+    }
+
+def save_lookup(lookup_dict, index_dir, header):
+    """
+    Write a sorted lookup as per-match_val .npy files plus a JSON header.
+    
+    Each group gets <name>_positions.npy and <name>_values.npy, and groups with
+    repeated positions also get <name>_file_order.npy and <name>_tie_counts.npy.
+    The header maps every match_val to its file name prefix.
+    """
+    header = dict(header)
+    header['version'] = INDEX_VERSION
+    header['groups'] = []
+    
+    for number, (match_val, entry) in enumerate(lookup_dict.items()):
+        header['groups'].append(save_group(index_dir, f"group_{number:05d}", match_val, entry))
+    
+    write_header(index_dir, header)
+
+def build_met_index(met75_file, index_dir=None, chunksize=1000000, value_dtype=DEFAULT_VALUE_DTYPE):
+    """
+    Build a persistent binary index of a met75 file.
+    
+    The index is written to a temporary directory next to index_dir and moved
+    into place at the end, so concurrent jobs never open a half-written index.
+    
+    Args:
+        met75_file (str): Path to the met75 CSV file
+        index_dir (str): Directory for the index (default: <met75_file>.idx)
+        chunksize (int): Rows per chunk while parsing the CSV
+        value_dtype: dtype for methylation values; None keeps the type read_csv
+            gives the whole file (text is stored as fixed-width strings), so the
+            output is identical to match_csvs_sorted; float32 makes the values
+            smaller
+    """
+    if index_dir is None:
+        index_dir = default_index_dir(met75_file)
+    
+    print(f"Building index for {met75_file}...")
+    fingerprint = source_fingerprint(met75_file)
+    lookup_dict = build_lookup_chunked(met75_file, chunksize, value_dtype)
+    
+    tmp_dir = f"{index_dir}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    
+    save_lookup(lookup_dict, tmp_dir, {
+        'source': dict(fingerprint, path=os.path.abspath(met75_file)),
+        'value_dtype': value_dtype_label(value_dtype)
+    })
+    
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    os.replace(tmp_dir, index_dir)
+    
+    print(f"Index saved to {index_dir} ({len(lookup_dict)} match values)")
+    return index_dir
+
+def open_met_index(index_dir):
+    """
+    Open a persistent index as a lookup dict backed by np.memmap arrays.
+    
+    Nothing is read up front; pages are loaded on first access and shared
+    through the page cache with any other process that has the index open.
+    """
+    header = read_header(index_dir)
+    if header is None:
+        raise FileNotFoundError(f"No index found in '{index_dir}'")
+    
+    lookup_dict = {}
+    for group in header['groups']:
+        prefix = os.path.join(index_dir, group['name'])
+        entry = {
+            'positions': np.load(f"{prefix}_positions.npy", mmap_mode='r'),
+            'values': np.load(f"{prefix}_values.npy", mmap_mode='r'),
+            'file_order': None,
+            'tie_counts': None
+        }
+        if group['has_ties']:
+            entry['file_order'] = np.load(f"{prefix}_file_order.npy", mmap_mode='r')
+            entry['tie_counts'] = np.load(f"{prefix}_tie_counts.npy", mmap_mode='r')
+        lookup_dict[group['match_val']] = entry
+    return lookup_dict
+
+def load_met_index(met75_file, index_dir=None, verify_hash=False, **build_kwargs):
+    """
+    Open the index for met75_file, rebuilding it first if it is missing, stale
+    or was built for a value_dtype other than the one asked for (default:
+    values as read_csv parses the whole file).
+    
+    Extra keyword arguments are passed to build_met_index.
+    """
+    if index_dir is None:
+        index_dir = default_index_dir(met75_file)
+    build_kwargs.setdefault('value_dtype', DEFAULT_VALUE_DTYPE)
+    
+    if index_is_current(index_dir, met75_file, verify_hash, value_dtype_label(build_kwargs['value_dtype'])):
+        print(f"Using existing index {index_dir}")
+    else:
+        build_met_index(met75_file, index_dir, **build_kwargs)
+    
+    return open_met_index(index_dir)
+
+def read_delta(delta_file, text_values=False):
+    """
+    Read a delta file of met75 records for update_met_index.
+    
+    The delta uses the met75 layout (position in column 1, value in column 3,
+    match_val in column 4) with an optional 'op' column:
+        add     append the record, like a new row at the end of the met75 file (default)
+        set     replace every existing record at that position with this one
+        delete  remove every existing record at that position
+    
+    Values keep the type read_csv gives them, or are read as text with
+    text_values. Returns {match_val: (add_positions, add_values, remove_positions)}.
+    """
+    delta_df = read_table(delta_file, dtype={2: str} if text_values else None)
+    positions = pd.to_numeric(delta_df.iloc[:, 0], errors='coerce')
+    values = delta_df.iloc[:, 2]
+    match_vals = delta_df.iloc[:, 3]
+    ops = delta_df['op'].fillna('add').astype(str).str.lower() if 'op' in delta_df.columns \
+        else pd.Series('add', index=delta_df.index)
+    
+    unknown = set(ops.unique()) - {'add', 'set', 'delete'}
+    if unknown:
+        raise ValueError(f"Unknown op values in '{delta_file}': {sorted(unknown)}")
+    
+    keep = (positions.notna() & match_vals.notna()).to_numpy()
+    rows_kept = np.flatnonzero(keep)
+    positions = positions.to_numpy()
+    values = values.to_numpy()
+    ops = ops.to_numpy()
+    
+    delta = {}
+    for match_val, rows in match_vals[keep].groupby(match_vals[keep], sort=False).indices.items():
+        rows = rows_kept[rows]
+        group_pos = whole_positions(positions[rows])
+        adding = ops[rows] != 'delete'
+        delta[json_key(match_val)] = (group_pos[adding],
+                                      values[rows][adding],
+                                      np.unique(group_pos[ops[rows] != 'add']))
+    return delta
+
+def merge_entry(entry, add_positions, add_values, remove_positions):
+    """
+    Merge delta records into one sorted lookup entry without re-sorting it.
+    
+    Removed positions are located with np.searchsorted and the new records are
+    inserted at their sorted place in one np.insert, after any existing
+    records with the same position, so the result equals a stable sort of the
+    old rows followed by the new ones. The cost is a search per delta record
+    plus one copy of the group; nothing is parsed or sorted again.
+    
+    Returns the new entry, or None if the group is left empty.
+    """
+    positions = np.asarray(entry['positions'])
+    values = np.asarray(entry['values'])
+    file_order = entry['file_order']
+    # Without ties the file order is never needed, so sorted order stands in for it
+    file_order = np.arange(len(positions)) if file_order is None else np.asarray(file_order)
+    
+    if len(remove_positions):
+        lo = np.searchsorted(positions, remove_positions, side='left')
+        hi = np.searchsorted(positions, remove_positions, side='right')
+        drop = np.concatenate([np.arange(a, b) for a, b in zip(lo.tolist(), hi.tolist())])
+        positions = np.delete(positions, drop)
+        values = np.delete(values, drop)
+        file_order = np.delete(file_order, drop)
+    
+    if len(add_positions):
+        next_order = int(file_order.max()) + 1 if len(file_order) else 0
+        order = np.argsort(add_positions, kind='stable')
+        add_positions = add_positions[order]
+        at = np.searchsorted(positions, add_positions, side='right')
+        # Widen before inserting so new positions cannot overflow an int32 group
+        # and fractional ones are not truncated
+        positions = np.insert(positions.astype(np.result_type(positions.dtype, add_positions.dtype, np.int64)),
+                              at, add_positions)
+        values = np.insert(values.astype(np.result_type(values.dtype, add_values.dtype)), at, add_values[order])
+        file_order = np.insert(file_order.astype(np.int64), at, next_order + order)
+    
+    if not len(positions):
+        return None
+    
+    ties = positions[1:] == positions[:-1]
+    has_ties = ties.any()
+    return {
+        'positions': smallest_int(positions),
+        'values': values,
+        'file_order': smallest_int(file_order) if has_ties else None,
+        'tie_counts': smallest_int(np.concatenate(([0], np.cumsum(ties)))) if has_ties else None
+    }
+
+def stored_value_dtype(header, lookup_dict):
+    """The dtype the index stores its values as"""
+    dtypes = [entry['values'].dtype for entry in lookup_dict.values()]
+    if dtypes:
+        return np.result_type(*dtypes)
+    if header['value_dtype'] == PARSED_VALUES:
+        return np.dtype(np.float64)
+    return np.dtype(header['value_dtype'])
+
+def delta_value_dtype(header, stored_dtype, delta):
+    """
+    The dtype the index stores its values as once delta is merged. An index
+    built with value_dtype=None widens like read_csv would if the delta rows
+    were part of the met75 file; text values in a numeric index need a rebuild.
+    """
+    if header['value_dtype'] != PARSED_VALUES or stored_dtype.kind == 'U':
+        return stored_dtype
+    value_dtype = stored_dtype
+    for add_positions, add_values, remove_positions in delta.values():
+        if len(add_values):
+            value_dtype = widen_dtype(value_dtype, add_values.dtype)
+    if value_dtype.kind == 'O':
+        raise ValueError("The delta has text values but the index stores numbers; "
+                         "rebuild the index from the updated met75 file instead")
+    return value_dtype
+
+def update_met_index(met75_file, delta_file, index_dir=None):
+    """
+    Merge a delta file of new, changed or deleted met75 records into the index.
+    
+    Only the groups named in the delta are merged and rewritten; untouched
+    groups keep their files. Rewritten groups get new file names and the
+    header is replaced last, so jobs that already have the index open keep a
+    consistent view. The updates stay in the index until the met75 file
+    itself changes and the index is rebuilt from it.
+    
+    Args:
+        met75_file (str): Path to the met75 CSV file the index belongs to
+        delta_file (str): Delta table, see read_delta
+        index_dir (str): Directory of the index (default: <met75_file>.idx)
+    """
+    if index_dir is None:
+        index_dir = default_index_dir(met75_file)
+    if not index_is_current(index_dir, met75_file):
+        build_met_index(met75_file, index_dir)
+    
+    print(f"Merging {delta_file} into {index_dir}...")
+    header = read_header(index_dir)
+    lookup_dict = open_met_index(index_dir)
+    stored_dtype = stored_value_dtype(header, lookup_dict)
+    delta = read_delta(delta_file, text_values=stored_dtype.kind == 'U')
+    value_dtype = delta_value_dtype(header, stored_dtype, delta)
+    generation = header.get('generation', 0) + 1
+    records = {group['match_val']: group for group in header['groups']}
+    stale_files = []
+    # The delta's match_val types are inferred from the delta alone, so 1 there
+    # may be the index's '1'; keys are matched on their text, and new keys are
+    # text too when the index keys are
+    keys_by_text = {str(key): key for key in lookup_dict}
+    text_keys = any(isinstance(key, str) for key in lookup_dict)
+    merged_keys = set()
+    
+    for number, (match_val, (add_positions, add_values, remove_positions)) in enumerate(delta.items()):
+        match_val = keys_by_text.get(str(match_val), str(match_val) if text_keys else match_val)
+        if value_dtype.kind == 'U':
+            add_values = storable_values(add_values)
+        elif header['value_dtype'] == PARSED_VALUES:
+            add_values = add_values.astype(value_dtype)
+        else:
+            add_values = pd.to_numeric(add_values, errors='coerce').astype(value_dtype)
+        if match_val in lookup_dict:
+            entry = lookup_dict[match_val]
+            old_name = records[match_val]['name']
+            stale_files += [os.path.join(index_dir, f"{old_name}_{field}.npy")
+                            for field in ('positions', 'values', 'file_order', 'tie_counts')]
+        elif len(add_positions):
+            entry = {
+                'positions': np.empty(0, dtype=np.int64),
+                'values': np.empty(0, dtype=value_dtype),
+                'file_order': None,
+                'tie_counts': None
+            }
+        else:
+            continue
+        
+        merged = merge_entry(entry, add_positions, add_values, remove_positions)
+        merged_keys.add(match_val)
+        if merged is None:
+            records.pop(match_val, None)
+        else:
+            name = f"group_g{generation}_{number:05d}"
+            records[match_val] = save_group(index_dir, name, match_val, merged)
+        print(f"Merged {len(add_positions)} records into {match_val}")
+    
+    if value_dtype != stored_dtype and value_dtype.kind != 'U':
+        # Integer values became float64 as they would in the whole file, so
+        # the groups the delta did not touch are rewritten as float64 too
+        for number, (match_val, record) in enumerate(list(records.items()), start=len(delta)):
+            if match_val in merged_keys:
+                continue
+            entry = dict(lookup_dict[match_val], values=lookup_dict[match_val]['values'].astype(value_dtype))
+            stale_files += [os.path.join(index_dir, f"{record['name']}_{field}.npy")
+                            for field in ('positions', 'values', 'file_order', 'tie_counts')]
+            records[match_val] = save_group(index_dir, f"group_g{generation}_{number:05d}", match_val, entry)
+    
+    header['groups'] = list(records.values())
+    header['generation'] = generation
+    header.setdefault('updates', []).append(
+        dict(source_fingerprint(delta_file), path=os.path.abspath(delta_file)))
+    write_header(index_dir, header)
+    
+    # Readers that opened the old files keep their mappings after unlinking
+    for path in stale_files:
+        if os.path.exists(path):
+            os.remove(path)
+    
+    print(f"Index {index_dir} updated ({len(delta)} match values touched)")
+    return index_dir
+
+def match_csvs_indexed(met75_file, gRNA_file, output_file, index_dir=None, value_dtype=DEFAULT_VALUE_DTYPE):
+    """
+    Sorted interval-join matching with the met75 lookup taken from a persistent
+    memory-mapped index instead of being rebuilt from the CSV on every run.
+    With the default index, whose values keep the type read_csv gives the whole
+    met75 file, the output is identical to match_csvs_sorted; a float32 index
+    prints its values as float32.
+    """
+    print("Using indexed approach...")
+    lookup_dict = load_met_index(met75_file, index_dir, value_dtype=value_dtype)
+    print(f"Peak memory after opening index: {peak_rss_mb():.1f} MB")
+    
+    print("Processing gRNA data...")
+    gRNA_df = read_table(gRNA_file)
+    matches_found = match_sorted_lookup(gRNA_df, lookup_dict)
+    
+    print("Saving results...")
+    write_results(gRNA_df, output_file)
+    print(f"Results saved to {output_file}")
+    print(f"Total matches found: {matches_found}")
+    
+    return gRNA_df
+
+def main():
+    if len(sys.argv) >= 4 and sys.argv[1] == 'update':
+        index_dir = sys.argv[4] if len(sys.argv) > 4 else None
+        update_met_index(sys.argv[2], sys.argv[3], index_dir)
+        return
+    
+    if len(sys.argv) < 4:
+        print("Usage: python metindex.py <met_csv_file> <gRNA_csv_file> <output_csv_file> [index_dir]")
+        print("       python metindex.py update <met_csv_file> <delta_csv_file> [index_dir]")
+        print("Example: python metindex.py met75trimfix.csv gRNAranges.csv matched_results75_v8.csv")
+        return
+    
+    index_dir = sys.argv[4] if len(sys.argv) > 4 else None
+    match_csvs_indexed(sys.argv[1], sys.argv[2], sys.argv[3], index_dir)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
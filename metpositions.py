@@ -1,96 +1,132 @@
-import csv
-from collections import Counter
+import itertools
+import numpy as np
+from overlap import batched, run_overlapped
+from tableio import float_cells, read_column_cells, read_rows, write_rows
 
-def process_csvs():
-    try:
-        # Read metbases100.csv
-        output_data = []
-        with open('metbases100.csv', 'r', newline='') as output_file:
-            csv_reader = csv.reader(output_file)
-            for row in csv_reader:
-                output_data.append(row)
+def single_occurrence_values(met_file):
+    """Sorted values that appear exactly once in column 2 and exactly once in column 3"""
+    # Parse columns 2 and 3 (indices 1 and 2) of metbases100.csv chunk by
+    # chunk; cells that are empty or not numbers become NaN and are dropped
+    # at the end
+    col2_parts = []
+    col3_parts = []
+    for col2_cells, col3_cells in read_column_cells(met_file, [1, 2]):
+        col2_parts.append(float_cells(col2_cells))
+        col3_parts.append(float_cells(col3_cells))
+    col2_values = np.concatenate(col2_parts) if col2_parts else np.empty(0)
+    col3_values = np.concatenate(col3_parts) if col3_parts else np.empty(0)
+    
+    # Count occurrences in columns 2 and 3 and keep values seen exactly once
+    col2_unique, col2_counts = np.unique(col2_values, return_counts=True)
+    col3_unique, col3_counts = np.unique(col3_values, return_counts=True)
+    
+    # Sorted array of values that appear exactly once in BOTH columns 2 and 3
+    common_unique_values = np.intersect1d(col2_unique[col2_counts == 1],
+                                          col3_unique[col3_counts == 1],
+                                          assume_unique=True)
+    return common_unique_values[~np.isnan(common_unique_values)]
+
+def match_ranges(rows, common_unique_values):
+    """
+    Result rows [col3, range start, range end, offsets] for every row with a
+    numeric range in columns 5 and 6, listing the offsets from the range start
+    of the values inside the range.
+    """
+    # Collect the valid ranges first so they can be looked up in one batch
+    range_rows = []
+    range_starts = []
+    range_ends = []
+    
+    for row in rows:
+        if len(row) > 5:  # Ensure row has at least 6 columns
+            try:
+                # Get the range start and end (5th and 6th columns, indices 4 and 5)
+                range_start = float(row[4]) if row[4].strip() else None
+                range_end = float(row[5]) if row[5].strip() else None
+                
+                if range_start is not None and range_end is not None:
+                    range_rows.append(row)
+                    range_starts.append(range_start)
+                    range_ends.append(range_end)
+                    
+            except ValueError:
+                # Skip rows with non-numeric values in range columns
+                pass
+    
+    # Two binary searches per range give the slice of sorted values inside it
+    starts = np.array(range_starts, dtype=float)
+    ends = np.array(range_ends, dtype=float)
+    lo = np.searchsorted(common_unique_values, starts, side='left')
+    hi = np.searchsorted(common_unique_values, ends, side='right')
+    hi = np.where(np.isnan(starts) | np.isnan(ends), lo, hi)
+    
+    # Process each range and build the result rows
+    result = []
+    
+    for row, range_start, range_end, first, last in zip(range_rows, range_starts, range_ends,
+                                                       lo.tolist(), hi.tolist()):
+        # Offsets from range_start, already in ascending order
+        matches = (common_unique_values[first:last] - range_start).tolist()
         
-        # Extract values from columns 2 and 3 (indices 1 and 2)
-        col2_values = []
-        col3_values = []
+        # Format as comma-separated string
+        matches_str = ','.join(map(str, matches))
         
-        for row in output_data:
-            if len(row) > 1 and row[1].strip():
-                try:
-                    col2_values.append(float(row[1]))
-                except ValueError:
-                    pass
+        # Add row to result: [col3, col5, col6, matches]
+        col3_value = row[2] if len(row) > 2 else ""
+        new_row = [col3_value, str(range_start), str(range_end), matches_str]
+        result.append(new_row)
+    
+    return result
+
+def process_csvs(met_file='metbases100.csv', ranges_file='gRNAlist.csv', result_file='range_matches.csv',
+                 overlapped=False, chunk_rows=100000, queue_depth=4):
+    """
+    List, for every range, the offsets of the single-occurrence values inside it.
+    
+    Args:
+        met_file (str): Path to the met bases CSV file
+        ranges_file (str): Path to the ranges CSV file
+        result_file (str): Path for the output CSV file
+        overlapped (bool): Read the ranges file and write the results in
+            background threads, in chunks of chunk_rows rows, while the met
+            file is scanned and the chunks are matched; the output is the same
+        chunk_rows (int): Rows per chunk in overlapped mode
+        queue_depth (int): Chunks allowed to wait between stages in overlapped mode
+    """
+    try:
+        if overlapped:
+            state = {'ranges': 0, 'matched': 0, 'preview': []}
             
-            if len(row) > 2 and row[2].strip():
-                try:
-                    col3_values.append(float(row[2]))
-                except ValueError:
-                    pass
-        
-        # Count occurrences in columns 2 and 3
-        col2_counter = Counter(col2_values)
-        col3_counter = Counter(col3_values)
-        
-        # Find values that appear exactly once in column 2
-        unique_col2_values = {value for value, count in col2_counter.items() if count == 1}
-        
-        # Find values that appear exactly once in column 3
-        unique_col3_values = {value for value, count in col3_counter.items() if count == 1}
-        
-        # Find values that appear exactly once in BOTH columns 2 and 3
-        common_unique_values = unique_col2_values.intersection(unique_col3_values)
-        
-        # Read gRNAlist.csv
-        addrange_data = []
-        with open('gRNAlist.csv', 'r', newline='') as addrange_file:
-            csv_reader = csv.reader(addrange_file)
-            for row in csv_reader:
-                addrange_data.append(row)
-        
-        # Process each row in gRNAlist.csv and find matches
-        result = []
-        
-        for row in addrange_data:
-            if len(row) > 5:  # Ensure row has at least 6 columns
-                try:
-                    # Get the range start and end (5th and 6th columns, indices 4 and 5)
-                    range_start = float(row[4]) if row[4].strip() else None
-                    range_end = float(row[5]) if row[5].strip() else None
-                    
-                    if range_start is not None and range_end is not None:
-                        # Find all values that appear exactly once in BOTH columns and fall within this range
-                        matches = []
-                        for value in common_unique_values:
-                            if range_start <= value <= range_end:
-                                # Calculate offset from range_start
-                                offset = value - range_start
-                                matches.append(offset)
-                        
-                        # Create a row for the result regardless of whether matches were found
-                        # Sort matches for better readability
-                        matches.sort()
-                        
-                        # Format as comma-separated string
-                        matches_str = ','.join(map(str, matches))
-                        
-                        # Add row to result: [col3, col5, col6, matches]
-                        col3_value = row[2] if len(row) > 2 else ""
-                        new_row = [col3_value, str(range_start), str(range_end), matches_str]
-                        result.append(new_row)
-                        
-                except ValueError:
-                    # Skip rows with non-numeric values in range columns
-                    pass
-        
-        # Write result to a new CSV file
-        with open('range_matches.csv', 'w', newline='') as result_file:
-            csv_writer = csv.writer(result_file)
-            csv_writer.writerows(result)
+            def setup():
+                state['values'] = single_occurrence_values(met_file)
+            
+            def process(rows):
+                chunk_result = match_ranges(rows, state['values'])
+                state['ranges'] += len(chunk_result)
+                state['matched'] += len([r for r in chunk_result if r[3]])
+                state['preview'] += chunk_result[:5 - len(state['preview'])]
+                return chunk_result
+            
+            run_overlapped(batched(read_rows(ranges_file), chunk_rows), process,
+                           lambda results: write_rows(result_file, itertools.chain.from_iterable(results)),
+                           queue_depth, setup)
+            total_ranges, ranges_matched, result = state['ranges'], state['matched'], state['preview']
+        else:
+            common_unique_values = single_occurrence_values(met_file)
+            
+            # Read gRNAlist.csv
+            addrange_data = list(read_rows(ranges_file))
+            result = match_ranges(addrange_data, common_unique_values)
+            total_ranges = len(result)
+            ranges_matched = len([r for r in result if r[3]])
+            
+            # Write result to a new CSV file
+            write_rows(result_file, result)
         
         print(f"Processing complete!")
-        print(f"Total valid ranges processed: {len(result)}")
-        print(f"Ranges with matches: {len([r for r in result if r[3]])}")
-        print(f"Results saved to 'range_matches.csv'")
+        print(f"Total valid ranges processed: {total_ranges}")
+        print(f"Ranges with matches: {ranges_matched}")
+        print(f"Results saved to '{result_file}'")
         
         # Display first few rows as preview
         print("\nFirst few rows of the result:")
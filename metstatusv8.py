@@ -1,7 +1,14 @@
 import pandas as pd
 import numpy as np
 import gc
+import io
+import os
 from collections import defaultdict
+from bgzf import group_spans, imap_ordered, is_bgzf, read_span
+from joinkernel import join_ranges, resolve_engine
+from stagetimer import JsonLinesEmitter, peak_rss_mb, register_hook, span
+from overlap import run_overlapped
+from tableio import csv_column_dtypes, read_table, read_table_chunks, table_format, write_table
 
 def match_csvs_optimized(met75_file, gRNA_file, output_file):
     """
@@ -13,135 +20,152 @@ def match_csvs_optimized(met75_file, gRNA_file, output_file):
     """
     
     print("Reading CSV files...")
-    met75_df = pd.read_csv(met75_file)
-    gRNA_df = pd.read_csv(gRNA_file)
+    with span('read_met') as stage:
+        met75_df = read_table(met75_file)
+        stage.rows = len(met75_df)
+    with span('read_gRNA') as stage:
+        gRNA_df = read_table(gRNA_file)
+        stage.rows = len(gRNA_df)
     
     print(f"met75trimfix.csv shape: {met75_df.shape}")
     print(f"gRNAranges.csv shape: {gRNA_df.shape}")
     
-    # Clean met75 data with vectorized operations
-    print("Cleaning met75 data...")
-    met75_df['pos'] = pd.to_numeric(met75_df.iloc[:, 0], errors='coerce')
-    met75_df['third_col_val'] = met75_df.iloc[:, 2]
-    met75_df['match_val'] = met75_df.iloc[:, 3]
-    
-    # Drop NaN values in one operation
-    met75_clean = met75_df.dropna(subset=['pos', 'match_val']).copy()
-    del met75_df
-    gc.collect()
+    with span('clean_met') as stage:
+        # Clean met75 data with vectorized operations
+        print("Cleaning met75 data...")
+        met75_df['pos'] = pd.to_numeric(met75_df.iloc[:, 0], errors='coerce')
+        met75_df['third_col_val'] = met75_df.iloc[:, 2]
+        met75_df['match_val'] = met75_df.iloc[:, 3]
+        
+        # Drop NaN values in one operation
+        met75_clean = met75_df.dropna(subset=['pos', 'match_val']).copy()
+        del met75_df
+        gc.collect()
+        stage.rows = len(met75_clean)
     
     print(f"met75 after cleaning: {len(met75_clean)} rows")
     
-    # Create optimized lookup using defaultdict and numpy arrays
-    print("Creating optimized lookup...")
-    lookup = defaultdict(lambda: {'pos': [], 'val': []})
-    
-    # Vectorized groupby operation
-    for match_val, group in met75_clean.groupby('match_val'):
-        lookup[match_val]['pos'] = group['pos'].values
-        lookup[match_val]['val'] = group['third_col_val'].values
-    
-    del met75_clean
-    gc.collect()
+    with span('build_lookup') as stage:
+        # Create optimized lookup using defaultdict and numpy arrays
+        print("Creating optimized lookup...")
+        lookup = defaultdict(lambda: {'pos': [], 'val': []})
+        
+        # Vectorized groupby operation
+        for match_val, group in met75_clean.groupby('match_val'):
+            lookup[match_val]['pos'] = group['pos'].values
+            lookup[match_val]['val'] = group['third_col_val'].values
+        
+        stage.rows = len(met75_clean)
+        del met75_clean
+        gc.collect()
     
     print(f"Created lookup for {len(lookup)} unique match values")
     
-    # Clean gRNA data with vectorized operations
-    print("Cleaning gRNA data...")
-    gRNA_df['range_start'] = pd.to_numeric(gRNA_df.iloc[:, 4], errors='coerce')
-    gRNA_df['range_end'] = pd.to_numeric(gRNA_df.iloc[:, 5], errors='coerce')
-    gRNA_df['match_val'] = gRNA_df.iloc[:, 7]
-    gRNA_df['strand'] = gRNA_df['Strand'] if 'Strand' in gRNA_df.columns else None
+    with span('clean_gRNA') as stage:
+        # Clean gRNA data with vectorized operations
+        print("Cleaning gRNA data...")
+        gRNA_df['range_start'] = pd.to_numeric(gRNA_df.iloc[:, 4], errors='coerce')
+        gRNA_df['range_end'] = pd.to_numeric(gRNA_df.iloc[:, 5], errors='coerce')
+        gRNA_df['match_val'] = gRNA_df.iloc[:, 7]
+        gRNA_df['strand'] = gRNA_df['Strand'] if 'Strand' in gRNA_df.columns else None
+        stage.rows = len(gRNA_df)
     
-    # Initialize result columns
-    gRNA_df['matched_positions'] = ''
-    gRNA_df['matched_third_col_values'] = ''
-    gRNA_df['has_matches'] = 'n'
+    # Result buffers, attached to the frame in one step after matching
+    matched_positions = np.full(len(gRNA_df), '', dtype=object)
+    matched_values = np.full(len(gRNA_df), '', dtype=object)
+    has_matches = np.full(len(gRNA_df), 'n', dtype=object)
     
     # Get valid rows (non-NaN) for bulk processing
     valid_mask = ~(gRNA_df['range_start'].isna() | gRNA_df['range_end'].isna() | gRNA_df['match_val'].isna())
-    valid_indices = gRNA_df[valid_mask].index.tolist()
+    valid_rows = np.flatnonzero(valid_mask.to_numpy())
     
-    print(f"Processing {len(valid_indices)} valid rows...")
+    print(f"Processing {len(valid_rows)} valid rows...")
     
-    # Process in larger, more efficient chunks
-    chunk_size = 5000  # Larger chunks for better efficiency
-    total_chunks = len(valid_indices) // chunk_size + (1 if len(valid_indices) % chunk_size != 0 else 0)
-    
-    matches_found = 0
+    # Plain arrays for the hot loop instead of per-row .loc lookups
+    range_starts = gRNA_df['range_start'].to_numpy()
+    range_ends = gRNA_df['range_end'].to_numpy()
+    match_vals = gRNA_df['match_val'].to_numpy()
+    strands = gRNA_df['strand'].to_numpy()
     
-    for chunk_idx in range(total_chunks):
-        start_idx = chunk_idx * chunk_size
-        end_idx = min((chunk_idx + 1) * chunk_size, len(valid_indices))
-        chunk_indices = valid_indices[start_idx:end_idx]
+    with span('match', rows=len(valid_rows)) as stage:
+        # Process in larger, more efficient chunks
+        chunk_size = 5000  # Larger chunks for better efficiency
+        total_chunks = len(valid_rows) // chunk_size + (1 if len(valid_rows) % chunk_size != 0 else 0)
         
-        print(f"Processing chunk {chunk_idx + 1}/{total_chunks} ({len(chunk_indices)} rows)...")
+        matches_found = 0
         
-        # Extract chunk data for vectorized operations
-        chunk_data = gRNA_df.loc[chunk_indices, ['range_start', 'range_end', 'match_val', 'strand']].copy()
-        
-        # Process each row in the chunk
-        for idx in chunk_indices:
-            row = chunk_data.loc[idx]
-            match_val = row['match_val']
-            
-            # Skip if match_val not in lookup
-            if match_val not in lookup:
-                continue
-            
-            # Get positions and values for this match_val
-            positions = lookup[match_val]['pos']
-            values = lookup[match_val]['val']
+        for chunk_idx in range(total_chunks):
+            chunk_rows = valid_rows[chunk_idx * chunk_size:(chunk_idx + 1) * chunk_size]
             
-            # Use vectorized operations for range filtering
-            range_start = row['range_start']
-            range_end = row['range_end']
+            print(f"Processing chunk {chunk_idx + 1}/{total_chunks} ({len(chunk_rows)} rows)...")
             
-            # Vectorized boolean mask for range filtering
-            mask = (positions >= range_start) & (positions <= range_end)
-            
-            if np.any(mask):
-                matching_positions = positions[mask]
-                matching_values = values[mask]
+            # Process each row in the chunk
+            for row in chunk_rows.tolist():
+                match_val = match_vals[row]
                 
-                # Vectorized position adjustment
-                adjusted_positions = matching_positions - range_start
+                # Skip if match_val not in lookup
+                if match_val not in lookup:
+                    continue
                 
-                # Apply strand-specific calculations
-                strand = row['strand']
-                if pd.notna(strand):
-                    if strand == '+':
-                        final_positions = adjusted_positions + 2
-                    elif strand == '-':
-                        final_positions = 28 - adjusted_positions
-                    else:
-                        final_positions = adjusted_positions
-                else:
-                    final_positions = adjusted_positions
+                # Get positions and values for this match_val
+                positions = lookup[match_val]['pos']
+                values = lookup[match_val]['val']
                 
-                # Sort by position using argsort for efficiency
-                sort_indices = np.argsort(final_positions)
-                sorted_positions = final_positions[sort_indices]
-                sorted_values = matching_values[sort_indices]
+                # Use vectorized operations for range filtering
+                range_start = range_starts[row]
+                range_end = range_ends[row]
                 
-                # Convert to strings efficiently
-                pos_strings = [str(int(pos)) for pos in sorted_positions]
-                val_strings = [str(val) for val in sorted_values]
+                # Vectorized boolean mask for range filtering
+                mask = (positions >= range_start) & (positions <= range_end)
                 
-                # Update dataframe
-                gRNA_df.loc[idx, 'matched_positions'] = ','.join(pos_strings)
-                gRNA_df.loc[idx, 'matched_third_col_values'] = ','.join(val_strings)
-                gRNA_df.loc[idx, 'has_matches'] = 'y'
-                matches_found += 1
-        
-        # Less frequent garbage collection
-        if chunk_idx % 10 == 0:
-            gc.collect()
+                if np.any(mask):
+                    matching_positions = positions[mask]
+                    matching_values = values[mask]
+                    
+                    # Vectorized position adjustment
+                    adjusted_positions = matching_positions - range_start
+                    
+                    # Apply strand-specific calculations
+                    strand = strands[row]
+                    if pd.notna(strand):
+                        if strand == '+':
+                            final_positions = adjusted_positions + 2
+                        elif strand == '-':
+                            final_positions = 28 - adjusted_positions
+                        else:
+                            final_positions = adjusted_positions
+                    else:
+                        final_positions = adjusted_positions
+                    
+                    # Sort by position using argsort for efficiency
+                    sort_indices = np.argsort(final_positions)
+                    sorted_positions = final_positions[sort_indices]
+                    sorted_values = matching_values[sort_indices]
+                    
+                    # Convert to strings efficiently
+                    pos_strings = [str(int(pos)) for pos in sorted_positions]
+                    val_strings = [str(val) for val in sorted_values]
+                    
+                    # Buffer results
+                    matched_positions[row] = ','.join(pos_strings)
+                    matched_values[row] = ','.join(val_strings)
+                    has_matches[row] = 'y'
+                    matches_found += 1
+            
+            # Less frequent garbage collection
+            if chunk_idx % 10 == 0:
+                gc.collect()
+        stage.note(matches=matches_found)
+    
+    gRNA_df['matched_positions'] = matched_positions
+    gRNA_df['matched_third_col_values'] = matched_values
+    gRNA_df['has_matches'] = has_matches
     
     print("Saving results...")
-    gRNA_df.to_csv(output_file, index=False)
+    with span('write', rows=len(gRNA_df)):
+        write_table(gRNA_df, output_file)
     print(f"Results saved to {output_file}")
-    print(f"Total rows with matches: {matches_found} out of {len(valid_indices)}")
+    print(f"Total rows with matches: {matches_found} out of {len(valid_rows)}")
     
     return gRNA_df
 
@@ -153,119 +177,860 @@ def match_csvs_ultra_fast(met75_file, gRNA_file, output_file):
     
     # Read files
     print("Reading files...")
-    met75_df = pd.read_csv(met75_file)
-    gRNA_df = pd.read_csv(gRNA_file)
+    with span('read_met') as stage:
+        met75_df = read_table(met75_file)
+        stage.rows = len(met75_df)
+    with span('read_gRNA') as stage:
+        gRNA_df = read_table(gRNA_file)
+        stage.rows = len(gRNA_df)
     
     # Clean met75 data
     print("Processing met75 data...")
-    met75_df['pos'] = pd.to_numeric(met75_df.iloc[:, 0], errors='coerce')
-    met75_df['third_col_val'] = met75_df.iloc[:, 2]
-    met75_df['match_val'] = met75_df.iloc[:, 3]
-    met75_clean = met75_df.dropna(subset=['pos', 'match_val'])
+    with span('clean_met') as stage:
+        met75_df['pos'] = pd.to_numeric(met75_df.iloc[:, 0], errors='coerce')
+        met75_df['third_col_val'] = met75_df.iloc[:, 2]
+        met75_df['match_val'] = met75_df.iloc[:, 3]
+        met75_clean = met75_df.dropna(subset=['pos', 'match_val'])
+        stage.rows = len(met75_clean)
     
     # Create highly optimized lookup
     print("Creating ultra-fast lookup...")
-    lookup_dict = {}
-    
-    # Group and convert to numpy arrays for maximum speed
-    grouped = met75_clean.groupby('match_val')
-    for match_val, group in grouped:
-        lookup_dict[match_val] = {
-            'positions': group['pos'].values,
-            'values': group['third_col_val'].values
-        }
+    with span('build_lookup') as stage:
+        lookup_dict = {}
+        
+        # Group and convert to numpy arrays for maximum speed
+        grouped = met75_clean.groupby('match_val')
+        for match_val, group in grouped:
+            lookup_dict[match_val] = {
+                'positions': group['pos'].values,
+                'values': group['third_col_val'].values
+            }
+        stage.rows = len(met75_clean)
     
     del met75_df, met75_clean
     gc.collect()
     
     # Clean gRNA data
     print("Processing gRNA data...")
-    gRNA_df['range_start'] = pd.to_numeric(gRNA_df.iloc[:, 4], errors='coerce')
-    gRNA_df['range_end'] = pd.to_numeric(gRNA_df.iloc[:, 5], errors='coerce')
-    gRNA_df['match_val'] = gRNA_df.iloc[:, 7]
-    gRNA_df['strand'] = gRNA_df.get('Strand', None)
+    with span('clean_gRNA') as stage:
+        gRNA_df['range_start'] = pd.to_numeric(gRNA_df.iloc[:, 4], errors='coerce')
+        gRNA_df['range_end'] = pd.to_numeric(gRNA_df.iloc[:, 5], errors='coerce')
+        gRNA_df['match_val'] = gRNA_df.iloc[:, 7]
+        gRNA_df['strand'] = gRNA_df.get('Strand', None)
+        stage.rows = len(gRNA_df)
     
-    # Initialize result columns
-    gRNA_df['matched_positions'] = ''
-    gRNA_df['matched_third_col_values'] = ''
-    gRNA_df['has_matches'] = 'n'
+    # Result buffers, attached to the frame in one step after matching
+    matched_positions = np.full(len(gRNA_df), '', dtype=object)
+    matched_values = np.full(len(gRNA_df), '', dtype=object)
+    has_matches = np.full(len(gRNA_df), 'n', dtype=object)
     
     # Filter valid rows
     valid_mask = ~(gRNA_df['range_start'].isna() | gRNA_df['range_end'].isna() | gRNA_df['match_val'].isna())
-    valid_df = gRNA_df[valid_mask].copy()
+    valid_rows = np.flatnonzero(valid_mask.to_numpy())
     
-    print(f"Processing {len(valid_df)} valid rows...")
+    print(f"Processing {len(valid_rows)} valid rows...")
     
-    # Process in large chunks for maximum efficiency
-    chunk_size = 10000
-    total_processed = 0
-    matches_found = 0
+    # Column arrays for the valid rows, iterated with zip instead of iterrows
+    range_starts = gRNA_df['range_start'].to_numpy()[valid_rows]
+    range_ends = gRNA_df['range_end'].to_numpy()[valid_rows]
+    match_vals = gRNA_df['match_val'].to_numpy()[valid_rows]
+    strands = gRNA_df['strand'].to_numpy()[valid_rows]
     
-    for i in range(0, len(valid_df), chunk_size):
-        chunk = valid_df.iloc[i:i+chunk_size]
-        print(f"Processing chunk {i//chunk_size + 1}/{(len(valid_df)-1)//chunk_size + 1}...")
+    with span('match', rows=len(valid_rows)) as stage:
+        # Process in large chunks for maximum efficiency
+        chunk_size = 10000
+        total_processed = 0
+        matches_found = 0
         
-        for idx, row in chunk.iterrows():
-            match_val = row['match_val']
+        for i in range(0, len(valid_rows), chunk_size):
+            print(f"Processing chunk {i//chunk_size + 1}/{(len(valid_rows)-1)//chunk_size + 1}...")
             
-            if match_val in lookup_dict:
-                positions = lookup_dict[match_val]['positions']
-                values = lookup_dict[match_val]['values']
-                
-                # Vectorized range check
-                range_start = row['range_start']
-                range_end = row['range_end']
-                mask = (positions >= range_start) & (positions <= range_end)
-                
-                if np.sum(mask) > 0:  # Use np.sum for speed
-                    matching_pos = positions[mask]
-                    matching_vals = values[mask]
+            chunk = zip(valid_rows[i:i+chunk_size].tolist(),
+                        match_vals[i:i+chunk_size],
+                        range_starts[i:i+chunk_size],
+                        range_ends[i:i+chunk_size],
+                        strands[i:i+chunk_size])
+            
+            for row, match_val, range_start, range_end, strand in chunk:
+                if match_val in lookup_dict:
+                    positions = lookup_dict[match_val]['positions']
+                    values = lookup_dict[match_val]['values']
                     
-                    # Vectorized calculations
-                    adjusted_pos = matching_pos - range_start
+                    # Vectorized range check
+                    mask = (positions >= range_start) & (positions <= range_end)
                     
-                    # Strand calculations
-                    strand = row['strand']
-                    if pd.notna(strand):
-                        if strand == '+':
-                            final_pos = adjusted_pos + 2
-                        elif strand == '-':
-                            final_pos = 28 - adjusted_pos
+                    if np.sum(mask) > 0:  # Use np.sum for speed
+                        matching_pos = positions[mask]
+                        matching_vals = values[mask]
+                        
+                        # Vectorized calculations
+                        adjusted_pos = matching_pos - range_start
+                        
+                        # Strand calculations
+                        if pd.notna(strand):
+                            if strand == '+':
+                                final_pos = adjusted_pos + 2
+                            elif strand == '-':
+                                final_pos = 28 - adjusted_pos
+                            else:
+                                final_pos = adjusted_pos
                         else:
                             final_pos = adjusted_pos
-                    else:
-                        final_pos = adjusted_pos
-                    
-                    # Sort efficiently
-                    sort_idx = np.argsort(final_pos)
-                    sorted_pos = final_pos[sort_idx]
-                    sorted_vals = matching_vals[sort_idx]
-                    
-                    # Convert to strings
-                    pos_str = ','.join(str(int(p)) for p in sorted_pos)
-                    val_str = ','.join(str(v) for v in sorted_vals)
-                    
-                    # Update results
-                    gRNA_df.loc[idx, 'matched_positions'] = pos_str
-                    gRNA_df.loc[idx, 'matched_third_col_values'] = val_str
-                    gRNA_df.loc[idx, 'has_matches'] = 'y'
-                    matches_found += 1
-            
-            total_processed += 1
-            if total_processed % 5000 == 0:
-                print(f"Processed {total_processed} rows, found {matches_found} matches")
+                        
+                        # Sort efficiently
+                        sort_idx = np.argsort(final_pos)
+                        sorted_pos = final_pos[sort_idx]
+                        sorted_vals = matching_vals[sort_idx]
+                        
+                        # Convert to strings
+                        pos_str = ','.join(str(int(p)) for p in sorted_pos)
+                        val_str = ','.join(str(v) for v in sorted_vals)
+                        
+                        # Buffer results
+                        matched_positions[row] = pos_str
+                        matched_values[row] = val_str
+                        has_matches[row] = 'y'
+                        matches_found += 1
+                
+                total_processed += 1
+                if total_processed % 5000 == 0:
+                    print(f"Processed {total_processed} rows, found {matches_found} matches")
+        stage.note(matches=matches_found)
+    
+    gRNA_df['matched_positions'] = matched_positions
+    gRNA_df['matched_third_col_values'] = matched_values
+    gRNA_df['has_matches'] = has_matches
+    
+    print("Saving results...")
+    with span('write', rows=len(gRNA_df)):
+        write_table(gRNA_df, output_file)
+    print(f"Results saved to {output_file}")
+    print(f"Total matches found: {matches_found}")
+    
+    return gRNA_df
+
+def smallest_int(values):
+    """Return an integer array as int32 when all its values fit, else as int64; other arrays are returned as they are"""
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.integer):
+        return values
+    limits = np.iinfo(np.int32)
+    if len(values) and (values.min() < limits.min or values.max() > limits.max):
+        return values.astype(np.int64, copy=False)
+    return values.astype(np.int32, copy=False)
+
+def make_lookup_entry(positions, values):
+    """
+    Sort one match_val group by position and return its lookup entry.
+    
+    Groups with repeated positions also keep the sort permutation and a running
+    count of ties so that ranges covering a tie can be ordered exactly like the
+    per-row argsort of the other engines. Integer arrays are stored as int32
+    whenever their values allow it.
+    """
+    order = np.argsort(positions, kind='stable')
+    positions = smallest_int(positions[order])
+    ties = positions[1:] == positions[:-1]
+    entry = {
+        'positions': positions,
+        'values': values[order],
+        'file_order': None,
+        'tie_counts': None
+    }
+    if ties.any():
+        entry['file_order'] = smallest_int(order)
+        entry['tie_counts'] = smallest_int(np.concatenate(([0], np.cumsum(ties))))
+    return entry
+
+def infer_categories(categories):
+    """Give numeric match_val categories the numeric type a full read_csv would infer"""
+    try:
+        return pd.to_numeric(categories)
+    except (ValueError, TypeError):
+        return categories
+
+def lookup_keys(names):
+    """
+    Map every lookup key to the parsed match_val names it stands for.
+    
+    The key type is inferred once over the names from all chunks, as a single
+    read_csv of the whole file would, so a chromosome is never keyed 1 in one
+    chunk and '1' in another chunk that also holds 'X'.
+    """
+    keys = defaultdict(list)
+    for name, key in zip(names, infer_categories(pd.Index(names))):
+        keys[key].append(name)
+    return keys
+
+def whole_positions(positions):
+    """
+    Return float positions as int64 when every one is a whole number. Otherwise
+    they stay float64, so fractional positions are compared with the ranges
+    like the per-row engines compare them instead of being truncated.
+    """
+    if np.all(np.isfinite(positions)) and np.all(positions == np.floor(positions)):
+        return positions.astype(np.int64)
+    return positions
+
+def split_met_chunk(chunk, value_dtype):
+    """
+    Split parsed met75 rows (position, value, match_val columns) by match_val.
+    
+    Returns a list of (match_val, positions, values) with file order kept
+    inside each group. match_val is the category as parsed; its key type is
+    only decided once every chunk has been seen (see lookup_keys). Rows
+    without a position or match_val are dropped, as the whole-file engines do.
+    """
+    positions = pd.to_numeric(chunk.iloc[:, 0], errors='coerce').to_numpy(dtype=np.float64)
+    if value_dtype is None:
+        values = chunk.iloc[:, 1].to_numpy()
+    else:
+        values = pd.to_numeric(chunk.iloc[:, 1], errors='coerce').to_numpy(dtype=value_dtype)
+    match_vals = chunk.iloc[:, 2]
+    if not isinstance(match_vals.dtype, pd.CategoricalDtype):
+        # Binary formats keep their own column types
+        match_vals = match_vals.astype('category')
+    codes = match_vals.cat.codes.to_numpy()
+    categories = match_vals.cat.categories
+    
+    keep = ~np.isnan(positions) & (codes >= 0)
+    positions = whole_positions(positions[keep])
+    values = values[keep]
+    codes = codes[keep]
+    
+    order = np.argsort(codes, kind='stable')
+    split_at = np.flatnonzero(np.diff(codes[order])) + 1
+    return [(categories[codes[idx[0]]], positions[idx], values[idx])
+            for idx in np.split(order, split_at) if len(idx)]
+
+def parse_met_lines(data, value_dtype):
+    """Parse complete headerless met75 CSV lines (bytes) into split_met_chunk parts and a row count"""
+    if not data.strip():
+        return [], 0
+    chunk = pd.read_csv(io.BytesIO(data), header=None, usecols=[0, 2, 3], dtype={3: 'category'})
+    return split_met_chunk(chunk, value_dtype), len(chunk)
+
+def parse_bgzf_span(met75_file, offset, length, value_dtype):
+    """
+    Worker task: decompress a run of BGZF blocks and parse the lines that lie
+    entirely inside it.
+    
+    Returns (head, parts, rows, tail) where head is the text up to and
+    including the first newline and tail the text after the last one; both
+    belong to lines that cross into the neighbouring spans. parts is None if
+    the span holds no newline at all.
+    """
+    data = read_span(met75_file, offset, length)
+    first = data.find(b'\n')
+    if first < 0:
+        return data, None, 0, b''
+    last = data.rfind(b'\n')
+    parts, rows = parse_met_lines(data[first + 1:last + 1], value_dtype)
+    return data[:first + 1], parts, rows, data[last + 1:]
+
+def read_bgzf_met_parts(met75_file, value_dtype, processes=None):
+    """
+    Yield (parts, rows) for a BGZF met75 file in file order, with the blocks
+    decompressed and parsed in parallel worker processes.
+    
+    Lines that cross a span boundary are stitched together and parsed here;
+    the first line is the header and is skipped.
+    """
+    tasks = [(met75_file, offset, length, value_dtype) for offset, length in group_spans(met75_file)]
+    carry = b''
+    header_seen = False
+    for head, parts, rows, tail in imap_ordered(parse_bgzf_span, tasks, processes):
+        if parts is None:
+            carry += head
+            continue
+        if header_seen:
+            stitched, stitched_rows = parse_met_lines(carry + head, value_dtype)
+            parts, rows = stitched + parts, stitched_rows + rows
+        header_seen = True
+        yield parts, rows
+        carry = tail
+    if header_seen:
+        yield parse_met_lines(carry, value_dtype)
+
+def met_value_dtype(met75_file, chunksize):
+    """
+    The dtype read_csv gives the value column (column 3) of the whole met75
+    CSV file, found chunksize rows at a time. None for binary tables, whose
+    columns keep their stored type, and for empty files.
+    """
+    if table_format(met75_file) != 'csv':
+        return None
+    dtypes = csv_column_dtypes(met75_file, chunksize, usecols=[2])
+    return next(iter(dtypes.values()), None)
+
+def build_lookup_chunked(met75_file, chunksize=1000000, value_dtype=np.float32, processes=None):
+    """
+    Build the sorted lookup by streaming the met75 file in fixed-size chunks.
+    
+    Only columns 1, 3 and 4 (position, value, match_val) are parsed. Positions
+    are stored as int32/int64 (float64 if some are fractional), values as
+    value_dtype and match_val is read as a categorical, so peak memory follows
+    the size of the lookup rather than the size of the CSV text.
+    
+    Gzip compressed files are read directly. A BGZF file (bgzip output) read
+    in chunks is instead split into runs of blocks that worker processes
+    decompress and parse in parallel, with no temporary files.
+    
+    Args:
+        met75_file (str): Path to the met75 CSV file
+        chunksize (int): Number of rows parsed per chunk, or None to parse the
+            file in one piece
+        value_dtype: dtype for methylation values; np.float64 keeps the exact
+            text of values with more than 7 significant digits, and None keeps
+            the values exactly as read_csv parses the whole file. In chunks,
+            that takes a first pass over the value column to find its type,
+            so that integer or text values print as a whole-file read does
+        processes (int): Worker processes for BGZF input (default: CPU count)
+    """
+    pos_parts = defaultdict(list)
+    val_parts = defaultdict(list)
+    rows_read = 0
+    
+    read_dtypes = {3: 'category'}
+    if chunksize is not None and value_dtype is None:
+        value_type = met_value_dtype(met75_file, chunksize)
+        if value_type is not None:
+            read_dtypes[2] = value_type
+    
+    if chunksize is None:
+        chunks = [read_table(met75_file, usecols=[0, 2, 3], dtype=read_dtypes)]
+    elif value_dtype is not None and table_format(met75_file) == 'csv' and is_bgzf(met75_file):
+        print("Parsing BGZF blocks in parallel...")
+        chunks = None
+        parsed = read_bgzf_met_parts(met75_file, value_dtype, processes)
+    else:
+        chunks = read_table_chunks(met75_file, chunksize, usecols=[0, 2, 3], dtype=read_dtypes)
+    if chunks is not None:
+        parsed = ((split_met_chunk(chunk, value_dtype), len(chunk)) for chunk in chunks)
+    
+    part_numbers = defaultdict(list)
+    for number, (parts, rows) in enumerate(parsed):
+        for match_val, positions, values in parts:
+            pos_parts[match_val].append(positions)
+            val_parts[match_val].append(values)
+            part_numbers[match_val].append(number)
+        if rows:
+            rows_read += rows
+            print(f"Read {rows_read} met75 rows...")
+    
+    lookup_dict = {}
+    for key, names in lookup_keys(list(pos_parts)).items():
+        numbers = [number for name in names for number in part_numbers.pop(name)]
+        positions = [part for name in names for part in pos_parts.pop(name)]
+        values = [part for name in names for part in val_parts.pop(name)]
+        # Names that give the same key, such as '1' and '1.0', are merged back
+        # in chunk order
+        order = np.argsort(numbers, kind='stable')
+        lookup_dict[key] = make_lookup_entry(np.concatenate([positions[i] for i in order]),
+                                             np.concatenate([values[i] for i in order]))
+    return lookup_dict
+
+def strand_adjust(adjusted, is_plus, is_minus):
+    """Apply the strand offset transform: +2 for '+', 28 - x for '-'."""
+    return np.where(is_plus, adjusted + 2, np.where(is_minus, 28 - adjusted, adjusted))
+
+def reorder_tied_ranges(entry, tied, lo, hi, seg_starts, range_starts, strands, final_positions,
+                        matched_values):
+    """
+    Redo the ranges in tied, which cover repeated positions, from file order
+    with the same argsort the per-row engines use, so ties come out identically.
+    """
+    positions = entry['positions']
+    for j in tied:
+        perm = np.argsort(entry['file_order'][lo[j]:hi[j]])
+        final = strand_adjust(positions[lo[j]:hi[j]][perm] - range_starts[j], strands[j] == '+', strands[j] == '-')
+        sort_idx = np.argsort(final)
+        seg = slice(seg_starts[j], seg_starts[j] + hi[j] - lo[j])
+        final_positions[seg] = final[sort_idx]
+        matched_values[seg] = entry['values'][lo[j]:hi[j]][perm][sort_idx]
+
+def join_group_ranges(entry, range_starts, range_ends, strands, engine='auto'):
+    """
+    Resolve a batch of gRNA ranges against one sorted lookup group.
+    
+    Returns (counts, final_positions, matched_values) where the flat arrays hold
+    every hit of every range, range after range, already strand-adjusted and in
+    output order.
+    
+    With engine='numba' the join, strand transform and hit ordering run in one
+    compiled loop per group (see joinkernel); 'numpy' uses vectorized NumPy
+    calls and 'auto' picks numba when it is installed. Both give identical hits.
+    """
+    if resolve_engine(engine) == 'numba':
+        lo, hi, counts, idx, final_positions, has_tie = join_ranges(
+            entry['positions'], entry['tie_counts'], range_starts, range_ends, strands)
+        matched_values = entry['values'][idx]
+        if has_tie.any():
+            reorder_tied_ranges(entry, np.flatnonzero(has_tie), lo, hi, np.cumsum(counts) - counts, range_starts,
+                                strands, final_positions, matched_values)
+        return counts, final_positions, matched_values
+    
+    positions = entry['positions']
+    lo = np.searchsorted(positions, range_starts, side='left')
+    hi = np.searchsorted(positions, range_ends, side='right')
+    counts = np.maximum(hi - lo, 0)
+    
+    total = int(counts.sum())
+    seg_starts = np.cumsum(counts) - counts
+    offsets = np.arange(total) - np.repeat(seg_starts, counts)
+    
+    plus = strands == '+'
+    minus = strands == '-'
+    is_plus = np.repeat(plus, counts)
+    is_minus = np.repeat(minus, counts)
+    # '-' strand hits come out in descending position order, which is the
+    # range walked backwards
+    idx = np.where(is_minus,
+                   np.repeat(hi - 1, counts) - offsets,
+                   np.repeat(lo, counts) + offsets)
+    
+    adjusted = positions[idx] - np.repeat(range_starts, counts)
+    final_positions = strand_adjust(adjusted, is_plus, is_minus)
+    matched_values = entry['values'][idx]
+    
+    if entry['tie_counts'] is not None:
+        last = np.maximum(hi - 1, lo)
+        tie_counts = entry['tie_counts']
+        has_tie = (counts > 1) & (tie_counts[np.minimum(last, len(positions) - 1)]
+                                  - tie_counts[np.minimum(lo, len(positions) - 1)] > 0)
+        reorder_tied_ranges(entry, np.flatnonzero(has_tie), lo, hi, seg_starts, range_starts, strands,
+                            final_positions, matched_values)
+    
+    return counts, final_positions, matched_values
+
+def prepare_gRNA_df(gRNA_df):
+    """
+    Add the range_start, range_end, match_val and strand working columns.
+    
+    Returns a boolean array marking rows with a usable range and match_val.
+    """
+    gRNA_df['range_start'] = pd.to_numeric(gRNA_df.iloc[:, 4], errors='coerce')
+    gRNA_df['range_end'] = pd.to_numeric(gRNA_df.iloc[:, 5], errors='coerce')
+    # Categoricals hold each distinct match_val and strand once
+    gRNA_df['match_val'] = gRNA_df.iloc[:, 7].astype('category')
+    strand = gRNA_df.get('Strand', None)
+    gRNA_df['strand'] = None if strand is None else strand.astype('category')
+    
+    valid_mask = ~(gRNA_df['range_start'].isna() | gRNA_df['range_end'].isna() | gRNA_df['match_val'].isna())
+    return valid_mask.to_numpy()
+
+def group_gRNA_rows(gRNA_df, valid_mask):
+    """Map each match_val to the row numbers of the valid gRNA rows that use it"""
+    row_numbers = np.flatnonzero(valid_mask)
+    groups = gRNA_df['match_val'].iloc[row_numbers].groupby(
+        gRNA_df['match_val'].iloc[row_numbers], sort=False).indices
+    return {match_val: row_numbers[rows] for match_val, rows in groups.items()}
+
+def match_group_strings(entry, range_starts, range_ends, strands, engine='auto'):
+    """
+    Match a batch of ranges against one lookup group and format the hits.
+    
+    Returns (matched, pos_strings, val_strings): the indices within the batch of
+    ranges with at least one hit, and their comma-joined positions and values.
+    """
+    counts, final_pos, hit_vals = join_group_ranges(entry, range_starts, range_ends, strands, engine)
+    
+    # Convert to strings once per group, then slice per range
+    pos_strs = final_pos.astype(np.int64).astype(str).tolist()
+    val_strs = [str(v) for v in hit_vals]
+    ends = np.cumsum(counts).tolist()
+    
+    matched = np.flatnonzero(counts)
+    pos_strings = [','.join(pos_strs[ends[i] - counts[i]:ends[i]]) for i in matched.tolist()]
+    val_strings = [','.join(val_strs[ends[i] - counts[i]:ends[i]]) for i in matched.tolist()]
+    return matched, pos_strings, val_strings
+
+def new_result_buffers(n_rows):
+    """
+    Preallocated matched_positions, matched_third_col_values and has_matches
+    columns. has_matches is boolean until write_results renders it.
+    """
+    return (np.full(n_rows, '', dtype=object),
+            np.full(n_rows, '', dtype=object),
+            np.zeros(n_rows, dtype=bool))
+
+def attach_results(gRNA_df, matched_positions, matched_values, has_matches):
+    """Attach the result buffers to the gRNA frame in one step"""
+    gRNA_df['matched_positions'] = matched_positions
+    gRNA_df['matched_third_col_values'] = matched_values
+    gRNA_df['has_matches'] = has_matches
+
+def render_has_matches(gRNA_df):
+    """Replace the boolean has_matches column with its 'y'/'n' output form"""
+    gRNA_df['has_matches'] = np.where(gRNA_df['has_matches'].to_numpy(dtype=bool), 'y', 'n').astype(object)
+
+def write_results(gRNA_df, output_file):
+    """Render the boolean has_matches column as 'y'/'n' and write the result frame"""
+    render_has_matches(gRNA_df)
+    write_table(gRNA_df, output_file)
+
+def write_result_chunks(chunks, output_file):
+    """
+    Stream result frames to one CSV file, in order, with the header written once.
+    
+    The text is the same as writing the concatenated frame with write_results.
+    """
+    with open(output_file, 'w', newline='') as outfile:
+        for number, chunk in enumerate(chunks):
+            render_has_matches(chunk)
+            chunk.to_csv(outfile, index=False, header=number == 0)
+
+def match_sorted_lookup(gRNA_df, lookup_dict, engine='auto'):
+    """
+    Match every gRNA range against a sorted lookup and attach the result columns.
+    
+    Returns the number of gRNA rows with at least one match. engine is passed
+    to join_group_ranges.
+    """
+    valid_mask = prepare_gRNA_df(gRNA_df)
+    
+    print(f"Processing {int(valid_mask.sum())} valid rows...")
+    
+    matched_positions, matched_values, has_matches = new_result_buffers(len(gRNA_df))
+    range_starts = gRNA_df['range_start'].to_numpy()
+    range_ends = gRNA_df['range_end'].to_numpy()
+    strands = gRNA_df['strand'].to_numpy()
+    matches_found = 0
+    
+    for match_val, rows in group_gRNA_rows(gRNA_df, valid_mask).items():
+        if match_val not in lookup_dict:
+            continue
+        
+        matched, pos_strings, val_strings = match_group_strings(
+            lookup_dict[match_val], range_starts[rows], range_ends[rows], strands[rows], engine)
+        
+        hit_rows = rows[matched]
+        matched_positions[hit_rows] = pos_strings
+        matched_values[hit_rows] = val_strings
+        has_matches[hit_rows] = True
+        matches_found += len(hit_rows)
+        
+        print(f"Matched {len(rows)} ranges for {match_val}")
+    
+    attach_results(gRNA_df, matched_positions, matched_values, has_matches)
+    
+    return matches_found
+
+def match_long_format(gRNA_df, lookup_dict, engine='auto'):
+    """
+    Match every gRNA range against a sorted lookup in long format.
+    
+    Returns a DataFrame with one row per (gRNA, matched site): the gRNA row
+    number, the strand-adjusted position and the methylation value. Rows come
+    in gRNA order and, within a gRNA, in the order of matched_positions. The
+    columns are built from concatenated NumPy arrays, with no per-hit strings.
+    """
+    valid_mask = prepare_gRNA_df(gRNA_df)
+    
+    print(f"Processing {int(valid_mask.sum())} valid rows...")
+    
+    range_starts = gRNA_df['range_start'].to_numpy()
+    range_ends = gRNA_df['range_end'].to_numpy()
+    strands = gRNA_df['strand'].to_numpy()
+    row_parts = []
+    pos_parts = []
+    val_parts = []
+    
+    for match_val, rows in group_gRNA_rows(gRNA_df, valid_mask).items():
+        if match_val not in lookup_dict:
+            continue
+        
+        counts, final_pos, hit_vals = join_group_ranges(
+            lookup_dict[match_val], range_starts[rows], range_ends[rows], strands[rows], engine)
+        
+        row_parts.append(np.repeat(rows, counts))
+        pos_parts.append(final_pos.astype(np.int64))
+        val_parts.append(hit_vals)
+    
+    if not row_parts:
+        return pd.DataFrame({'gRNA_row': np.array([], dtype=np.int64),
+                             'position': np.array([], dtype=np.int64),
+                             'value': np.array([])})
+    
+    gRNA_rows = np.concatenate(row_parts)
+    # Groups were matched one after another; a stable sort on the row number
+    # restores gRNA order and keeps each gRNA's hits in output order
+    order = np.argsort(gRNA_rows, kind='stable')
+    return pd.DataFrame({
+        'gRNA_row': gRNA_rows[order],
+        'position': np.concatenate(pos_parts)[order],
+        'value': np.concatenate(val_parts)[order]
+    })
+
+# Sites at or above this methylation value count as methylated in summaries
+METHYLATED_THRESHOLD = 0.5
+
+# Per-gRNA columns written by the summary layout
+SUMMARY_COLUMNS = ['match_count', 'mean_value', 'std_value', 'min_value', 'max_value', 'fraction_methylated']
+
+def prefix_sums(values, threshold=METHYLATED_THRESHOLD):
+    """
+    Cumulative sums over one group's values in position order, each starting at 0.
+    
+    Returns counts of non-missing values, their sums, sums of squares and
+    counts of methylated values, so that any run values[lo:hi] is summarised
+    from two entries of each array. Sums are accumulated in extended precision
+    because a range's sum is the difference of two large running totals.
+    """
+    values = pd.to_numeric(np.asarray(values), errors='coerce').astype(np.float64)
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    sums = {
+        'count': present,
+        'sum': filled,
+        'sum_sq': filled * filled,
+        'methylated': present & (values >= threshold)
+    }
+    dtypes = {'count': np.int64, 'sum': np.longdouble, 'sum_sq': np.longdouble, 'methylated': np.int64}
+    return {name: np.concatenate(([0], np.cumsum(part, dtype=dtypes[name]))) for name, part in sums.items()}
+
+def range_extremes(values, lo, hi):
+    """
+    Min and max of the non-missing values[lo:hi] for every range.
+    
+    Each comes from one np.minimum.reduceat or np.maximum.reduceat call over
+    the lo and hi bounds of all ranges taken in turn. The ranges are taken in
+    order of lo, so the reductions between one range's hi and the next one's
+    lo never cover a value twice: the work follows the group size plus the
+    number of sites matched, and memory only the number of ranges. A sentinel
+    after the last value lets hi reach the end of the group.
+    """
+    if not len(lo):
+        return np.empty(0), np.empty(0)
+    values = pd.to_numeric(np.asarray(values), errors='coerce').astype(np.float64)
+    missing = np.isnan(values)
+    order = np.argsort(lo, kind='stable')
+    bounds = np.column_stack((lo[order], hi[order])).ravel()
+    # Every other reduction is over [lo, hi) of one range
+    mins = np.empty(len(lo))
+    maxs = np.empty(len(lo))
+    mins[order] = np.minimum.reduceat(np.append(np.where(missing, np.inf, values), np.inf), bounds)[::2]
+    maxs[order] = np.maximum.reduceat(np.append(np.where(missing, -np.inf, values), -np.inf), bounds)[::2]
+    
+    # reduceat gives values[lo] for an empty range, and +-inf marks ranges of missing values
+    empty = hi <= lo
+    mins[empty | np.isinf(mins)] = np.nan
+    maxs[empty | np.isinf(maxs)] = np.nan
+    return mins, maxs
+
+def summarize_group_ranges(entry, range_starts, range_ends, threshold=METHYLATED_THRESHOLD):
+    """
+    Summarise the hits of a batch of gRNA ranges against one lookup group
+    without listing them.
+    
+    Returns a dict with one array per SUMMARY_COLUMNS entry. match_count counts
+    every matched site; the value statistics skip missing values and are NaN
+    when there are none. std_value is the population standard deviation.
+    """
+    positions = entry['positions']
+    lo = np.searchsorted(positions, range_starts, side='left')
+    hi = np.maximum(np.searchsorted(positions, range_ends, side='right'), lo)
+    
+    sums = prefix_sums(entry['values'], threshold)
+    present, total, total_sq, methylated = (sums[name][hi] - sums[name][lo]
+                                            for name in ('count', 'sum', 'sum_sq', 'methylated'))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(present > 0, total / present, np.nan)
+        variance = np.where(present > 0, total_sq / present - mean * mean, np.nan)
+        fraction = np.where(present > 0, methylated / present, np.nan)
+    mean, variance = mean.astype(np.float64), variance.astype(np.float64)
+    mins, maxs = range_extremes(entry['values'], lo, hi)
+    
+    # Ranges of equal values (single sites included) get their exact value
+    # and spread, not the rounding left over from the running totals
+    constant = mins == maxs
+    mean[constant] = mins[constant]
+    variance[constant] = 0
+    
+    return {
+        'match_count': hi - lo,
+        'mean_value': np.clip(mean, mins, maxs),
+        # Differences of prefix sums can dip just below zero
+        'std_value': np.sqrt(np.maximum(variance, 0)),
+        'min_value': mins,
+        'max_value': maxs,
+        'fraction_methylated': fraction
+    }
+
+def match_summary_lookup(gRNA_df, lookup_dict, threshold=METHYLATED_THRESHOLD):
+    """
+    Match every gRNA range against a sorted lookup and attach per-gRNA
+    summary columns (SUMMARY_COLUMNS and has_matches) instead of hit lists.
+    
+    Returns the number of gRNA rows with at least one match.
+    """
+    valid_mask = prepare_gRNA_df(gRNA_df)
+    
+    print(f"Processing {int(valid_mask.sum())} valid rows...")
+    
+    summary = {col: np.full(len(gRNA_df), np.nan) for col in SUMMARY_COLUMNS}
+    summary['match_count'] = np.zeros(len(gRNA_df), dtype=np.int64)
+    range_starts = gRNA_df['range_start'].to_numpy()
+    range_ends = gRNA_df['range_end'].to_numpy()
+    
+    for match_val, rows in group_gRNA_rows(gRNA_df, valid_mask).items():
+        if match_val not in lookup_dict:
+            continue
+        
+        group_summary = summarize_group_ranges(lookup_dict[match_val], range_starts[rows], range_ends[rows],
+                                               threshold)
+        for col in SUMMARY_COLUMNS:
+            summary[col][rows] = group_summary[col]
+        
+        print(f"Summarised {len(rows)} ranges for {match_val}")
+    
+    for col in SUMMARY_COLUMNS:
+        gRNA_df[col] = summary[col]
+    gRNA_df['has_matches'] = summary['match_count'] > 0
+    
+    return int((summary['match_count'] > 0).sum())
+
+def match_csvs_sorted(met75_file, gRNA_file, output_file, chunksize=None, value_dtype=np.float32,
+                      layout='wide', engine='auto', threshold=METHYLATED_THRESHOLD):
+    """
+    Sorted interval-join version: each lookup group is sorted once and all gRNA
+    ranges of that group are resolved together with np.searchsorted.
+    Output is identical to match_csvs_ultra_fast.
+    
+    Args:
+        met75_file (str): Path to the met75 CSV file
+        gRNA_file (str): Path to the gRNA ranges CSV file
+        output_file (str): Path for the output CSV file
+        chunksize (int): If given, stream the met75 file in chunks of this many
+            rows with build_lookup_chunked instead of loading it whole
+        value_dtype: dtype for methylation values when streaming, or None to
+            keep them as a whole-file read parses them; without chunksize the
+            values are always kept as parsed, so output stays exact
+        layout (str): 'wide' adds comma-joined match columns to the gRNA rows;
+            'long' writes one (gRNA_row, position, value) row per matched site;
+            'summary' adds per-gRNA count, mean, std, min, max and fraction
+            methylated columns computed from prefix sums, with no hit lists
+        engine (str): Join implementation for the wide and long layouts:
+            'numba' (compiled kernel), 'numpy' or 'auto' (numba if installed)
+        threshold (float): For the summary layout, the value at or above which
+            a site counts as methylated in fraction_methylated
+    """
+    if layout not in ('wide', 'long', 'summary'):
+        raise ValueError(f"Unknown layout '{layout}'. Choose 'wide', 'long' or 'summary'")
+    engine = resolve_engine(engine)
+    
+    print(f"Using sorted interval-join approach ({engine} engine)...")
+    print(f"Peak memory before reading met75: {peak_rss_mb():.1f} MB")
+    
+    if chunksize:
+        print(f"Streaming met75 data in chunks of {chunksize} rows...")
+        with span('build_lookup', chunksize=chunksize) as stage:
+            lookup_dict = build_lookup_chunked(met75_file, chunksize, value_dtype)
+            stage.rows = sum(len(entry['positions']) for entry in lookup_dict.values())
+    else:
+        # Parse only position, value and match_val, with match_val as a
+        # categorical; values are kept exactly as read_csv parses them
+        print("Reading met75 file...")
+        with span('build_lookup') as stage:
+            lookup_dict = build_lookup_chunked(met75_file, chunksize=None, value_dtype=None)
+            stage.rows = sum(len(entry['positions']) for entry in lookup_dict.values())
+        gc.collect()
+    
+    print(f"Peak memory after building lookup: {peak_rss_mb():.1f} MB")
+    
+    # Read and clean gRNA data
+    print("Processing gRNA data...")
+    with span('read_gRNA') as stage:
+        gRNA_df = read_table(gRNA_file)
+        stage.rows = len(gRNA_df)
+    
+    if layout == 'long':
+        with span('match', rows=len(gRNA_df), layout=layout) as stage:
+            long_df = match_long_format(gRNA_df, lookup_dict, engine)
+            stage.note(matches=len(long_df))
+        
+        print("Saving results...")
+        with span('write', rows=len(long_df)):
+            write_table(long_df, output_file)
+        print(f"Results saved to {output_file}")
+        print(f"Total matched sites: {len(long_df)} for {long_df['gRNA_row'].nunique()} gRNAs")
+        
+        return long_df
+    
+    with span('match', rows=len(gRNA_df), layout=layout) as stage:
+        if layout == 'summary':
+            matches_found = match_summary_lookup(gRNA_df, lookup_dict, threshold)
+        else:
+            matches_found = match_sorted_lookup(gRNA_df, lookup_dict, engine)
+        stage.note(matches=matches_found)
     
     print("Saving results...")
-    gRNA_df.to_csv(output_file, index=False)
+    with span('write', rows=len(gRNA_df)):
+        write_results(gRNA_df, output_file)
     print(f"Results saved to {output_file}")
     print(f"Total matches found: {matches_found}")
     
     return gRNA_df
 
+def match_csvs_overlapped(met75_file, gRNA_file, output_file, chunk_rows=100000, queue_depth=4,
+                          chunksize=None, value_dtype=np.float32):
+    """
+    Sorted interval-join matching with reading, matching and writing overlapped.
+    
+    A reader thread loads the gRNA file while the met75 lookup is being built,
+    then hands it on in slices of chunk_rows rows through a bounded queue. The
+    calling thread matches each slice and a writer thread streams finished
+    slices to the output CSV, so disk and CPU work at the same time. The gRNA
+    file is parsed whole rather than in chunks so that every column gets the
+    same dtype as in match_csvs_sorted, whose output this reproduces exactly.
+    
+    Args:
+        met75_file (str): Path to the met75 CSV file
+        gRNA_file (str): Path to the gRNA ranges CSV file
+        output_file (str): Path for the output CSV file
+        chunk_rows (int): gRNA rows matched and written per slice
+        queue_depth (int): Slices allowed to wait between stages
+        chunksize (int): If given, stream the met75 file in chunks of this many rows
+        value_dtype: dtype for methylation values when streaming
+    """
+    if table_format(output_file) != 'csv':
+        raise ValueError("Overlapped writing streams CSV text; use match_csvs_sorted for other formats")
+    
+    print(f"Using overlapped approach ({chunk_rows} rows per chunk, queue depth {queue_depth})...")
+    state = {'matches': 0, 'rows': 0}
+    
+    def gRNA_chunks():
+        gRNA_df = read_table(gRNA_file)
+        print(f"Read {len(gRNA_df)} gRNA rows")
+        for start in range(0, max(len(gRNA_df), 1), chunk_rows):
+            yield gRNA_df.iloc[start:start + chunk_rows].copy()
+    
+    def build_lookup():
+        print("Building met75 lookup...")
+        state['lookup'] = build_lookup_chunked(met75_file, chunksize, value_dtype if chunksize else None)
+        print(f"Peak memory after building lookup: {peak_rss_mb():.1f} MB")
+    
+    def match_chunk(chunk):
+        state['matches'] += match_sorted_lookup(chunk, state['lookup'])
+        state['rows'] += len(chunk)
+        return chunk
+    
+    with span('overlapped', queue_depth=queue_depth) as stage:
+        chunks = run_overlapped(gRNA_chunks(), match_chunk,
+                                lambda results: write_result_chunks(results, output_file),
+                                queue_depth, setup=build_lookup)
+        stage.rows = state['rows']
+        stage.note(chunks=chunks, matches=state['matches'])
+    
+    print(f"Results saved to {output_file}")
+    print(f"Total matches found: {state['matches']}")
+    
+    return state['matches']
+
 def get_file_info(filename):
     """Helper function to get basic file information"""
     try:
-        df = pd.read_csv(filename, nrows=5)
+        df = read_table(filename, nrows=5)
         return {
             'columns': df.columns.tolist(),
             'shape_preview': f"~{len(df)} rows (showing first 5)",
@@ -281,6 +1046,10 @@ if __name__ == "__main__":
     gRNA_file = "gRNAranges.csv"
     output_file = "matched_results75_v8.csv"
     
+    # Set METSTATUS_SPANS to a file path to record per-stage timings as JSON lines
+    if os.environ.get('METSTATUS_SPANS'):
+        register_hook(JsonLinesEmitter(os.environ['METSTATUS_SPANS']))
+    
     # Check file info
     print("Checking file information...")
     print("met75trimfix.csv info:")
@@ -289,9 +1058,9 @@ if __name__ == "__main__":
     print(get_file_info(gRNA_file))
     
     try:
-        # Try ultra-fast version first
-        print("\nTrying ultra-fast approach...")
-        result = match_csvs_ultra_fast(met75_file, gRNA_file, output_file)
+        # Try sorted interval-join version first
+        print("\nTrying sorted interval-join approach...")
+        result = match_csvs_sorted(met75_file, gRNA_file, output_file)
         
         # Display results
         print("\nFirst 5 rows of results:")
@@ -307,12 +1076,20 @@ if __name__ == "__main__":
         print(match_summary)
         
     except Exception as e:
-        print(f"Ultra-fast approach failed: {e}")
-        print("Trying optimized approach...")
+        print(f"Sorted interval-join approach failed: {e}")
+        print("Trying chunked ingestion approach...")
         
         try:
-            result = match_csvs_optimized(met75_file, gRNA_file, output_file)
-            print("Optimized approach completed successfully")
+            # Values keep the type the whole-file read above gives them, so
+            # integer and text values print the same
+            result = match_csvs_sorted(met75_file, gRNA_file, output_file, chunksize=1000000,
+                                       value_dtype=None)
+            print("Chunked ingestion approach completed successfully")
         except Exception as e2:
-            print(f"All optimized approaches failed. Error: {e2}")
-            print("Consider using a machine with more RAM or splitting files into smaller chunks.")
\ No newline at end of file
+            print(f"Chunked ingestion approach failed: {e2}")
+            # Spills sorted runs to disk; METSTATUS_MAX_MEMORY sets its budget in MB
+            print("Trying out-of-core approach...")
+            from externalmatch import DEFAULT_MAX_MEMORY_MB, match_csvs_external
+            max_memory_mb = float(os.environ.get('METSTATUS_MAX_MEMORY', DEFAULT_MAX_MEMORY_MB))
+            match_csvs_external(met75_file, gRNA_file, output_file, max_memory_mb)
+            print("Out-of-core approach completed successfully")
\ No newline at end of file
@@ -0,0 +1,160 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from metstatusv8 import (attach_results, build_lookup_chunked, group_gRNA_rows, match_group_strings,
+                         new_result_buffers, peak_rss_mb, prepare_gRNA_df, write_results)
+from tableio import read_table, write_table
+
+# Prepared gRNA ranges, sent once to each worker process
+_worker_ranges = None
+
+def _init_worker(ranges):
+    """Keep the prepared gRNA ranges in the worker for every sample it matches"""
+    global _worker_ranges
+    _worker_ranges = ranges
+
+def sample_names(met_files):
+    """Column suffix for each met file: its base name, made unique if needed"""
+    names = []
+    for met_file in met_files:
+        name = os.path.splitext(os.path.basename(met_file))[0]
+        candidate, number = name, 2
+        while candidate in names:
+            candidate = f"{name}_{number}"
+            number += 1
+        names.append(candidate)
+    return names
+
+def match_sample(met_file, chunksize=None, value_dtype=np.float32, ranges=None):
+    """
+    Build one sample's sorted lookup and match the shared gRNA ranges against it.
+    
+    Returns (hit_rows, pos_strings, val_strings) for the gRNA rows with at least
+    one match.
+    
+    Args:
+        met_file (str): Path to the sample's met CSV file
+        chunksize (int): If given, stream the met file in chunks of this many rows
+        value_dtype: dtype for methylation values when streaming
+        ranges (tuple): (range_starts, range_ends, strands, groups); defaults to
+            the ranges given to the worker process
+    """
+    range_starts, range_ends, strands, groups = ranges if ranges is not None else _worker_ranges
+    lookup_dict = build_lookup_chunked(met_file, chunksize, value_dtype if chunksize else None)
+    
+    hit_parts = []
+    pos_strings = []
+    val_strings = []
+    for match_val, rows in groups.items():
+        if match_val not in lookup_dict:
+            continue
+        matched, group_pos, group_val = match_group_strings(
+            lookup_dict[match_val], range_starts[rows], range_ends[rows], strands[rows])
+        hit_parts.append(rows[matched])
+        pos_strings += group_pos
+        val_strings += group_val
+    
+    hit_rows = np.concatenate(hit_parts) if hit_parts else np.empty(0, dtype=np.int64)
+    print(f"Matched {met_file}: {len(hit_rows)} gRNAs with matches")
+    return hit_rows, pos_strings, val_strings
+
+def match_csvs_multi(met_files, gRNA_file, output_file, per_sample_files=False, processes=None,
+                     chunksize=None, value_dtype=np.float32):
+    """
+    Match several met files against one gRNA list in a single pass.
+    
+    The gRNA file is read, validated and grouped by match_val once; every
+    sample is then matched against the same prepared ranges, in parallel
+    worker processes when more than one is allowed. Each worker holds one
+    sample's lookup at a time, so lower processes to bound memory.
+    
+    Args:
+        met_files (list): Paths to the met CSV files, one per sample
+        gRNA_file (str): Path to the gRNA ranges CSV file
+        output_file (str): Output path. With per_sample_files it must contain
+            '{sample}', which is replaced by each sample's name
+        per_sample_files (bool): Write one file per sample, identical to the
+            match_csvs_sorted output, instead of one file with
+            matched_positions_<sample>, matched_third_col_values_<sample> and
+            has_matches_<sample> columns for every sample
+        processes (int): Worker processes (default: one per sample, up to the CPU count)
+        chunksize (int): If given, stream each met file in chunks of this many rows
+        value_dtype: dtype for methylation values when streaming
+    """
+    if per_sample_files and '{sample}' not in output_file:
+        raise ValueError("output_file must contain '{sample}' when writing one file per sample")
+    if processes is None:
+        processes = min(len(met_files), os.cpu_count() or 1)
+    
+    names = sample_names(met_files)
+    print(f"Matching {len(met_files)} samples with {processes} processes...")
+    
+    print("Processing gRNA data...")
+    gRNA_df = read_table(gRNA_file)
+    valid_mask = prepare_gRNA_df(gRNA_df)
+    print(f"Processing {int(valid_mask.sum())} valid rows...")
+    ranges = (gRNA_df['range_start'].to_numpy(),
+              gRNA_df['range_end'].to_numpy(),
+              gRNA_df['strand'].to_numpy(),
+              group_gRNA_rows(gRNA_df, valid_mask))
+    
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(ranges,)) as executor:
+            futures = [executor.submit(match_sample, met_file, chunksize, value_dtype)
+                       for met_file in met_files]
+            results = [future.result() for future in futures]
+    else:
+        results = [match_sample(met_file, chunksize, value_dtype, ranges) for met_file in met_files]
+    
+    print(f"Peak memory after matching: {peak_rss_mb():.1f} MB")
+    
+    sample_columns = {}
+    for name, (hit_rows, pos_strings, val_strings) in zip(names, results):
+        matched_positions, matched_values, has_matches = new_result_buffers(len(gRNA_df))
+        matched_positions[hit_rows] = pos_strings
+        matched_values[hit_rows] = val_strings
+        has_matches[hit_rows] = True
+        print(f"{name}: {len(hit_rows)} matches")
+        
+        if per_sample_files:
+            sample_file = output_file.replace('{sample}', name)
+            attach_results(gRNA_df, matched_positions, matched_values, has_matches)
+            write_results(gRNA_df, sample_file)
+            print(f"Results saved to {sample_file}")
+        else:
+            sample_columns[f'matched_positions_{name}'] = matched_positions
+            sample_columns[f'matched_third_col_values_{name}'] = matched_values
+            sample_columns[f'has_matches_{name}'] = np.where(has_matches, 'y', 'n').astype(object)
+    
+    if not per_sample_files:
+        for column, values in sample_columns.items():
+            gRNA_df[column] = values
+        write_table(gRNA_df, output_file)
+        print(f"Results saved to {output_file}")
+    
+    return gRNA_df
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Match several met files against one gRNA file in one pass")
+    parser.add_argument('gRNA_file', help="gRNA ranges CSV file")
+    parser.add_argument('output_file',
+                        help="Output file; with --per-sample it must contain {sample}")
+    parser.add_argument('met_files', nargs='+', help="One met CSV file per sample")
+    parser.add_argument('--per-sample', action='store_true',
+                        help="Write one output file per sample instead of one combined file")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Worker processes (default: one per sample, up to the CPU count)")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="Stream each met file in chunks of this many rows")
+    args = parser.parse_args()
+    
+    match_csvs_multi(args.met_files, args.gRNA_file, args.output_file, args.per_sample,
+                     args.processes, args.chunksize)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
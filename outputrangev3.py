@@ -1,115 +1,142 @@
-import csv
-from collections import Counter, defaultdict
+import itertools
+from array import array
+import numpy as np
+from overlap import batched, run_overlapped
+from tableio import read_rows, write_rows
 
-def process_csvs():
-    try:
-        # Read output.csv
-        output_data = []
-        with open('output100.csv', 'r', newline='') as output_file:
-            csv_reader = csv.reader(output_file)
-            for row in csv_reader:
-                output_data.append(row)
+def single_occurrence_values(sites_file):
+    """
+    Sorted values that occur exactly once in column 2 and exactly once in
+    column 3 of the sites file, where the two occurrences do not share the
+    same column 6 character.
+    """
+    # Stream output.csv into compact arrays instead of keeping every row.
+    # Values from columns 2 and 3 (indices 1 and 2) go into float arrays and
+    # the character in column 6 (index 5) of the same row into an int code
+    # array, with -1 standing for an empty column 6.
+    col2_values = array('d')
+    col3_values = array('d')
+    col2_col6_codes = array('i')
+    col3_col6_codes = array('i')
+    col6_codes = {}
+    
+    for row in read_rows(sites_file):
+        code = -1
+        if len(row) > 5 and row[5].strip():
+            code = col6_codes.setdefault(row[5], len(col6_codes))
         
-        # Extract values from columns 2, 3, and 6 (indices 1, 2, and 5)
-        col2_values = []
-        col3_values = []
-        # Map to track which values in col2 and col3 have which character in col6
-        col2_col6_map = defaultdict(set)
-        col3_col6_map = defaultdict(set)
+        if len(row) > 1 and row[1].strip():
+            try:
+                col2_values.append(float(row[1]))
+                col2_col6_codes.append(code)
+            except ValueError:
+                pass
         
-        for row in output_data:
-            if len(row) > 1 and row[1].strip():
-                try:
-                    value = float(row[1])
-                    col2_values.append(value)
-                    
-                    # Store character from col6 if it exists
-                    if len(row) > 5 and row[5].strip():
-                        col2_col6_map[value].add(row[5])
-                except ValueError:
-                    pass
+        if len(row) > 2 and row[2].strip():
+            try:
+                col3_values.append(float(row[2]))
+                col3_col6_codes.append(code)
+            except ValueError:
+                pass
+    
+    col2_values = np.frombuffer(col2_values, dtype=np.float64)
+    col3_values = np.frombuffer(col3_values, dtype=np.float64)
+    col2_col6_codes = np.frombuffer(col2_col6_codes, dtype=np.int32)
+    col3_col6_codes = np.frombuffer(col3_col6_codes, dtype=np.int32)
+    
+    # Values that appear exactly once in column 2 / column 3, together with
+    # the column 6 code of that single occurrence
+    col2_unique, col2_first, col2_counts = np.unique(col2_values, return_index=True, return_counts=True)
+    col3_unique, col3_first, col3_counts = np.unique(col3_values, return_index=True, return_counts=True)
+    once2 = col2_counts == 1
+    once3 = col3_counts == 1
+    
+    # Join the two sets of single-occurrence values
+    both_unique, in2, in3 = np.intersect1d(col2_unique[once2], col3_unique[once3],
+                                           assume_unique=True, return_indices=True)
+    code2 = col2_col6_codes[col2_first[once2][in2]]
+    code3 = col3_col6_codes[col3_first[once3][in3]]
+    
+    # The two occurrences must not share the same character in column 6
+    disjoint = (code2 == -1) | (code3 == -1) | (code2 != code3)
+    return both_unique[disjoint & ~np.isnan(both_unique)]
+
+def flag_rows(rows, match_values):
+    """
+    Append 'y' or 'n' to each addrange row depending on whether its column 6
+    minus 3 is one of match_values. Returns (flagged_rows, matches_found).
+    """
+    # Column 6 (index 5) shifted by 3, NaN where it is missing or not numeric
+    target_values = np.full(len(rows), np.nan)
+    for i, row in enumerate(rows):
+        if len(row) > 5 and row[5].strip():
+            try:
+                target_values[i] = float(row[5]) - 3
+            except ValueError:
+                pass
+    
+    # Single sorted join of the shifted column against the matching values
+    found = np.searchsorted(match_values, target_values)
+    in_bounds = found < len(match_values)
+    is_match = np.zeros(len(target_values), dtype=bool)
+    is_match[in_bounds] = match_values[found[in_bounds]] == target_values[in_bounds]
+    flags = np.where(is_match, 'y', 'n').tolist()
+    
+    flagged = [row + [flag] for row, flag in zip(rows, flags)]
+    return flagged, int(is_match.sum())
+
+def process_csvs(sites_file='output100.csv', addrange_file='addrangev2.csv', result_file='addrangev2_results.csv',
+                 overlapped=False, chunk_rows=100000, queue_depth=4):
+    """
+    Flag the addrange rows whose column 6 minus 3 is a single-occurrence value
+    of the sites file.
+    
+    Args:
+        sites_file (str): Path to the sites CSV file
+        addrange_file (str): Path to the addrange CSV file
+        result_file (str): Path for the output CSV file
+        overlapped (bool): Read the addrange file and write the results in
+            background threads, in chunks of chunk_rows rows, while the sites
+            file is scanned and the chunks are matched; the output is the same
+        chunk_rows (int): Rows per chunk in overlapped mode
+        queue_depth (int): Chunks allowed to wait between stages in overlapped mode
+    """
+    try:
+        if overlapped:
+            state = {'rows': 0, 'matches': 0, 'preview': []}
             
-            if len(row) > 2 and row[2].strip():
-                try:
-                    value = float(row[2])
-                    col3_values.append(value)
-                    
-                    # Store character from col6 if it exists
-                    if len(row) > 5 and row[5].strip():
-                        col3_col6_map[value].add(row[5])
-                except ValueError:
-                    pass
-        
-        # Count occurrences in columns 2 and 3
-        col2_counter = Counter(col2_values)
-        col3_counter = Counter(col3_values)
-        
-        # Find values that appear exactly once in column 2
-        unique_col2_values = {value for value, count in col2_counter.items() if count == 1}
-        
-        # Find values that appear exactly once in column 3
-        unique_col3_values = {value for value, count in col3_counter.items() if count == 1}
-        
-        # Read addrangev2.csv
-        addrange_data = []
-        with open('addrangev2.csv', 'r', newline='') as addrange_file:
-            csv_reader = csv.reader(addrange_file)
-            for row in csv_reader:
-                addrange_data.append(row)
-        
-        # Process each row in addrangev2.csv
-        result = []
-        matches_found = 0
-        non_matches = 0
-        
-        for row in addrange_data:
-            new_row = row.copy()
+            def setup():
+                state['match_values'] = single_occurrence_values(sites_file)
+            
+            def process(rows):
+                flagged, matches = flag_rows(rows, state['match_values'])
+                state['rows'] += len(rows)
+                state['matches'] += matches
+                state['preview'] += flagged[:5 - len(state['preview'])]
+                return flagged
+            
+            run_overlapped(batched(read_rows(addrange_file), chunk_rows), process,
+                           lambda results: write_rows(result_file, itertools.chain.from_iterable(results)),
+                           queue_depth, setup)
+            total_rows, matches_found, result = state['rows'], state['matches'], state['preview']
+        else:
+            match_values = single_occurrence_values(sites_file)
             
-            # Check column 6 (index 5)
-            if len(row) > 5 and row[5].strip():
-                try:
-                    value_to_check = float(row[5])
-                    target_value = value_to_check - 3
-                    
-                    # Check if target_value appears exactly once in both columns 2 and 3
-                    if (target_value in unique_col2_values and 
-                        target_value in unique_col3_values):
-                        
-                        # Check if values in columns 2 and 3 share the same character in column 6
-                        col2_chars = col2_col6_map.get(target_value, set())
-                        col3_chars = col3_col6_map.get(target_value, set())
-                        
-                        # If there's any character in common between col2 and col3, it's not a match
-                        common_chars = col2_chars.intersection(col3_chars)
-                        
-                        if not common_chars:
-                            new_row.append('y')
-                            matches_found += 1
-                        else:
-                            new_row.append('n')
-                            non_matches += 1
-                    else:
-                        new_row.append('n')
-                        non_matches += 1
-                except ValueError:
-                    new_row.append('n')
-                    non_matches += 1
-            else:
-                new_row.append('n')
-                non_matches += 1
+            # Read addrangev2.csv
+            addrange_data = list(read_rows(addrange_file))
+            result, matches_found = flag_rows(addrange_data, match_values)
+            total_rows = len(addrange_data)
             
-            result.append(new_row)
+            # Write result to a new CSV file
+            write_rows(result_file, result)
         
-        # Write result to a new CSV file
-        with open('addrangev2_results.csv', 'w', newline='') as result_file:
-            csv_writer = csv.writer(result_file)
-            csv_writer.writerows(result)
+        non_matches = total_rows - matches_found
         
         print(f"Processing complete!")
-        print(f"Total rows processed: {len(addrange_data)}")
+        print(f"Total rows processed: {total_rows}")
         print(f"Matches found: {matches_found}")
         print(f"Non-matches: {non_matches}")
-        print(f"Results saved to 'addrangev2_results.csv'")
+        print(f"Results saved to '{result_file}'")
         
         # Display first few rows as preview
         print("\nFirst few rows of the result:")
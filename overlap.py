@@ -0,0 +1,114 @@
+import itertools
+import queue
+import threading
+
+# Marks the end of a queue
+_DONE = object()
+
+def batched(rows, size):
+    """Yield lists of up to size items from an iterable"""
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def _put(q, item, stop):
+    """Put item on a bounded queue, giving up if another stage has failed"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _get(q, stop):
+    """Take the next item from a queue, or _DONE if another stage has failed"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+def _drain(q, stop):
+    """Yield queued items until the end marker"""
+    while True:
+        item = _get(q, stop)
+        if item is _DONE:
+            return
+        yield item
+
+def run_overlapped(chunks, process, write, queue_depth=4, setup=None):
+    """
+    Run a read -> process -> write pipeline with reading and writing in
+    background threads, so I/O overlaps with computation.
+    
+    A reader thread iterates chunks into a bounded queue, the calling thread
+    processes them one at a time, and a writer thread receives the results
+    through a second bounded queue. Results reach the writer in input order.
+    If any stage raises, the others stop and the exception is re-raised here.
+    
+    Args:
+        chunks: Iterable of input chunks; it is consumed in the reader thread
+        process: Function applied to each chunk in the calling thread
+        write: Function called once in the writer thread with an iterator
+            over the processed chunks
+        queue_depth (int): Maximum chunks waiting in each queue
+        setup: Optional function run in the calling thread after the reader
+            has started and before the first chunk is processed, e.g. to build
+            a lookup while the input is being read
+    
+    Returns the number of chunks processed.
+    """
+    if queue_depth < 1:
+        raise ValueError("queue_depth must be at least 1")
+    
+    read_queue = queue.Queue(maxsize=queue_depth)
+    write_queue = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+    errors = []
+    
+    def reader():
+        try:
+            for chunk in chunks:
+                if not _put(read_queue, chunk, stop):
+                    return
+            _put(read_queue, _DONE, stop)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+    
+    def writer():
+        try:
+            write(_drain(write_queue, stop))
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+    
+    threads = [threading.Thread(target=reader, name='overlap-reader', daemon=True),
+               threading.Thread(target=writer, name='overlap-writer', daemon=True)]
+    for thread in threads:
+        thread.start()
+    
+    processed = 0
+    try:
+        if setup is not None:
+            setup()
+        for chunk in _drain(read_queue, stop):
+            if not _put(write_queue, process(chunk), stop):
+                break
+            processed += 1
+        _put(write_queue, _DONE, stop)
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+    
+    if errors:
+        raise errors[0]
+    return processed
\ No newline at end of file
@@ -0,0 +1,111 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from metindex import DEFAULT_VALUE_DTYPE, default_index_dir, load_met_index, open_met_index
+from metstatusv8 import (attach_results, group_gRNA_rows, match_group_strings,
+                         new_result_buffers, prepare_gRNA_df, write_results)
+from tableio import read_table
+
+# Lookup opened once per worker process from the memory-mapped index
+_worker_lookup = None
+
+def _init_worker(index_dir):
+    """Open the index in each worker; the arrays are mapped, never pickled"""
+    global _worker_lookup
+    _worker_lookup = open_met_index(index_dir)
+
+def _match_task(match_val, rows, range_starts, range_ends, strands):
+    """Match one batch of gRNA rows that share a match_val"""
+    matched, pos_strings, val_strings = match_group_strings(
+        _worker_lookup[match_val], range_starts, range_ends, strands)
+    return rows[matched], pos_strings, val_strings
+
+def split_tasks(groups, lookup_dict, batch_size):
+    """
+    Yield (match_val, rows) work items, one per match_val, with groups larger
+    than batch_size gRNA rows split so that big chromosomes do not leave the
+    other workers idle.
+    """
+    for match_val, rows in groups.items():
+        if match_val not in lookup_dict:
+            continue
+        for start in range(0, len(rows), batch_size):
+            yield match_val, rows[start:start + batch_size]
+
+def match_csvs_parallel(met75_file, gRNA_file, output_file, index_dir=None,
+                        processes=None, batch_size=50000, value_dtype=DEFAULT_VALUE_DTYPE):
+    """
+    Sorted interval-join matching spread over a process pool, sharded by match_val.
+    
+    Workers read positions and values straight from the memory-mapped index
+    (built first if missing or stale), so only the gRNA ranges and the
+    formatted results cross process boundaries. Results are written back by
+    row number, so with the default index, whose values keep the type read_csv
+    gives the whole met75 file, the output is identical to match_csvs_sorted.
+    
+    Args:
+        met75_file (str): Path to the met75 CSV file
+        gRNA_file (str): Path to the gRNA ranges CSV file
+        output_file (str): Path for the output CSV file
+        index_dir (str): Index directory (default: <met75_file>.idx)
+        processes (int): Number of worker processes (default: all cores)
+        batch_size (int): Maximum number of gRNA rows per task
+        value_dtype: dtype of the index values, or None to keep them as
+            parsed; an index built for another value_dtype is rebuilt
+    """
+    if index_dir is None:
+        index_dir = default_index_dir(met75_file)
+    if processes is None:
+        processes = os.cpu_count()
+    
+    print(f"Using parallel approach with {processes} processes...")
+    lookup_dict = load_met_index(met75_file, index_dir, value_dtype=value_dtype)
+    
+    print("Processing gRNA data...")
+    gRNA_df = read_table(gRNA_file)
+    valid_mask = prepare_gRNA_df(gRNA_df)
+    
+    print(f"Processing {int(valid_mask.sum())} valid rows...")
+    
+    range_starts = gRNA_df['range_start'].to_numpy()
+    range_ends = gRNA_df['range_end'].to_numpy()
+    strands = gRNA_df['strand'].to_numpy()
+    matched_positions, matched_values, has_matches = new_result_buffers(len(gRNA_df))
+    matches_found = 0
+    
+    tasks = split_tasks(group_gRNA_rows(gRNA_df, valid_mask), lookup_dict, batch_size)
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(index_dir,)) as executor:
+        futures = [executor.submit(_match_task, match_val, rows,
+                                   range_starts[rows], range_ends[rows], strands[rows])
+                   for match_val, rows in tasks]
+        
+        for future in futures:
+            hit_rows, pos_strings, val_strings = future.result()
+            matched_positions[hit_rows] = pos_strings
+            matched_values[hit_rows] = val_strings
+            has_matches[hit_rows] = True
+            matches_found += len(hit_rows)
+    
+    print(f"Finished {len(futures)} tasks")
+    attach_results(gRNA_df, matched_positions, matched_values, has_matches)
+    
+    print("Saving results...")
+    write_results(gRNA_df, output_file)
+    print(f"Results saved to {output_file}")
+    print(f"Total matches found: {matches_found}")
+    
+    return gRNA_df
+
+def main():
+    if len(sys.argv) < 4:
+        print("Usage: python parallelmatch.py <met_csv_file> <gRNA_csv_file> <output_csv_file> [processes]")
+        print("Example: python parallelmatch.py met75trimfix.csv gRNAranges.csv matched_results75_v8.csv 32")
+        return
+    
+    processes = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    match_csvs_parallel(sys.argv[1], sys.argv[2], sys.argv[3], processes=processes)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,89 @@
+import argparse
+from functools import partial
+
+from cleanmatchdata import project_rows
+from matchguidefix import flag_rows
+from tableio import read_rows, write_rows
+from trimcoverage import coverage_rows
+
+# Stage names accepted by the CLI, in their usual order
+STAGE_NAMES = ['trim', 'clean', 'flag']
+
+def make_stage(name, threshold=10, columns_to_remove=(7, 9, 10, 11, 12), flag_column=4):
+    """
+    Return a rows -> rows generator function for one post-processing stage.
+    
+    Args:
+        name (str): 'trim' (trimcoverage filter), 'clean' (cleanmatchdata column
+            removal) or 'flag' (matchguidefix y/n flag)
+        threshold (float): Minimum column-10 value kept by 'trim'
+        columns_to_remove (list): Columns dropped by 'clean' (1-based)
+        flag_column (int): Column tested by 'flag' (1-based)
+    """
+    if name == 'trim':
+        return partial(coverage_rows, column=10, threshold=threshold)
+    if name == 'clean':
+        return partial(project_rows, columns_to_remove=columns_to_remove)
+    if name == 'flag':
+        return partial(flag_rows, column=flag_column)
+    raise ValueError(f"Unknown stage '{name}'. Choose from {STAGE_NAMES}")
+
+def run_pipeline(input_file, output_file, stages):
+    """
+    Stream rows from input_file through each stage in turn and write the result.
+    
+    Every row is read, transformed and written once, so no intermediate file is
+    produced and, for CSV, memory use does not grow with the file size.
+    
+    Args:
+        input_file (str): Path to the input file (CSV, Parquet, Feather or .npz)
+        output_file (str): Path for the output file (format from the extension)
+        stages (list): Functions taking an iterable of rows and yielding rows
+    
+    Returns:
+        (rows_read, rows_written)
+    """
+    counts = {'read': 0, 'written': 0}
+    
+    def count(rows, key):
+        for row in rows:
+            counts[key] += 1
+            yield row
+    
+    rows = count(read_rows(input_file, encoding='utf-8'), 'read')
+    for stage in stages:
+        rows = stage(rows)
+    write_rows(output_file, count(rows, 'written'), encoding='utf-8')
+    
+    return counts['read'], counts['written']
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run trimcoverage, cleanmatchdata and matchguidefix as one streaming pass")
+    parser.add_argument('input_file', help="Input CSV file")
+    parser.add_argument('output_file', help="Output CSV file")
+    parser.add_argument('--stages', default=','.join(STAGE_NAMES),
+                        help="Comma-separated stages to run in order (default: trim,clean,flag)")
+    parser.add_argument('--threshold', type=float, default=10,
+                        help="Minimum column-10 value kept by the trim stage (default: 10)")
+    parser.add_argument('--remove-columns', default='7,9,10,11,12',
+                        help="Columns removed by the clean stage, 1-based (default: 7,9,10,11,12)")
+    parser.add_argument('--flag-column', type=int, default=4,
+                        help="Column tested by the flag stage, 1-based (default: 4)")
+    args = parser.parse_args()
+    
+    columns_to_remove = [int(col) for col in args.remove_columns.split(',') if col]
+    stages = [make_stage(name.strip(), args.threshold, columns_to_remove, args.flag_column)
+              for name in args.stages.split(',') if name.strip()]
+    
+    try:
+        rows_read, rows_written = run_pipeline(args.input_file, args.output_file, stages)
+        print(f"Processed {rows_read} rows through stages {args.stages}")
+        print(f"Wrote {rows_written} rows to {args.output_file}")
+    except FileNotFoundError:
+        print(f"Error: File '{args.input_file}' not found.")
+    except Exception as e:
+        print(f"Error processing file: {e}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,426 @@
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from bgzf import block_range, block_table, decompressed_chunks, imap_ordered, is_bgzf, is_gzip, read_span
+from metindex import source_fingerprint
+from metstatusv8 import (group_gRNA_rows, infer_categories, make_lookup_entry, match_sorted_lookup,
+                         peak_rss_mb, prepare_gRNA_df, whole_positions, write_results)
+from tableio import read_table, widen_dtype
+
+REGION_INDEX_VERSION = 2
+# Uncompressed bytes of met75 text covered by one index bin
+DEFAULT_BIN_BYTES = 64 * 1024
+# Bytes of plain text read at a time while building the index
+PIECE_BYTES = 16 * 1024 * 1024
+
+def default_region_index(met75_file):
+    """Region index used when none is given: <met file>.rgi next to the file"""
+    return f"{met75_file}.rgi"
+
+def text_pieces(met75_file, compressed):
+    """Yield the uncompressed met75 text in order, in pieces of any size"""
+    if compressed:
+        yield from decompressed_chunks(met75_file)
+        return
+    with open(met75_file, 'rb') as infile:
+        yield from iter(lambda: infile.read(PIECE_BYTES), b'')
+
+class RegionIndexBuilder:
+    """
+    Collects the bins of a met75 file that is sorted by match_val and position.
+    
+    A bin is a run of consecutive lines of one match_val inside one
+    bin_bytes-sized stretch of the uncompressed text. Each bin records its
+    byte range, line count and lowest and highest position. The dtype read_csv
+    gives the value column of the whole file is collected on the way.
+    """
+    
+    def __init__(self, met75_file, bin_bytes):
+        self.met75_file = met75_file
+        self.bin_bytes = bin_bytes
+        self.names = []
+        self.group_ids = {}
+        self.bins = {field: [] for field in ('group', 'bucket', 'start', 'end', 'lines', 'first', 'last')}
+        self.last_position = None
+        self.value_dtype = None
+    
+    def not_sorted(self, detail):
+        return ValueError(f"'{self.met75_file}' must be sorted by match_val (column 4) and then by "
+                          f"position (column 1) to build a region index: {detail}")
+    
+    def group_codes(self, match_vals):
+        """Number each line's match_val in order of first appearance, checking groups are contiguous"""
+        # Lines without a match_val stay in the group around them
+        match_vals = match_vals.ffill()
+        if self.names:
+            match_vals = match_vals.fillna(self.names[-1])
+        # Lines before the first match_val belong to no group
+        match_vals = match_vals.fillna('')
+        
+        names = match_vals.to_numpy()
+        run_starts = np.flatnonzero(np.concatenate(([True], names[1:] != names[:-1])))
+        codes = np.empty(len(run_starts), dtype=np.int64)
+        for i, name in enumerate(match_vals.iloc[run_starts]):
+            if name == '':
+                codes[i] = -1
+                continue
+            if name not in self.group_ids:
+                self.group_ids[name] = len(self.names)
+                self.names.append(name)
+                self.last_position = None
+            elif self.group_ids[name] != len(self.names) - 1 or i > 0:
+                raise self.not_sorted(f"match_val {name} appears in more than one place")
+            codes[i] = self.group_ids[name]
+        return np.repeat(codes, np.diff(np.append(run_starts, len(match_vals))))
+    
+    def add_lines(self, data, base):
+        """Index complete lines of text starting at uncompressed offset base"""
+        if not data:
+            return
+        ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n')) + 1
+        if not data.endswith(b'\n'):
+            ends = np.append(ends, len(data))
+        starts = np.concatenate(([0], ends[:-1])) + base
+        ends = ends + base
+        
+        chunk = pd.read_csv(io.BytesIO(data), header=None, usecols=[0, 2, 3], dtype={3: str},
+                            skip_blank_lines=False)
+        if len(chunk) != len(starts):
+            raise ValueError(f"'{self.met75_file}' has quoted line breaks and cannot be region indexed")
+        # A whole-file read skips blank lines, so they must not turn integer values into floats
+        blank = ends - starts <= 2
+        if not blank.any():
+            self.value_dtype = widen_dtype(self.value_dtype, chunk[2].dtype)
+        elif not blank.all():
+            value_dtype = pd.read_csv(io.BytesIO(data), header=None, usecols=[2])[2].dtype
+            self.value_dtype = widen_dtype(self.value_dtype, value_dtype)
+        positions = pd.to_numeric(chunk[0], errors='coerce').to_numpy(dtype=np.float64)
+        # Lines without a match_val are never loaded, so they do not count as positions
+        positions = np.where(chunk[3].isna().to_numpy(), np.nan, positions)
+        codes = self.group_codes(chunk[3])
+        
+        # Positions must not decrease within a group, across pieces too
+        valid = ~np.isnan(positions)
+        check_codes, check_positions = codes[valid], positions[valid]
+        if self.last_position is not None and len(check_codes) and check_codes[0] == self.last_position[0]:
+            check_codes = np.concatenate(([self.last_position[0]], check_codes))
+            check_positions = np.concatenate(([self.last_position[1]], check_positions))
+        same_group = check_codes[1:] == check_codes[:-1]
+        if (same_group & (check_positions[1:] < check_positions[:-1])).any():
+            raise self.not_sorted("positions decrease within a match_val")
+        if len(check_codes):
+            self.last_position = (check_codes[-1], check_positions[-1])
+        
+        buckets = starts // self.bin_bytes
+        new_bin = np.concatenate(([True], (codes[1:] != codes[:-1]) | (buckets[1:] != buckets[:-1])))
+        bin_starts = np.flatnonzero(new_bin)
+        bin_ends = np.append(bin_starts[1:], len(starts))
+        pieces = {
+            'group': codes[bin_starts],
+            'bucket': buckets[bin_starts],
+            'start': starts[bin_starts],
+            'end': ends[bin_ends - 1],
+            'lines': bin_ends - bin_starts,
+            'first': np.fmin.reduceat(positions, bin_starts),
+            'last': np.fmax.reduceat(positions, bin_starts)
+        }
+        
+        # The first bin may continue the last bin of the previous piece
+        bins = self.bins
+        if bins['group'] and bins['group'][-1] == pieces['group'][0] and bins['bucket'][-1] == pieces['bucket'][0]:
+            bins['end'][-1] = pieces['end'][0]
+            bins['lines'][-1] += pieces['lines'][0]
+            bins['first'][-1] = np.fmin(bins['first'][-1], pieces['first'][0])
+            bins['last'][-1] = np.fmax(bins['last'][-1], pieces['last'][0])
+            pieces = {field: values[1:] for field, values in pieces.items()}
+        for field, values in pieces.items():
+            bins[field].extend(values.tolist())
+    
+    def arrays(self):
+        """The collected bins as arrays, leaving out bins without a single position"""
+        bins = {field: np.array(values) for field, values in self.bins.items()}
+        keep = ~np.isnan(bins['first']) if len(bins['first']) else np.zeros(0, dtype=bool)
+        return {
+            'bin_group': bins['group'][keep].astype(np.int32),
+            'bin_start': bins['start'][keep].astype(np.int64),
+            'bin_end': bins['end'][keep].astype(np.int64),
+            'bin_lines': bins['lines'][keep].astype(np.int64),
+            'bin_first': bins['first'][keep].astype(np.float64),
+            'bin_last': bins['last'][keep].astype(np.float64)
+        }
+
+def value_dtype_label(value_dtype):
+    """How the index header records the value column's dtype: 'object' for text, None if never seen"""
+    if value_dtype is None:
+        return None
+    return np.dtype(value_dtype).name if pd.api.types.is_numeric_dtype(value_dtype) else 'object'
+
+def build_region_index(met75_file, index_file=None, bin_bytes=DEFAULT_BIN_BYTES):
+    """
+    Build a region index, similar to a tabix index, of a sorted met75 file.
+    
+    The met75 file may be plain CSV or BGZF, and must be sorted by match_val
+    and then by position (e.g. sort -t, -k4,4 -k1,1n after the header). The
+    index lists bins of about bin_bytes of text with their byte range and the
+    positions they hold, so a query only has to read the bins that overlap it.
+    For BGZF files the block table is stored too, so a bin can be found
+    without decompressing anything before it.
+    
+    Args:
+        met75_file (str): Path to the sorted met75 CSV or BGZF file
+        index_file (str): Path for the index (default: <met75_file>.rgi)
+        bin_bytes (int): Uncompressed bytes of text per bin
+    """
+    if index_file is None:
+        index_file = default_region_index(met75_file)
+    
+    compressed = is_bgzf(met75_file)
+    if not compressed and is_gzip(met75_file):
+        raise ValueError(f"'{met75_file}' is plain gzip, which cannot be read from the middle. "
+                         f"Recompress it with bgzip or python bgzf.py first.")
+    
+    print(f"Building region index for {met75_file}...")
+    fingerprint = source_fingerprint(met75_file, with_hash=False)
+    builder = RegionIndexBuilder(met75_file, bin_bytes)
+    
+    carry = b''
+    base = None
+    for piece in text_pieces(met75_file, compressed):
+        data = carry + piece
+        last = data.rfind(b'\n')
+        if last < 0:
+            carry = data
+            continue
+        carry = data[last + 1:]
+        if base is None:
+            # Skip the header line
+            header_end = data.find(b'\n') + 1
+            builder.add_lines(data[header_end:last + 1], header_end)
+            base = last + 1
+        else:
+            builder.add_lines(data[:last + 1], base)
+            base += last + 1
+    if base is not None:
+        builder.add_lines(carry, base)
+    
+    arrays = builder.arrays()
+    arrays['match_vals'] = np.array(builder.names, dtype=str)
+    if compressed:
+        arrays['block_coffsets'], arrays['block_ustarts'] = block_table(met75_file)
+    arrays['header'] = np.array(json.dumps({
+        'version': REGION_INDEX_VERSION,
+        'source': dict(fingerprint, path=os.path.abspath(met75_file)),
+        'bgzf': compressed,
+        'bin_bytes': bin_bytes,
+        'value_dtype': value_dtype_label(builder.value_dtype)
+    }))
+    
+    tmp_file = f"{index_file}.tmp-{os.getpid()}"
+    with open(tmp_file, 'wb') as outfile:
+        np.savez(outfile, **arrays)
+    os.replace(tmp_file, index_file)
+    
+    print(f"Region index saved to {index_file} ({len(arrays['bin_group'])} bins, "
+          f"{len(builder.names)} match values)")
+    return index_file
+
+def read_region_index(index_file):
+    """Return the region index as a dict of arrays plus its 'header', or None if unreadable"""
+    try:
+        with np.load(index_file, allow_pickle=False) as archive:
+            index = {name: archive[name] for name in archive.files}
+        index['header'] = json.loads(str(index['header']))
+    except (KeyError, ValueError, OSError):
+        return None
+    if index['header'].get('version') != REGION_INDEX_VERSION:
+        return None
+    return index
+
+def load_region_index(met75_file, index_file=None, **build_kwargs):
+    """
+    Open the region index for met75_file, rebuilding it first if it is missing
+    or older than the file. Extra keyword arguments go to build_region_index;
+    a rebuild keeps the bin size of the old index unless bin_bytes is given.
+    """
+    if index_file is None:
+        index_file = default_region_index(met75_file)
+    
+    index = read_region_index(index_file)
+    current = source_fingerprint(met75_file, with_hash=False)
+    if index is not None and all(index['header']['source'][key] == current[key] for key in current):
+        print(f"Using existing region index {index_file}")
+        return index
+    
+    if index is not None:
+        build_kwargs.setdefault('bin_bytes', index['header']['bin_bytes'])
+    build_region_index(met75_file, index_file, **build_kwargs)
+    return read_region_index(index_file)
+
+def needed_bins(index, gRNA_df, valid_mask):
+    """
+    Mark the bins that hold any position inside any valid gRNA range.
+    
+    Bins of a group are in position order, so the bins a range [start, end]
+    overlaps are found with two binary searches; the marks of all ranges are
+    combined with a running sum.
+    """
+    keys = infer_categories(pd.Index(index['match_vals']))
+    group_of_key = {key: number for number, key in enumerate(keys)}
+    bin_group = index['bin_group']
+    group_bounds = np.searchsorted(bin_group, np.arange(len(keys) + 1))
+    
+    marks = np.zeros(len(bin_group) + 1, dtype=np.int64)
+    range_starts = gRNA_df['range_start'].to_numpy(dtype=np.float64)
+    range_ends = gRNA_df['range_end'].to_numpy(dtype=np.float64)
+    for match_val, rows in group_gRNA_rows(gRNA_df, valid_mask).items():
+        group = group_of_key.get(match_val)
+        if group is None:
+            continue
+        b0, b1 = group_bounds[group], group_bounds[group + 1]
+        lo = b0 + np.searchsorted(index['bin_last'][b0:b1], range_starts[rows], side='left')
+        hi = b0 + np.searchsorted(index['bin_first'][b0:b1], range_ends[rows], side='right')
+        overlaps = lo < hi
+        np.add.at(marks, lo[overlaps], 1)
+        np.add.at(marks, hi[overlaps], -1)
+    return np.cumsum(marks[:-1]) > 0, keys
+
+def merge_regions(index, selected):
+    """Merge selected bins that touch into (first_bin, last_bin + 1) runs of contiguous text"""
+    chosen = np.flatnonzero(selected)
+    if not len(chosen):
+        return []
+    breaks = (np.diff(chosen) != 1) | (index['bin_start'][chosen[1:]] != index['bin_end'][chosen[:-1]])
+    run_starts = np.concatenate(([0], np.flatnonzero(breaks) + 1))
+    run_ends = np.append(run_starts[1:], len(chosen))
+    return [(int(chosen[a]), int(chosen[b - 1]) + 1) for a, b in zip(run_starts, run_ends)]
+
+def parse_region(met75_file, offset, length, skip, size, compressed, value_dtype, parsed_dtype):
+    """
+    Worker task: read one region of met75 text and parse its lines.
+    
+    Values are converted to value_dtype, or if it is None parsed as the
+    parsed_dtype label of the index header says a whole-file read parses them.
+    Returns (positions, values, keep) for every line of the region, where keep
+    marks lines with a position and a match_val.
+    """
+    if compressed:
+        data = read_span(met75_file, offset, length)[skip:skip + size]
+    else:
+        with open(met75_file, 'rb') as infile:
+            infile.seek(offset)
+            data = infile.read(length)
+    read_dtypes = {3: 'category'}
+    if value_dtype is None and parsed_dtype is not None:
+        parsed_dtype = np.dtype(parsed_dtype)
+        # Blank lines are kept here, so whole-number values are read with room for missing cells
+        read_dtypes[2] = {'O': str, 'i': 'Int64', 'b': 'boolean'}.get(parsed_dtype.kind, parsed_dtype)
+    chunk = pd.read_csv(io.BytesIO(data), header=None, usecols=[0, 2, 3], dtype=read_dtypes,
+                        skip_blank_lines=False)
+    positions = pd.to_numeric(chunk[0], errors='coerce').to_numpy(dtype=np.float64)
+    if value_dtype is not None:
+        values = pd.to_numeric(chunk[2], errors='coerce').to_numpy(dtype=value_dtype)
+    elif parsed_dtype is not None and parsed_dtype.kind in 'ib':
+        values = chunk[2].to_numpy(dtype=parsed_dtype, na_value=0)
+    else:
+        values = chunk[2].to_numpy()
+    keep = ~np.isnan(positions) & chunk[3].notna().to_numpy()
+    return positions, values, keep
+
+def load_regions(met75_file, index, selected, keys, value_dtype=None, processes=None):
+    """
+    Build a sorted lookup from only the selected bins of the met75 file.
+    
+    Touching bins are read as one region; regions are parsed in parallel
+    worker processes and each line is assigned to the group of its bin.
+    With value_dtype None the values keep the type read_csv gives the whole
+    file, as recorded in the index.
+    """
+    regions = merge_regions(index, selected)
+    compressed = index['header']['bgzf']
+    tasks = []
+    for b0, b1 in regions:
+        start, end = int(index['bin_start'][b0]), int(index['bin_end'][b1 - 1])
+        if compressed:
+            offset, length, skip = block_range(index['block_coffsets'], index['block_ustarts'], start, end)
+        else:
+            offset, length, skip = start, end - start, 0
+        tasks.append((met75_file, offset, length, skip, end - start, compressed, value_dtype,
+                      index['header']['value_dtype']))
+    print(f"Reading {int(selected.sum())} of {len(selected)} bins in {len(regions)} regions...")
+    
+    pos_parts = {}
+    val_parts = {}
+    for (b0, b1), (positions, values, keep) in zip(regions, imap_ordered(parse_region, tasks, processes)):
+        groups = np.repeat(index['bin_group'][b0:b1], index['bin_lines'][b0:b1])
+        positions, values, groups = whole_positions(positions[keep]), values[keep], groups[keep]
+        split_at = np.flatnonzero(np.diff(groups)) + 1
+        for idx in np.split(np.arange(len(groups)), split_at):
+            if len(idx):
+                match_val = keys[groups[idx[0]]]
+                pos_parts.setdefault(match_val, []).append(positions[idx])
+                val_parts.setdefault(match_val, []).append(values[idx])
+    
+    return {match_val: make_lookup_entry(np.concatenate(pos_parts[match_val]),
+                                         np.concatenate(val_parts[match_val]))
+            for match_val in pos_parts}
+
+def match_csvs_regions(met75_file, gRNA_file, output_file, index_file=None, value_dtype=None,
+                       processes=None):
+    """
+    Sorted interval-join matching that reads only the parts of a sorted met75
+    file that the gRNA ranges can hit.
+    
+    The union of the bins overlapping any gRNA range is taken from the region
+    index; only those bins are read and parsed, so the runtime follows the size
+    of the queried regions rather than the size of the genome. Output is
+    identical to match_csvs_sorted on the same file.
+    
+    Args:
+        met75_file (str): Path to the met75 CSV or BGZF file, sorted by match_val and position
+        gRNA_file (str): Path to the gRNA ranges CSV file
+        output_file (str): Path for the output CSV file
+        index_file (str): Region index (default: <met75_file>.rgi, built if missing or stale)
+        value_dtype: dtype for methylation values, or None to keep them as read_csv
+            parses the whole file
+        processes (int): Worker processes for parsing regions (default: CPU count)
+    """
+    print("Using region index approach...")
+    index = load_region_index(met75_file, index_file)
+    
+    print("Processing gRNA data...")
+    gRNA_df = read_table(gRNA_file)
+    valid_mask = prepare_gRNA_df(gRNA_df)
+    selected, keys = needed_bins(index, gRNA_df, valid_mask)
+    lookup_dict = load_regions(met75_file, index, selected, keys, value_dtype, processes)
+    print(f"Peak memory after reading regions: {peak_rss_mb():.1f} MB")
+    
+    matches_found = match_sorted_lookup(gRNA_df, lookup_dict)
+    
+    print("Saving results...")
+    write_results(gRNA_df, output_file)
+    print(f"Results saved to {output_file}")
+    print(f"Total matches found: {matches_found}")
+    
+    return gRNA_df
+
+def main():
+    if len(sys.argv) >= 3 and sys.argv[1] == 'build':
+        build_region_index(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        return
+    
+    if len(sys.argv) < 4:
+        print("Usage: python regionindex.py <met_csv_file> <gRNA_csv_file> <output_csv_file> [index_file]")
+        print("       python regionindex.py build <met_csv_file> [index_file]")
+        print("Example: python regionindex.py met75sorted.csv.gz gRNAranges.csv matched_results75_v8.csv")
+        return
+    
+    index_file = sys.argv[4] if len(sys.argv) > 4 else None
+    match_csvs_regions(sys.argv[1], sys.argv[2], sys.argv[3], index_file)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
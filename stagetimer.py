@@ -0,0 +1,152 @@
+import json
+import logging
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Functions called with every finished Span; spans are only measured when
+# at least one hook is registered
+_hooks = []
+
+def register_hook(hook):
+    """Register a function to be called with each finished Span"""
+    _hooks.append(hook)
+    return hook
+
+def unregister_hook(hook):
+    """Remove a hook added with register_hook"""
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+def clear_hooks():
+    """Remove every registered hook"""
+    del _hooks[:]
+
+def enable_tracemalloc():
+    """
+    Track Python-level allocation peaks per span with tracemalloc.
+    
+    This adds noticeable overhead to allocation-heavy code, so it is off unless
+    requested; RSS is always recorded.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def rss_mb():
+    """Current resident set size of this process in MB (Linux), or None"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+class Span:
+    """Measurements for one pipeline stage"""
+    
+    __slots__ = ('name', 'rows', 'seconds', 'rss_mb', 'peak_rss_mb', 'traced_peak_mb', 'fields')
+    
+    def __init__(self, name, rows=None, **fields):
+        self.name = name
+        self.rows = rows
+        self.seconds = None
+        self.rss_mb = None
+        self.peak_rss_mb = None
+        self.traced_peak_mb = None
+        self.fields = fields
+    
+    def note(self, **fields):
+        """Attach extra fields to the span record"""
+        self.fields.update(fields)
+    
+    def to_dict(self):
+        record = {
+            'span': self.name,
+            'seconds': self.seconds,
+            'rows': self.rows,
+            'rows_per_sec': self.rows / self.seconds if self.rows and self.seconds else None,
+            'rss_mb': self.rss_mb,
+            'peak_rss_mb': self.peak_rss_mb,
+            'traced_peak_mb': self.traced_peak_mb
+        }
+        record.update(self.fields)
+        return record
+
+class _NullSpan:
+    """Stand-in yielded when no hooks are registered; attribute writes are dropped"""
+    
+    __slots__ = ()
+    
+    def __setattr__(self, name, value):
+        pass
+    
+    def note(self, **fields):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+@contextmanager
+def span(name, rows=None, **fields):
+    """
+    Time a stage and report it to the registered hooks.
+    
+    Usage:
+        with span('read_met') as s:
+            df = read_table(path)
+            s.rows = len(df)
+    
+    With no hooks registered this only costs a generator call, so it can stay
+    in production code.
+    """
+    if not _hooks:
+        yield _NULL_SPAN
+        return
+    
+    current = Span(name, rows, **fields)
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        current.rss_mb = rss_mb()
+        current.peak_rss_mb = peak_rss_mb()
+        if tracing:
+            current.traced_peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        for hook in list(_hooks):
+            hook(current)
+
+class JsonLinesEmitter:
+    """Hook that appends each span as one JSON object per line to a file or stream"""
+    
+    def __init__(self, target):
+        self.target = target
+    
+    def __call__(self, finished):
+        line = json.dumps(finished.to_dict(), default=str)
+        if hasattr(self.target, 'write'):
+            self.target.write(line + '\n')
+            self.target.flush()
+        else:
+            with open(self.target, 'a') as outfile:
+                outfile.write(line + '\n')
+
+def logging_hook(logger=None, level=logging.INFO):
+    """Hook that logs each span as a structured record (fields in `extra`)"""
+    logger = logger or logging.getLogger('stagetimer')
+    
+    def hook(finished):
+        record = finished.to_dict()
+        logger.log(level, "%s took %.3f s", record['span'], record['seconds'],
+                   extra={'span_record': record})
+    
+    return hook
\ No newline at end of file
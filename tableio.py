@@ -0,0 +1,367 @@
+import csv
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from bgzf import is_bgzf, is_gzip, open_binary, open_text
+
+try:
+    import pyarrow.parquet as pq
+    HAVE_PYARROW = True
+except ImportError:
+    pq = None
+    HAVE_PYARROW = False
+
+# File extensions for each supported format; anything else is read as CSV
+FORMAT_EXTENSIONS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+    '.npz': 'npz'
+}
+
+# Column names used for tables written from plain rows, which have no header
+ROW_COLUMN_PREFIX = '_'
+
+def table_format(path):
+    """Detect the table format from the file extension: parquet, feather, npz or csv"""
+    return FORMAT_EXTENSIONS.get(os.path.splitext(str(path))[1].lower(), 'csv')
+
+def binary_extension():
+    """Preferred extension for binary intermediate files: Parquet if pyarrow is installed, else .npz"""
+    return '.parquet' if HAVE_PYARROW else '.npz'
+
+def require_pyarrow(path):
+    if not HAVE_PYARROW:
+        raise ImportError(f"Reading or writing '{path}' needs pyarrow. "
+                          f"Install pyarrow or use a .npz or .csv file instead.")
+
+def save_npz(df, path):
+    """
+    Save a DataFrame as a .npz archive without pickling.
+    
+    Numeric and boolean columns are stored as-is. Other columns are stored as
+    strings together with a mask of missing values.
+    """
+    arrays = {'__columns__': np.array([str(col) for col in df.columns])}
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+            arrays[f'col{i}'] = series.to_numpy()
+        else:
+            missing = series.isna().to_numpy()
+            arrays[f'col{i}'] = np.where(missing, '', series.astype(str).to_numpy()).astype(str)
+            arrays[f'missing{i}'] = missing
+    np.savez(path, **arrays)
+
+def load_npz(path, usecols=None):
+    """Load a DataFrame saved by save_npz"""
+    with np.load(path, allow_pickle=False) as archive:
+        columns = archive['__columns__'].tolist()
+        indices = range(len(columns)) if usecols is None else usecols
+        data = {}
+        for i in indices:
+            values = archive[f'col{i}']
+            if f'missing{i}' in archive:
+                values = values.astype(object)
+                values[archive[f'missing{i}']] = np.nan
+            data[columns[i]] = values
+    return pd.DataFrame(data)
+
+def column_names(path):
+    """Column names of a binary table, without reading its data"""
+    fmt = table_format(path)
+    if fmt == 'parquet':
+        require_pyarrow(path)
+        return pq.read_schema(path).names
+    if fmt == 'feather':
+        require_pyarrow(path)
+        import pyarrow.ipc
+        return pyarrow.ipc.open_file(path).schema.names
+    with np.load(path, allow_pickle=False) as archive:
+        return archive['__columns__'].tolist()
+
+def _csv_source(path, csv_kwargs):
+    """
+    What to hand pd.read_csv for a CSV that may be compressed.
+    
+    BGZF files are opened as a text stream that decompresses blocks in worker
+    processes; gzip is detected from its magic bytes, so files ending in .bgz
+    or without a .gz extension work too.
+    """
+    if is_bgzf(path):
+        return open_text(path)
+    if is_gzip(path):
+        csv_kwargs.setdefault('compression', 'gzip')
+    return path
+
+def read_table(path, usecols=None, nrows=None, **csv_kwargs):
+    """
+    Read a table into a DataFrame, choosing the reader from the file extension.
+    
+    Args:
+        path (str): Path to a .csv, .parquet/.pq, .feather/.arrow or .npz file;
+            CSV files may be gzip or BGZF compressed
+        usecols (list): Optional column positions to read
+        nrows (int): Optional number of rows to read
+        csv_kwargs: Extra arguments passed to pd.read_csv for CSV files
+    """
+    fmt = table_format(path)
+    if fmt == 'csv':
+        source = _csv_source(path, csv_kwargs)
+        try:
+            return pd.read_csv(source, usecols=usecols, nrows=nrows, **csv_kwargs)
+        finally:
+            if source is not path:
+                source.close()
+    
+    if fmt == 'npz':
+        df = load_npz(path, usecols)
+    else:
+        require_pyarrow(path)
+        columns = None
+        if usecols is not None:
+            names = column_names(path)
+            columns = [names[i] for i in usecols]
+        if fmt == 'parquet':
+            df = pd.read_parquet(path, columns=columns)
+        else:
+            df = pd.read_feather(path, columns=columns)
+    
+    return df if nrows is None else df.head(nrows)
+
+def read_table_chunks(path, chunksize, usecols=None, **csv_kwargs):
+    """
+    Yield a table as DataFrames of at most chunksize rows.
+    
+    CSV and Parquet are streamed; Feather and .npz tables are read once and
+    sliced.
+    """
+    fmt = table_format(path)
+    if fmt == 'csv':
+        source = _csv_source(path, csv_kwargs)
+        try:
+            yield from pd.read_csv(source, usecols=usecols, chunksize=chunksize, **csv_kwargs)
+        finally:
+            if source is not path:
+                source.close()
+    elif fmt == 'parquet':
+        require_pyarrow(path)
+        parquet_file = pq.ParquetFile(path)
+        columns = None
+        if usecols is not None:
+            columns = [parquet_file.schema_arrow.names[i] for i in usecols]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        df = read_table(path, usecols=usecols)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+def widen_dtype(first, second):
+    """The dtype read_csv gives a column when parts of it parse as first and second"""
+    if first is None or first == second:
+        return second
+    if all(pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+           for dtype in (first, second)):
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+def csv_column_dtypes(path, chunksize, **csv_kwargs):
+    """
+    Find the dtype of every column of a CSV file as one read_csv call on the
+    whole file would infer it, reading only chunksize rows at a time.
+    
+    Pass the result as dtype= when reading the file in chunks so that every
+    chunk parses, and later prints, like the whole file would.
+    """
+    dtypes = {}
+    for chunk in read_table_chunks(path, chunksize, **csv_kwargs):
+        for col, dtype in chunk.dtypes.items():
+            dtypes[col] = widen_dtype(dtypes.get(col), dtype)
+    return dtypes
+
+def write_table(df, path, **csv_kwargs):
+    """
+    Write a DataFrame in the format given by the file extension.
+    
+    CSV files are written without the index, as the scripts always have.
+    """
+    fmt = table_format(path)
+    if fmt == 'csv':
+        df.to_csv(path, index=False, **csv_kwargs)
+    elif fmt == 'npz':
+        save_npz(df, path)
+    else:
+        require_pyarrow(path)
+        # Arrow needs string column names and a default index
+        df = df.rename(columns=str).reset_index(drop=True)
+        if fmt == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.to_feather(path)
+
+def _csv_rows(infile):
+    with infile:
+        yield from csv.reader(infile)
+
+def read_rows(path, encoding=None):
+    """
+    Return an iterator of rows (lists of strings) from a table file.
+    
+    CSV files are streamed with csv.reader and opened immediately, so a missing
+    file raises FileNotFoundError here. Gzip and BGZF compressed CSV files are
+    decompressed on the fly. For binary tables the column names come
+    first, as a CSV header would, unless the table was written by write_rows.
+    """
+    if table_format(path) == 'csv':
+        return _csv_rows(open_text(path, encoding))
+    
+    df = read_table(path)
+    rows = []
+    headerless = list(df.columns) == [f'{ROW_COLUMN_PREFIX}{i}' for i in range(len(df.columns))]
+    if not headerless:
+        rows.append([str(col) for col in df.columns])
+    for record in df.itertuples(index=False, name=None):
+        cells = list(record)
+        if headerless:
+            # Missing cells mark the end of a shorter row
+            while cells and pd.isna(cells[-1]):
+                cells.pop()
+        rows.append(['' if pd.isna(cell) else str(cell) for cell in cells])
+    return iter(rows)
+
+class _PaddedLines:
+    """
+    Byte stream over a CSV file that starts with a line of width empty cells
+    and adds width - 1 empty cells to the end of every line. Line breaks
+    inside quoted cells are left alone.
+    
+    read_csv with width names and usecols keeps rows of any length, but fails
+    on a first row wider than the names or a chunk whose rows are all
+    narrower; with the padding neither can happen.
+    """
+    
+    LINE_BREAK = re.compile(rb'(\r\n?|\n)')
+    
+    def __init__(self, infile, width):
+        self.infile = infile
+        self.pad = b',' * (width - 1)
+        self.first = self.pad + b'\n'
+        self.line_open = False
+        self.quoted = False
+    
+    def read(self, size=-1):
+        data = self.infile.read(size)
+        # Keep a '\r\n' pair in one piece
+        while data.endswith(b'\r'):
+            more = self.infile.read(1)
+            if not more:
+                break
+            data += more
+        if not data:
+            # Pad a last line that has no line break
+            tail = self.first + self.pad if self.line_open else self.first
+            self.first = b''
+            self.line_open = False
+            return tail
+        if self.quoted or b'"' in data or b'\r' in data:
+            parts = self.LINE_BREAK.split(data)
+            for i in range(0, len(parts), 2):
+                # An odd number of quote characters opens or closes a quoted cell
+                self.quoted ^= parts[i].count(b'"') % 2 == 1
+                if i + 1 < len(parts) and not self.quoted:
+                    parts[i + 1] = self.pad + parts[i + 1]
+            padded = b''.join(parts)
+        else:
+            padded = data.replace(b'\n', self.pad + b'\n')
+        self.line_open = not data.endswith((b'\n', b'\r'))
+        padded = self.first + padded
+        self.first = b''
+        return padded
+    
+    def close(self):
+        self.infile.close()
+
+def read_column_cells(path, usecols, chunksize=1000000):
+    """
+    Yield the cells of the columns at positions usecols, one object array per
+    column for every chunk of rows, without building row lists.
+    
+    CSV cells are the text read_rows would give, with '' for cells past the end
+    of a shorter row and for blank lines. Binary tables give their column names
+    first, as read_rows does, followed by the stored values.
+    """
+    if table_format(path) == 'csv':
+        width = max(usecols) + 1
+        source = _PaddedLines(open_binary(path), width)
+        try:
+            first = True
+            for chunk in pd.read_csv(source, header=None, names=range(width), usecols=usecols, dtype=str,
+                                     keep_default_na=False, skip_blank_lines=False, chunksize=chunksize):
+                if first:
+                    # Drop the line of empty cells the stream starts with
+                    chunk = chunk.iloc[1:]
+                    first = False
+                if len(chunk):
+                    yield [chunk[i].to_numpy(dtype=object) for i in usecols]
+        finally:
+            source.close()
+        return
+    
+    df = read_table(path)
+    headerless = list(df.columns) == [f'{ROW_COLUMN_PREFIX}{i}' for i in range(len(df.columns))]
+    columns = []
+    for i in usecols:
+        cells = df.iloc[:, i].to_numpy(dtype=object) if i < len(df.columns) else np.full(len(df), '', dtype=object)
+        if not headerless:
+            header = str(df.columns[i]) if i < len(df.columns) else ''
+            cells = np.concatenate((np.array([header], dtype=object), cells))
+        columns.append(cells)
+    yield columns
+
+def float_cells(cells):
+    """
+    float() of every cell in an object array, with NaN for cells float() rejects.
+    
+    Numbers are converted in one astype call, which applies float() in C; a
+    chunk holding a header or other text is split in halves until the cells
+    that fail are isolated.
+    """
+    try:
+        return cells.astype(np.float64)
+    except (ValueError, TypeError):
+        pass
+    if len(cells) <= 64:
+        values = np.full(len(cells), np.nan)
+        for i, cell in enumerate(cells):
+            try:
+                values[i] = float(cell)
+            except (ValueError, TypeError):
+                pass
+        return values
+    half = len(cells) // 2
+    return np.concatenate((float_cells(cells[:half]), float_cells(cells[half:])))
+
+def write_rows(path, rows, encoding=None):
+    """
+    Write rows (sequences of strings) to a table file.
+    
+    CSV output is streamed with csv.writer. Binary output is collected into an
+    all-string table with columns _0, _1, ..., where shorter rows are padded
+    with missing cells.
+    """
+    if table_format(path) == 'csv':
+        with open(path, 'w', newline='', encoding=encoding) as outfile:
+            csv.writer(outfile).writerows(rows)
+        return
+    
+    rows = [list(row) for row in rows]
+    width = max((len(row) for row in rows), default=0)
+    columns = [f'{ROW_COLUMN_PREFIX}{i}' for i in range(width)]
+    df = pd.DataFrame([row + [None] * (width - len(row)) for row in rows],
+                      columns=columns, dtype=object)
+    write_table(df, path)
\ No newline at end of file
@@ -0,0 +1,85 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bgzf
+import metstatusv8
+
+CHROMOSOMES = ['1', '2', '3', 'X']
+
+@pytest.fixture
+def mixed_match_val_files(tmp_path):
+    """
+    A position-sorted met75 file whose numeric chromosomes all come before 'X',
+    so the first chunks hold only numeric match_vals, and a gRNA file over it.
+    """
+    rng = np.random.default_rng(0)
+    met_rows = []
+    for chrom in CHROMOSOMES:
+        for position in np.sort(rng.integers(0, 50000, 500)):
+            met_rows.append((position, 3, round(rng.random(), 3), chrom))
+    met_file = tmp_path / 'met.csv'
+    pd.DataFrame(met_rows, columns=['pos', 'cov', 'val', 'chrom']).to_csv(met_file, index=False)
+    
+    gRNA_rows = []
+    for i in range(400):
+        start = int(rng.integers(0, 50000))
+        gRNA_rows.append([f'g{i}', 'a', 'b', 'c', start, start + 300, 'd', CHROMOSOMES[i % 4],
+                          '-' if i % 3 == 0 else '+'])
+    gRNA_file = tmp_path / 'g.csv'
+    pd.DataFrame(gRNA_rows, columns=['name', 'a', 'b', 'c', 'start', 'end', 'd', 'chrom', 'Strand']).to_csv(
+        gRNA_file, index=False)
+    return met_file, gRNA_file
+
+def run_quietly(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+def test_chunked_keys_follow_whole_file(mixed_match_val_files):
+    met_file, _ = mixed_match_val_files
+    whole = run_quietly(metstatusv8.build_lookup_chunked, met_file, chunksize=None, value_dtype=None)
+    chunked = run_quietly(metstatusv8.build_lookup_chunked, met_file, chunksize=500, value_dtype=np.float64)
+    
+    assert list(whole) == CHROMOSOMES
+    assert list(chunked) == list(whole)
+    for match_val in whole:
+        assert np.array_equal(chunked[match_val]['positions'], whole[match_val]['positions'])
+
+@pytest.mark.parametrize('compressed', [False, True])
+def test_chunked_output_matches_whole_file(mixed_match_val_files, tmp_path, monkeypatch, compressed):
+    met_file, gRNA_file = mixed_match_val_files
+    if compressed:
+        # Small blocks and spans so the parallel BGZF parser sees the file in
+        # several pieces
+        monkeypatch.setattr(bgzf, 'BGZF_BLOCK_DATA', 2048)
+        monkeypatch.setattr(metstatusv8, 'group_spans', lambda path: bgzf.group_spans(path, 2048))
+        met_file = run_quietly(bgzf.compress_bgzf, met_file, tmp_path / 'met.csv.gz')
+    run_quietly(metstatusv8.match_csvs_sorted, met_file, gRNA_file, tmp_path / 'whole.csv')
+    result = run_quietly(metstatusv8.match_csvs_sorted, met_file, gRNA_file, tmp_path / 'chunked.csv',
+                         chunksize=500, value_dtype=np.float64)
+    
+    assert (result['has_matches'] == 'y').sum() > 300
+    assert (tmp_path / 'chunked.csv').read_bytes() == (tmp_path / 'whole.csv').read_bytes()
+
+@pytest.mark.parametrize('values', ['integer', 'text'])
+def test_chunked_values_print_like_whole_file(mixed_match_val_files, tmp_path, values):
+    met_file, gRNA_file = mixed_match_val_files
+    met_df = pd.read_csv(met_file)
+    if values == 'integer':
+        # Whole numbers until a fraction in the last chunk makes the column float
+        met_df['val'] = (met_df['val'] * 100).round().astype(int).astype(object)
+        met_df.loc[met_df.index[-1], 'val'] = 0.5
+    else:
+        # Text in the last chunk only makes the whole column text, which keeps
+        # trailing zeros that a float parse drops
+        met_df['val'] = [f'{value:.3f}' for value in met_df['val']]
+        met_df.loc[met_df.index[-5:], 'val'] = '.'
+    met_df.to_csv(met_file, index=False)
+    run_quietly(metstatusv8.match_csvs_ultra_fast, met_file, gRNA_file, tmp_path / 'legacy.csv')
+    run_quietly(metstatusv8.match_csvs_sorted, met_file, gRNA_file, tmp_path / 'chunked.csv',
+                chunksize=500, value_dtype=None)
+    
+    assert (tmp_path / 'chunked.csv').read_bytes() == (tmp_path / 'legacy.csv').read_bytes()
\ No newline at end of file
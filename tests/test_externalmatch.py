@@ -0,0 +1,63 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import externalmatch
+import metstatusv8
+
+CHROMOSOMES = ['1', '2', 'X']
+
+@pytest.fixture
+def unsorted_files(tmp_path):
+    """An unsorted met75 file with repeated positions and a gRNA file over it, both several chunks long"""
+    rng = np.random.default_rng(2)
+    met_df = pd.DataFrame({
+        'pos': rng.integers(0, 30000, 6000),
+        'cov': 3,
+        'val': rng.integers(0, 1000, 6000) / 1000,
+        'chrom': rng.choice(CHROMOSOMES, 6000)
+    })
+    starts = rng.integers(0, 30000, 2500)
+    gRNA_df = pd.DataFrame({
+        'name': [f'g{i}' for i in range(2500)], 'a': 'a', 'b': 'b', 'c': 'c',
+        'start': starts, 'end': starts + 150, 'd': 'd',
+        'chrom': rng.choice(CHROMOSOMES + ['Y'], 2500),
+        'Strand': rng.choice(['+', '-', '.'], 2500)
+    })
+    gRNA_file = tmp_path / 'g.csv'
+    gRNA_df.to_csv(gRNA_file, index=False)
+    return met_df, gRNA_file
+
+def run_quietly(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+@pytest.mark.parametrize('values', ['float', 'integer', 'text'])
+def test_external_output_matches_sorted(unsorted_files, tmp_path, monkeypatch, values):
+    met_df, gRNA_file = unsorted_files
+    if values == 'integer':
+        met_df['val'] = (met_df['val'] * 1000).astype(int)
+    elif values == 'text':
+        met_df['val'] = [f'{value:.3f}' for value in met_df['val']]
+        met_df.loc[met_df.index[-1], 'val'] = '.'
+    met_file = tmp_path / 'met.csv'
+    met_df.to_csv(met_file, index=False)
+    
+    run_names = []
+    save_run = externalmatch.save_run
+    def counting_save_run(work_dir, name, groups, arrays):
+        run_names.append(name)
+        return save_run(work_dir, name, groups, arrays)
+    monkeypatch.setattr(externalmatch, 'save_run', counting_save_run)
+    
+    run_quietly(metstatusv8.match_csvs_sorted, met_file, gRNA_file, tmp_path / 'sorted.csv')
+    matches = run_quietly(externalmatch.match_csvs_external, met_file, gRNA_file, tmp_path / 'external.csv',
+                          max_memory_mb=0.1)
+    
+    assert sum(name.startswith('met_') for name in run_names) >= 5
+    assert sum(name.startswith('gRNA_') for name in run_names) >= 2
+    assert matches > 500
+    assert (tmp_path / 'external.csv').read_bytes() == (tmp_path / 'sorted.csv').read_bytes()
\ No newline at end of file
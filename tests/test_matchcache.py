@@ -0,0 +1,78 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import matchcache
+import metstatusv8
+
+CHROMOSOMES = ['1', '2', 'X']
+
+@pytest.fixture
+def cache_files(tmp_path):
+    """An integer-valued met75 file with tied positions and a gRNA file over it"""
+    rng = np.random.default_rng(1)
+    met_rows = []
+    for chrom in CHROMOSOMES:
+        for position in rng.integers(0, 20000, 600):
+            met_rows.append((position, 3, int(rng.integers(0, 100)), chrom))
+    met_file = tmp_path / 'met.csv'
+    pd.DataFrame(met_rows, columns=['pos', 'cov', 'val', 'chrom']).to_csv(met_file, index=False)
+    
+    gRNA_rows = []
+    for i in range(120):
+        start = int(rng.integers(0, 20000))
+        gRNA_rows.append([f'g{i}', 'a', 'b', 'c', start, start + 200, 'd', CHROMOSOMES[i % 3],
+                          '-' if i % 4 == 0 else '+'])
+    gRNA_df = pd.DataFrame(gRNA_rows, columns=['name', 'a', 'b', 'c', 'start', 'end', 'd', 'chrom', 'Strand'])
+    return met_file, gRNA_df
+
+def run_quietly(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+def cached_run(met_file, gRNA_df, tmp_path, monkeypatch):
+    """Run match_csvs_cached on gRNA_df and return the number of rows it matched afresh"""
+    matched = []
+    def counting_match(gRNA_df, lookup_dict):
+        matched.append(len(gRNA_df))
+        return metstatusv8.match_sorted_lookup(gRNA_df, lookup_dict)
+    monkeypatch.setattr(matchcache, 'match_sorted_lookup', counting_match)
+    
+    gRNA_df.to_csv(tmp_path / 'g.csv', index=False)
+    run_quietly(matchcache.match_csvs_cached, met_file, tmp_path / 'g.csv', tmp_path / 'cached.csv')
+    run_quietly(metstatusv8.match_csvs_sorted, met_file, tmp_path / 'g.csv', tmp_path / 'uncached.csv')
+    assert (tmp_path / 'cached.csv').read_bytes() == (tmp_path / 'uncached.csv').read_bytes()
+    return sum(matched)
+
+def test_cache_rematches_only_changed_rows(cache_files, tmp_path, monkeypatch):
+    met_file, gRNA_df = cache_files
+    assert cached_run(met_file, gRNA_df, tmp_path, monkeypatch) == len(gRNA_df)
+    assert cached_run(met_file, gRNA_df, tmp_path, monkeypatch) == 0
+    
+    changed = gRNA_df.copy()
+    changed.loc[5, 'end'] += 50
+    assert cached_run(met_file, changed, tmp_path, monkeypatch) == 1
+    
+    # Reordered and duplicated rows have keys the cache already holds
+    reordered = changed.iloc[::-1].reset_index(drop=True)
+    assert cached_run(met_file, reordered, tmp_path, monkeypatch) == 0
+    duplicated = pd.concat([reordered, reordered.iloc[:10]], ignore_index=True)
+    assert cached_run(met_file, duplicated, tmp_path, monkeypatch) == 0
+    
+    # A new row and its duplicate are both matched
+    added = duplicated.copy()
+    added.loc[[0, 1], ['start', 'end', 'chrom']] = [100, 900, 'X']
+    assert cached_run(met_file, added, tmp_path, monkeypatch) == 2
+
+def test_cache_rematches_everything_when_met_changes(cache_files, tmp_path, monkeypatch):
+    met_file, gRNA_df = cache_files
+    assert cached_run(met_file, gRNA_df, tmp_path, monkeypatch) == len(gRNA_df)
+    
+    met_df = pd.read_csv(met_file)
+    met_df.loc[7, 'val'] = 101
+    met_df.to_csv(met_file, index=False)
+    assert cached_run(met_file, gRNA_df, tmp_path, monkeypatch) == len(gRNA_df)
+    assert cached_run(met_file, gRNA_df, tmp_path, monkeypatch) == 0
\ No newline at end of file
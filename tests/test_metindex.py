@@ -0,0 +1,77 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import metindex
+import metstatusv8
+
+CHROMOSOMES = ['1', '2', 'X']
+
+@pytest.fixture
+def index_files(tmp_path):
+    """A met75 file with integer values, repeated positions and an 'X' that makes the keys text"""
+    rng = np.random.default_rng(3)
+    met_df = pd.DataFrame({
+        'pos': rng.integers(0, 5000, 900),
+        'cov': 3,
+        'val': rng.integers(0, 100, 900),
+        'chrom': rng.choice(CHROMOSOMES, 900)
+    })
+    starts = rng.integers(0, 5000, 300)
+    gRNA_df = pd.DataFrame({
+        'name': [f'g{i}' for i in range(300)], 'a': 'a', 'b': 'b', 'c': 'c',
+        'start': starts, 'end': starts + 80, 'd': 'd',
+        'chrom': rng.choice(CHROMOSOMES + ['7'], 300),
+        'Strand': rng.choice(['+', '-'], 300)
+    })
+    # A range that ends on the record the delta adds at 2500, and just misses it at 2500.5
+    gRNA_df.loc[0, ['start', 'end', 'chrom']] = [2450, 2500, '1']
+    gRNA_file = tmp_path / 'g.csv'
+    gRNA_df.to_csv(gRNA_file, index=False)
+    return met_df, gRNA_file
+
+def run_quietly(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+def apply_delta(met_df, delta_df):
+    """The met75 table the delta describes: set and delete drop the old records, added ones go last"""
+    changed = delta_df[delta_df['op'] != 'add']
+    dropped = pd.MultiIndex.from_arrays([met_df['chrom'].astype(str), met_df['pos'].astype(float)]).isin(
+        pd.MultiIndex.from_arrays([changed['chrom'].astype(str), changed['pos'].astype(float)]))
+    added = delta_df[delta_df['op'] != 'delete'].drop(columns='op')
+    return pd.concat([met_df[~dropped], added], ignore_index=True)
+
+@pytest.mark.parametrize('fractional', [False, True])
+def test_updated_index_matches_rebuilt(index_files, tmp_path, fractional):
+    met_df, gRNA_file = index_files
+    met_file = tmp_path / 'met.csv'
+    met_df.to_csv(met_file, index=False)
+    run_quietly(metindex.build_met_index, met_file)
+    
+    # Only numeric match_vals, so the delta alone types them as numbers that
+    # must be matched to the index's text keys; '7' is a new key
+    existing = met_df[met_df['chrom'] != 'X'].iloc[:6]
+    delta_df = pd.DataFrame({
+        'pos': list(existing['pos']) + [2500.5 if fractional else 2500, 1200, 40],
+        'cov': 3,
+        'val': [11, 12, 13, 14, 15, 16, 17, 18, 19],
+        'chrom': list(existing['chrom'].astype(int)) + [1, 7, 7],
+        'op': ['set', 'set', 'delete', 'delete', 'add', 'add', 'add', 'add', 'add']
+    })
+    delta_file = tmp_path / 'delta.csv'
+    delta_df.to_csv(delta_file, index=False)
+    run_quietly(metindex.update_met_index, met_file, delta_file)
+    run_quietly(metindex.match_csvs_indexed, met_file, gRNA_file, tmp_path / 'updated.csv')
+    
+    rebuilt_file = tmp_path / 'rebuilt_met.csv'
+    apply_delta(met_df, delta_df).to_csv(rebuilt_file, index=False)
+    run_quietly(metindex.match_csvs_indexed, rebuilt_file, gRNA_file, tmp_path / 'rebuilt.csv')
+    result = run_quietly(metstatusv8.match_csvs_sorted, rebuilt_file, gRNA_file, tmp_path / 'sorted.csv')
+    
+    assert (result['has_matches'] == 'y').sum() > 50
+    assert (tmp_path / 'updated.csv').read_bytes() == (tmp_path / 'rebuilt.csv').read_bytes()
+    assert (tmp_path / 'updated.csv').read_bytes() == (tmp_path / 'sorted.csv').read_bytes()
\ No newline at end of file
@@ -0,0 +1,39 @@
+import gzip
+
+import pytest
+
+import tableio
+
+SHORT_ROW_FILES = {
+    'plus_only': '+\n',
+    'blank_lines': '\n""\n\n',
+    'empty': '',
+    'no_final_break': '1,2,3\n+\n4',
+    'wide_header': 'a,b,c,d,e,f\n1,2\n3\n',
+    'wide_rows_later': 'a\n1,5,6,7\n+\n',
+    'crlf': '1,2,3\r\n+\r\n\r\n4,5\r\n',
+    'quoted_breaks': '1,"x,\ny",3\n"a""\nb",5,6\n7\n"8\r\n",9\r\n'
+}
+
+def expected_cells(path, usecols):
+    """The cells read_rows gives at usecols, with '' past the end of a row"""
+    return [tuple(row[i] if i < len(row) else '' for i in usecols) for row in tableio.read_rows(path)]
+
+@pytest.mark.parametrize('chunksize', [1, 2, 1000])
+@pytest.mark.parametrize('name', sorted(SHORT_ROW_FILES))
+def test_column_cells_pad_short_rows(tmp_path, name, chunksize):
+    path = tmp_path / f'{name}.csv'
+    path.write_bytes(SHORT_ROW_FILES[name].encode())
+    cells = [row for columns in tableio.read_column_cells(path, [1, 2], chunksize=chunksize)
+             for row in zip(*columns)]
+    
+    assert cells == expected_cells(path, [1, 2])
+
+def test_column_cells_of_compressed_file(tmp_path):
+    lines = [','.join(str(i * 7 + j) for j in range(i % 5)) for i in range(5000)]
+    path = tmp_path / 'sites.csv.gz'
+    with gzip.open(path, 'wt', newline='') as outfile:
+        outfile.write('\n'.join(lines) + '\n')
+    cells = [row for columns in tableio.read_column_cells(path, [1, 2], chunksize=700) for row in zip(*columns)]
+    
+    assert cells == expected_cells(path, [1, 2])
\ No newline at end of file
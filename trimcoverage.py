@@ -1,17 +1,27 @@
+import numpy as np
 import pandas as pd
-import sys
+import argparse
+import csv
+import itertools
+import os
+from overlap import batched
+from tableio import csv_column_dtypes, read_table, read_table_chunks, table_format, write_table
 
-def filter_csv(input_file, output_file=None):
+# Rows whose cells are parsed together by the streaming filters
+BATCH_ROWS = 10000
+
+def filter_csv(input_file, output_file=None, threshold=10):
     """
-    Filter CSV file by removing rows where the 10th column has values < 10
+    Filter CSV file by removing rows where the 10th column has values < threshold
     
     Args:
         input_file (str): Path to input CSV file
         output_file (str): Path to output CSV file (optional)
+        threshold (float): Minimum value kept in the 10th column (default 10)
     """
     try:
         # Read the CSV file
-        df = pd.read_csv(input_file)
+        df = read_table(input_file)
         
         # Check if CSV has at least 10 columns
         if len(df.columns) < 10:
@@ -27,9 +37,9 @@ def filter_csv(input_file, output_file=None):
         # Convert 10th column to numeric, handling non-numeric values
         df[tenth_column] = pd.to_numeric(df[tenth_column], errors='coerce')
         
-        # Filter out rows where 10th column is less than 10
+        # Filter out rows where 10th column is less than threshold
         # Also removes rows where the value couldn't be converted to numeric (NaN)
-        filtered_df = df[df[tenth_column] >= 10]
+        filtered_df = df[df[tenth_column] >= threshold]
         
         print(f"Filtered dataset: {len(filtered_df)} rows")
         print(f"Removed {len(df) - len(filtered_df)} rows")
@@ -38,7 +48,7 @@ def filter_csv(input_file, output_file=None):
         if output_file is None:
             output_file = input_file.replace('.csv', '_filtered.csv')
         
-        filtered_df.to_csv(output_file, index=False)
+        write_table(filtered_df, output_file)
         print(f"Filtered data saved to: {output_file}")
         
         return filtered_df
@@ -48,17 +58,199 @@ def filter_csv(input_file, output_file=None):
     except Exception as e:
         print(f"Error processing file: {str(e)}")
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python script.py <input_csv_file> [output_csv_file]")
-        print("Example: python script.py data.csv")
-        print("Example: python script.py data.csv filtered_data.csv")
+def at_least(cells, threshold):
+    """
+    Boolean array marking the cells that are numbers >= threshold.
+    
+    Cells are parsed with pd.to_numeric, as filter_csv parses the column, so
+    the streaming filters keep the same rows; float() would also accept cells
+    such as '1_000'. Missing (None) and non-numeric cells fail.
+    """
+    return (pd.to_numeric(pd.Series(cells, dtype=object), errors='coerce') >= threshold).to_numpy()
+
+def coverage_rows(rows, column=10, threshold=10):
+    """
+    Row-streaming form of filter_csv for use in a pipeline.
+    
+    Yields the header row unchanged, then only the rows whose value in the
+    given column (1-based) is numeric and >= threshold.
+    
+    Args:
+        rows: Iterable of CSV rows (lists of strings), header first
+        column (int): Column to test (1-based)
+        threshold (float): Minimum value to keep a row
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
         return
+    if len(header) < column:
+        raise ValueError(f"CSV file only has {len(header)} columns. Need at least {column}.")
+    yield header
+    
+    index = column - 1
+    for batch in batched(rows, BATCH_ROWS):
+        keep = at_least([row[index] if len(row) > index else None for row in batch], threshold)
+        yield from itertools.compress(batch, keep)
+
+def filter_csv_chunked(input_file, output_file=None, threshold=10, chunksize=1000000):
+    """
+    Streaming version of filter_csv: reads the input in chunks, applies the
+    >= threshold predicate to each chunk and appends the surviving rows to the
+    output CSV, so memory use stays constant in the input size.
+    
+    A first pass finds the column types a whole-file read would infer, so
+    every chunk parses and prints as filter_csv would print it, whatever the
+    chunk boundaries; the output matches filter_csv's CSV output.
+    
+    Args:
+        input_file (str): Path to input file (CSV, possibly gzip or BGZF
+            compressed, Parquet, Feather or .npz)
+        output_file (str): Path to output CSV file (optional)
+        threshold (float): Minimum value kept in the 10th column (default 10)
+        chunksize (int): Number of rows per chunk
+    """
+    try:
+        if output_file is None:
+            output_file = input_file.replace('.csv', '_filtered.csv')
+            if not output_file.endswith('.csv'):
+                # Compressed and binary inputs still get a plain CSV next to them
+                root, ext = os.path.splitext(input_file)
+                if ext.lower() in ('.gz', '.bgz'):
+                    root = os.path.splitext(root)[0]
+                output_file = f"{root}_filtered.csv"
+        
+        total_rows = 0
+        kept_rows = 0
+        first_chunk = True
+        
+        dtypes = csv_column_dtypes(input_file, chunksize) if table_format(input_file) == 'csv' else None
+        for chunk in read_table_chunks(input_file, chunksize, dtype=dtypes):
+            if first_chunk and len(chunk.columns) < 10:
+                print(f"Error: CSV file only has {len(chunk.columns)} columns. Need at least 10.")
+                return
+            
+            # Same rule as filter_csv, applied to one chunk at a time, with the
+            # coerced column written back. A text column holds cells that are
+            # not numbers, so over the whole file it coerces to float64 even
+            # where one chunk's cells are all integers
+            tenth_column = chunk.columns[9]
+            coerced = pd.to_numeric(chunk[tenth_column], errors='coerce')
+            if not pd.api.types.is_numeric_dtype(chunk[tenth_column].dtype):
+                coerced = coerced.astype(np.float64)
+            chunk = chunk.assign(**{tenth_column: coerced})
+            filtered_chunk = chunk[chunk[tenth_column] >= threshold]
+            filtered_chunk.to_csv(output_file, mode='w' if first_chunk else 'a',
+                                  header=first_chunk, index=False)
+            
+            total_rows += len(chunk)
+            kept_rows += len(filtered_chunk)
+            first_chunk = False
+        
+        print(f"Original dataset: {total_rows} rows")
+        print(f"Filtered dataset: {kept_rows} rows")
+        print(f"Removed {total_rows - kept_rows} rows")
+        print(f"Filtered data saved to: {output_file}")
+        
+    except FileNotFoundError:
+        print(f"Error: File '{input_file}' not found.")
+    except Exception as e:
+        print(f"Error processing file: {str(e)}")
+
+def read_record(lines):
+    """
+    Return the next raw CSV record from an iterator of lines, joining
+    continuation lines while a quoted field is still open.
+    """
+    record = next(lines, '')
+    while record.count('"') % 2:
+        continuation = next(lines, '')
+        if not continuation:
+            break
+        record += continuation
+    return record
+
+def record_cell(record, index):
+    """
+    Return field `index` of a raw CSV record, or None if the record is shorter.
     
-    input_file = sys.argv[1]
-    output_file = sys.argv[2] if len(sys.argv) > 2 else None
+    Records without quotes are split directly, up to the wanted field only;
+    quoted records go through csv.reader.
+    """
+    if '"' in record:
+        row = next(csv.reader([record]), [])
+    else:
+        row = record.split(',', index + 1)
+    return row[index] if len(row) > index else None
+
+def filter_csv_fast(input_file, output_file=None, threshold=10, column=10):
+    """
+    Fast streaming filter: only the 10th column of each record is parsed to
+    decide whether to keep it, and kept records are copied to the output as
+    their original text. Memory use is constant in the input size.
+    
+    Args:
+        input_file (str): Path to input CSV file
+        output_file (str): Path to output CSV file (optional)
+        threshold (float): Minimum value kept in the 10th column (default 10)
+        column (int): Column to test (1-based, default 10)
+    """
+    try:
+        if output_file is None:
+            output_file = input_file.replace('.csv', '_filtered.csv')
+        
+        index = column - 1
+        total_rows = 0
+        kept_rows = 0
+        
+        with open(input_file, 'r', newline='') as infile:
+            lines = iter(infile)
+            header = read_record(lines)
+            
+            header_columns = len(next(csv.reader([header]), []))
+            if header_columns < column:
+                print(f"Error: CSV file only has {header_columns} columns. Need at least {column}.")
+                return
+            
+            with open(output_file, 'w', newline='') as outfile:
+                outfile.write(header)
+                
+                for records in batched(iter(lambda: read_record(lines), ''), BATCH_ROWS):
+                    keep = at_least([record_cell(record, index) for record in records], threshold)
+                    outfile.writelines(itertools.compress(records, keep))
+                    total_rows += len(records)
+                    kept_rows += int(keep.sum())
+        
+        print(f"Original dataset: {total_rows} rows")
+        print(f"Filtered dataset: {kept_rows} rows")
+        print(f"Removed {total_rows - kept_rows} rows")
+        print(f"Filtered data saved to: {output_file}")
+        
+    except FileNotFoundError:
+        print(f"Error: File '{input_file}' not found.")
+    except Exception as e:
+        print(f"Error processing file: {str(e)}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Remove rows whose 10th column is non-numeric or below a threshold")
+    parser.add_argument('input_file', help="Input CSV file")
+    parser.add_argument('output_file', nargs='?', default=None,
+                        help="Output CSV file (default: <input>_filtered.csv)")
+    parser.add_argument('--threshold', type=float, default=10,
+                        help="Minimum value kept in the 10th column (default: 10)")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="Stream the file in chunks of this many rows")
+    parser.add_argument('--fast', action='store_true',
+                        help="Parse only the 10th column and copy kept rows through as raw text")
+    args = parser.parse_args()
     
-    filter_csv(input_file, output_file)
+    if args.fast:
+        filter_csv_fast(args.input_file, args.output_file, args.threshold)
+    elif args.chunksize:
+        filter_csv_chunked(args.input_file, args.output_file, args.threshold, args.chunksize)
+    else:
+        filter_csv(args.input_file, args.output_file, args.threshold)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file